@@ -0,0 +1,172 @@
+import re
+import threading
+from collections import OrderedDict
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a characters-per-token estimate without tiktoken
+    tiktoken = None
+
+TOKEN_BUDGET = 1500
+TOP_ROWS = 10
+
+# Questions about individual transactions need the rows themselves
+ROW_LEVEL_RE = re.compile(
+    r"\b(transactions?|each|every|list|rows?|descriptions?|merchants?|shops?|stores?|"
+    r"which (expense|purchase|payment)s?|details?|exact|on (the )?\d{1,2}(st|nd|rd|th)?\b)|"
+    r"\d{4}-\d{2}-\d{2}"
+)
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None and tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:  # Encoding files unavailable (e.g. offline): estimate instead
+                _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text):
+    """Prompt tokens of text with tiktoken, or an estimate of ~4 characters per token"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def needs_rows(question):
+    """Whether a question asks about individual transactions rather than totals"""
+    return bool(ROW_LEVEL_RE.search(question.lower()))
+
+
+def frame_tokens(df, sample=200):
+    """Tokens the frame's rows cost as CSV text; large frames are estimated from a sample"""
+    if df.empty:
+        return 0
+    if len(df) <= sample:
+        return count_tokens(df.to_csv(index=False))
+    header = count_tokens(",".join(map(str, df.columns)))
+    rows = count_tokens(df.sample(sample, random_state=0).to_csv(index=False, header=False))
+    return header + rows * len(df) // sample
+
+
+class CompactContext:
+    """Aggregates of an expense frame that fit a token budget, handed to the LLM instead of its rows
+
+    text is the prompt section, frame the per-category aggregates the agent can
+    still query, tokens its prompt cost and full_tokens what the rows would cost.
+    """
+
+    def __init__(self, text, frame, tokens, full_tokens):
+        self.text = text
+        self.frame = frame
+        self.tokens = tokens
+        self.full_tokens = full_tokens
+
+    @property
+    def tokens_saved(self):
+        """Tokens saved over sending the rows; negative when the rows are cheaper"""
+        return self.full_tokens - self.tokens
+
+    @property
+    def pays_off(self):
+        """Whether the aggregates cost fewer tokens than the rows, which small months often do not"""
+        return self.tokens < self.full_tokens
+
+    @classmethod
+    def from_frame(cls, df, budget=TOKEN_BUDGET, top_n=TOP_ROWS):
+        import pandas as pd
+
+        dates = pd.to_datetime(df["date"])
+        amounts = df["amount"].astype("float64")
+        categories = df["category"].astype(str)
+
+        by_category = amounts.groupby(categories).agg(["sum", "count", "mean", "max"]).sort_values("sum", ascending=False)
+        by_category = by_category.round(2).rename_axis("category").reset_index()
+        by_day = amounts.groupby(dates.dt.strftime("%Y-%m-%d")).sum().round(2)
+        top_columns = [column for column in ("date", "description", "category", "amount") if column in df.columns]
+        top = df.loc[amounts.nlargest(top_n).index, top_columns].assign(date=dates.dt.strftime("%Y-%m-%d"))
+
+        sections = [
+            ("Summary", [
+                f"rows: {len(df)}",
+                f"dates: {dates.min():%Y-%m-%d} to {dates.max():%Y-%m-%d}",
+                f"total: {amounts.sum():.2f}",
+                f"mean: {amounts.mean():.2f}, median: {amounts.median():.2f}, max: {amounts.max():.2f}",
+            ]),
+            ("Per category (category,sum,count,mean,max)", by_category.to_csv(index=False, header=False).splitlines()),
+            (f"Top {len(top)} expenses ({','.join(top_columns)})", top.to_csv(index=False, header=False).splitlines()),
+            ("Per day (date,total)", [f"{day},{total}" for day, total in by_day.items()]),
+        ]
+        text = cls._fit(sections, budget)
+        return cls(text, by_category, count_tokens(text), frame_tokens(df))
+
+    @staticmethod
+    def _fit(sections, budget):
+        """Join sections in priority order, cutting lines once the budget is spent"""
+        lines, used = [], 0
+        for title, section in sections:
+            cost = count_tokens(title) + 2
+            if used + cost > budget:
+                break
+            lines.append(f"## {title}")
+            used += cost
+            for i, line in enumerate(section):
+                cost = count_tokens(line) + 1
+                if used + cost > budget:
+                    lines.append(f"... {len(section) - i} more lines omitted")
+                    break
+                lines.append(line)
+                used += cost
+        return "\n".join(lines)
+
+
+class ContextStats:
+    """Prompt tokens sent to the LLM and saved by compact contexts, per mode"""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, mode, tokens_sent, tokens_saved):
+        with self._lock:
+            entry = self._stats.setdefault(mode, {"requests": 0, "tokens_sent": 0, "tokens_saved": 0})
+            entry["requests"] += 1
+            entry["tokens_sent"] += tokens_sent
+            entry["tokens_saved"] += tokens_saved
+
+    def snapshot(self):
+        with self._lock:
+            return {mode: dict(entry) for mode, entry in self._stats.items()}
+
+
+context_stats = ContextStats()
+
+
+class ContextCache:
+    """Compact contexts by dataset fingerprint, so a pooled agent's context is built once"""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint, df, budget=TOKEN_BUDGET):
+        key = (fingerprint, budget)
+        with self._lock:
+            context = self._contexts.get(key)
+            if context is not None:
+                self._contexts.move_to_end(key)
+                return context
+        context = CompactContext.from_frame(df, budget=budget)
+        with self._lock:
+            self._contexts[key] = context
+            while len(self._contexts) > self.max_entries:
+                self._contexts.popitem(last=False)
+        return context
@@ -0,0 +1,105 @@
+import pandas as pd
+
+
+AGG_COLUMNS = ['sum', 'count', 'min', 'max']
+KEY_COLUMNS = ['year', 'month', 'category']
+TOP_COLUMNS = ['date', 'description', 'amount', 'category']
+
+
+def _pick(func, *values):
+    present = [value for value in values if pd.notna(value)]
+    return func(present) if present else None
+
+
+class ExpenseAggregates:
+    """Mergeable per (year, month, category) partial aggregates of expense rows
+
+    Everything the summaries, charts and report need is derived from one small
+    table indexed by (year, month, category) with sum/count/min/max columns,
+    plus the top-N largest rows. Two instances built from disjoint rows can be
+    combined, which is how chunked ingestion folds its partial results.
+    """
+
+    def __init__(self, table=None, top=None, records=0, date_min=None, date_max=None, top_n=10):
+        if table is None:
+            index = pd.MultiIndex.from_arrays([[], [], []], names=KEY_COLUMNS)
+            table = pd.DataFrame({col: pd.Series(dtype='float64') for col in AGG_COLUMNS}, index=index)
+        self.table = table
+        self.top = top if top is not None else pd.DataFrame(columns=TOP_COLUMNS)
+        self.records = records
+        self.date_min = date_min
+        self.date_max = date_max
+        self.top_n = top_n
+
+    @classmethod
+    def from_frame(cls, df, top_n=10):
+        """Aggregate a frame with date, amount, description and category columns"""
+        amounts = df['amount'].astype('float64')
+        keys = [df['date'].dt.year.rename('year'), df['date'].dt.month.rename('month'), df['category']]
+        table = amounts.groupby(keys, dropna=False, observed=True).agg(AGG_COLUMNS)
+        table.index = table.index.set_names(KEY_COLUMNS)
+        top = df.loc[amounts.nlargest(top_n).index, TOP_COLUMNS]
+        return cls(
+            table=table,
+            top=top,
+            records=len(df),
+            date_min=df['date'].min(),
+            date_max=df['date'].max(),
+            top_n=top_n,
+        )
+
+    def combine(self, other):
+        """Return the aggregates of the union of the rows behind self and other"""
+        if not self.records:
+            return other
+        if not other.records:
+            return self
+        stacked = pd.concat([self.table, other.table])
+        grouped = stacked.groupby(level=KEY_COLUMNS, dropna=False, observed=True)
+        table = grouped.agg({'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'})
+        top = pd.concat([self.top, other.top]).nlargest(self.top_n, 'amount')
+        return ExpenseAggregates(
+            table=table,
+            top=top,
+            records=self.records + other.records,
+            date_min=_pick(min, self.date_min, other.date_min),
+            date_max=_pick(max, self.date_max, other.date_max),
+            top_n=self.top_n,
+        )
+
+    @property
+    def total(self):
+        return float(self.table['sum'].sum())
+
+    def category_summary(self):
+        """Same shape as ExpenseTracker.get_category_summary: category, sum, mean, count"""
+        grouped = self.table.groupby(level='category', observed=True).agg({'sum': 'sum', 'count': 'sum'})
+        summary = grouped.reset_index()
+        summary['mean'] = summary['sum'] / summary['count']
+        summary['count'] = summary['count'].astype('int64')
+        summary = summary[['category', 'sum', 'mean', 'count']]
+        return summary.sort_values('sum', ascending=False)
+
+    def category_stats(self):
+        """Per-category sum, count, mean, min and max"""
+        summary = self.table.groupby(level='category', observed=True).agg(
+            {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+        )
+        summary['mean'] = summary['sum'] / summary['count']
+        return summary
+
+    def monthly_summary(self):
+        """Same shape as ExpenseTracker.get_monthly_summary: year, month, category, amount"""
+        summary = self.table['sum'].rename('amount').reset_index()
+        summary = summary.dropna(subset=['year', 'month'])
+        summary['year'] = summary['year'].astype('int64')
+        summary['month'] = summary['month'].astype('int64')
+        return summary.sort_values(KEY_COLUMNS).reset_index(drop=True)
+
+    def monthly_totals(self):
+        """Total amount per (year, month), in chronological order"""
+        monthly = self.monthly_summary()
+        return monthly.groupby(['year', 'month'])['amount'].sum().reset_index()
+
+    def top_expenses(self, n=10):
+        return self.top.sort_values('amount', ascending=False).head(n)
@@ -0,0 +1,168 @@
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from intents import MONTHS, named_months
+
+# Words that never change what a question asks for
+STOPWORDS = {
+    "a", "an", "the", "my", "me", "i", "is", "are", "was", "were", "do", "did", "does", "can", "could",
+    "please", "tell", "show", "give", "what", "whats", "of", "in", "for", "to", "on", "and", "you", "your",
+    "this", "that", "it", "be", "about", "some", "any", "so", "far",
+}
+
+
+def tokenize(question):
+    """Lowercased word tokens of a question, punctuation removed"""
+    return re.findall(r"[a-z0-9]+", question.lower())
+
+
+def key_terms(tokens, keywords=()):
+    """Tokens two questions must share to get the same answer: numbers, months and keywords
+
+    Months are found by the chat router's own matcher and reduced to their
+    abbreviation, so "march" and "mar" agree and "market" is not a month.
+    """
+    keywords = {str(keyword).lower() for keyword in keywords}
+    months = [MONTHS[month - 1] for month in named_months(" ".join(tokens))]
+    return frozenset([token for token in tokens if token.isdigit() or token in keywords] + months)
+
+
+def terms(tokens):
+    """Unigram and bigram counts of the non-stopword tokens"""
+    words = [token for token in tokens if token not in STOPWORDS]
+    return Counter(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+
+class AnswerCache:
+    """Assistant answers keyed by scope and question, with near-duplicate lookup
+
+    A scope is (user_id, data fingerprint, month): answers are only reused for
+    the exact data they were given for. Within a scope a question is first
+    looked up by its normalized text, then by TF-IDF cosine similarity against
+    the cached questions. Near matches must mention the same numbers, months
+    and keywords (e.g. category names), so "spent on food" never answers
+    "spent on rent".
+    """
+
+    def __init__(self, max_entries=2048, threshold=0.9):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._scopes = OrderedDict()  # scope -> {normalized question: (answer, terms, key terms)}
+        self._warmed = set()
+        self._document_frequency = Counter()
+        self._entries = 0
+        self._lock = threading.Lock()
+
+    def scoped(self, scope, keywords=()):
+        """View of one scope with lookup(question) / store(question, answer)"""
+        return ScopedAnswers(self, scope, keywords)
+
+    def is_warm(self, scope):
+        return scope in self._warmed
+
+    def warm(self, scope, pairs, keywords=()):
+        """Seed a scope from earlier (question, answer) pairs, e.g. the chat history"""
+        for question, answer in pairs:
+            self.store(scope, question, answer, keywords)
+        with self._lock:
+            self._warmed.add(scope)
+
+    def lookup(self, scope, question, keywords=()):
+        """Cached answer for question in scope, or None"""
+        tokens = tokenize(question)
+        normalized = " ".join(tokens)
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if not entries:
+                return None
+            self._scopes.move_to_end(scope)
+            if normalized in entries:
+                return entries[normalized][0]
+
+            wanted_keys = key_terms(tokens, keywords)
+            vector = self._weights(terms(tokens))
+            best, best_score = None, self.threshold
+            for answer, entry_terms, entry_keys in entries.values():
+                if entry_keys != wanted_keys:
+                    continue
+                score = self._cosine(vector, self._weights(entry_terms))
+                if score >= best_score:
+                    best, best_score = answer, score
+            return best
+
+    def store(self, scope, question, answer, keywords=()):
+        tokens = tokenize(question)
+        normalized = " ".join(tokens)
+        with self._lock:
+            entries = self._scopes.setdefault(scope, {})
+            self._scopes.move_to_end(scope)
+            if normalized not in entries:
+                entry_terms = terms(tokens)
+                self._document_frequency.update(entry_terms.keys())
+                self._entries += 1
+            else:
+                entry_terms = entries[normalized][1]
+            entries[normalized] = (answer, entry_terms, key_terms(tokens, keywords))
+            self._evict()
+
+    def invalidate(self, user_id, month=None):
+        """Drop a user's answers, for one "YYYY-MM" month or for all of them"""
+        with self._lock:
+            for scope in [scope for scope in self._scopes if scope[0] == user_id]:
+                if month is None or scope[2] == month:
+                    self._drop(scope)
+            self._warmed = {
+                scope for scope in self._warmed
+                if scope[0] != user_id or (month is not None and scope[2] != month)
+            }
+
+    def _weights(self, counts):
+        documents = max(self._entries, 1)
+        return {
+            term: count * (1.0 + math.log((1 + documents) / (1 + self._document_frequency[term])))
+            for term, count in counts.items()
+        }
+
+    @staticmethod
+    def _cosine(a, b):
+        dot = sum(weight * b.get(term, 0.0) for term, weight in a.items())
+        if not dot:
+            return 0.0
+        norm = math.sqrt(sum(w * w for w in a.values())) * math.sqrt(sum(w * w for w in b.values()))
+        return dot / norm
+
+    def _drop(self, scope):
+        for _, entry_terms, _ in self._scopes.pop(scope).values():
+            self._document_frequency.subtract(entry_terms.keys())
+            self._entries -= 1
+        self._document_frequency += Counter()  # Drops terms whose count reached zero
+        self._warmed.discard(scope)
+
+    def _evict(self):
+        while self._entries > self.max_entries:
+            if len(self._scopes) > 1:
+                self._drop(next(iter(self._scopes)))
+                continue
+            # One scope left: drop its oldest questions instead
+            entries = next(iter(self._scopes.values()))
+            _, entry_terms, _ = entries.pop(next(iter(entries)))
+            self._document_frequency.subtract(entry_terms.keys())
+            self._document_frequency += Counter()
+            self._entries -= 1
+
+
+class ScopedAnswers:
+    """An AnswerCache bound to one scope and its keywords"""
+
+    def __init__(self, cache, scope, keywords=()):
+        self.cache = cache
+        self.scope = scope
+        self.keywords = tuple(keywords)
+
+    def lookup(self, question):
+        return self.cache.lookup(self.scope, question, self.keywords)
+
+    def store(self, question, answer):
+        self.cache.store(self.scope, question, answer, self.keywords)
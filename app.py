@@ -1,39 +1,65 @@
-from expense_tracker import ExpenseTracker
+from upload_cache import UploadCache
+from charts import ChartCache, CHART_TYPES, data_digest
 import os
-from flask import Flask,render_template,request,redirect,url_for,session,flash,request
+import json
+import secrets
+import shutil
+import zipfile
+import click
+from flask import Flask,render_template,request,redirect,url_for,session,flash,request,jsonify,Response,stream_with_context
 from werkzeug.utils import secure_filename
-import matplotlib
 from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, login_user, login_required, logout_user, current_user
-from models import db, User, ChatHistory, Expense
-from assistant import get_agent, ask_question
-import pandas as pd
+from flask_login import login_user, login_required, logout_user, current_user
+from models import db, User, ChatHistory, Expense, ExpenseRollup, UploadResult, UploadJob
+from factory import create_app
+from assistant import AgentPool, ask_question, local_answer, dataset_fingerprint, ERROR_PREFIX
+from chat_stream import AnswerStreamer, sse
+from agent_context import ContextCache, context_stats, frame_tokens, needs_rows
+from answer_cache import AnswerCache
+from dashboard_cache import DashboardCache
+from intents import intent_stats
 from dotenv import load_dotenv
 # Top of app.py
-from datetime import datetime
-from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import false, func
+from sqlalchemy.exc import OperationalError
+from search import search_chats, search_expenses
 
-matplotlib.use("Agg")  # Use non-interactive backend
+# pandas, matplotlib, the upload pipeline and LangChain are imported inside the
+# functions that use them, so starting a worker and serving login pages stay fast
 
-app = Flask(__name__)
-app.secret_key = "s3cr3t"  # Change this to a random secret key
-app.config["UPLOAD_FOLDER"] = "uploads"
-app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max upload
-app.config["ALLOWED_EXTENSIONS"] = {"csv"}
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///users.db"
+app = create_app()
 
-db.init_app(app)
+# Parsed, categorized copies of uploads, keyed by file content and category rules
+upload_cache = UploadCache(
+    app.config["UPLOAD_CACHE_FOLDER"],
+    max_bytes=app.config["UPLOAD_CACHE_MAX_BYTES"],
+    max_age=app.config["UPLOAD_CACHE_MAX_AGE"],
+)
 
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = "login"
+# Rendered chart PNGs, keyed by user, chart type and the data drawn
+chart_cache = ChartCache(max_entries=app.config["CHART_CACHE_ENTRIES"])
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+# Dashboard summaries per user, source, scope and month; patched or dropped on every write
+dashboard_cache = DashboardCache(
+    max_entries=app.config["DASHBOARD_CACHE_ENTRIES"],
+    directory=app.config["DASHBOARD_CACHE_FOLDER"],
+)
 
-# Create upload folder if it doesn't exist
-os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+# Built chat agents, reused across questions about the same data
+agent_pool = AgentPool(max_agents=app.config["AGENT_POOL_SIZE"], ttl=app.config["AGENT_POOL_TTL"])
+
+# Compact agent contexts per dataset fingerprint
+context_cache = ContextCache()
+
+# Assistant answers per user, data fingerprint and month; dropped when that data changes
+answer_cache = AnswerCache(max_entries=app.config["ANSWER_CACHE_ENTRIES"])
+
+# LLM answers streamed to the chat page, on a bounded pool of threads
+answer_streamer = AnswerStreamer(
+    max_concurrent=app.config["CHAT_STREAM_CONCURRENCY"],
+    timeout=app.config["CHAT_STREAM_TIMEOUT"],
+)
 
 
 def allowed_file(filename):
@@ -43,6 +69,160 @@ def allowed_file(filename):
     )
 
 
+def save_uploads(files, custom_categories):
+    """Save uploaded CSVs, and the CSVs inside uploaded zip archives, as [(source name, path)]
+
+    Each upload gets its own folder, so files of the same name from different
+    accounts do not overwrite each other. The folder's sources.json lists
+    them with the upload's custom category rules, so the session only has to
+    remember the folder and a reparse categorizes the same way.
+    """
+    folder = os.path.join(app.config["UPLOAD_FOLDER"], secrets.token_hex(8))
+    os.makedirs(folder)
+    sources = []
+    for index, file in enumerate(files):
+        filename = secure_filename(file.filename) or f"upload-{index}.csv"
+        filepath = os.path.join(folder, f"{index}-{filename}")
+        file.save(filepath)
+        if filename.rsplit(".", 1)[-1].lower() == "zip":
+            sources.extend(extract_csvs(filepath, filename, folder))
+            os.remove(filepath)
+        else:
+            sources.append((filename, filepath))
+    manifest = {
+        "sources": [(name, os.path.basename(path)) for name, path in sources],
+        "custom_categories": custom_categories,
+    }
+    with open(os.path.join(folder, "sources.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    return sources
+
+
+def upload_manifest(folder):
+    """([(source name, path)], custom category rules) of an upload saved by save_uploads"""
+    try:
+        with open(os.path.join(folder, "sources.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return [], {}
+    sources = [(name, os.path.join(folder, filename)) for name, filename in manifest["sources"]]
+    return sources, manifest["custom_categories"]
+
+
+def extract_csvs(archive_path, archive_name, folder):
+    """Extract the CSV members of a zip archive into folder, as [(source name, path)]
+
+    Member paths are flattened, and at most MAX_CONTENT_LENGTH bytes are
+    extracted in total, so a small archive cannot fill the disk.
+    """
+    budget = app.config["MAX_CONTENT_LENGTH"]
+    sources = []
+    with zipfile.ZipFile(archive_path) as archive:
+        for index, member in enumerate(archive.infolist()):
+            name = os.path.basename(member.filename)
+            if member.is_dir() or name.startswith(".") or member.filename.startswith("__MACOSX/"):
+                continue
+            if not name.lower().endswith(".csv"):
+                continue
+            budget -= member.file_size
+            if budget < 0:
+                raise ValueError("it expands beyond the upload size limit")
+            filepath = os.path.join(folder, f"{archive_name}-{index}-{secure_filename(name) or 'file.csv'}")
+            with archive.open(member) as src, open(filepath, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            sources.append((f"{archive_name}/{member.filename}", filepath))
+    return sources
+
+
+def load_uploaded_frame(columns=None):
+    """Return the categorized frame of the current upload, from the cache when possible"""
+    df = upload_cache.load(session.get("upload_key"), columns)
+    if df is not None:
+        return df
+
+    # Cache miss (evicted, or uploaded before caching existed): parse it once more, with the upload's rules
+    folder = session.get("upload_folder")
+    sources, custom_categories = upload_manifest(folder) if folder else ([], {})
+    sources = [(name, path) for name, path in sources if os.path.exists(path)]
+    if len(sources) > 1:
+        from jobs import parse_source, merge_sources, upload_settings
+
+        settings = upload_settings(app)
+        parsed = [parse_source(name, path, custom_categories, settings) for name, path in sources]
+        parsed = [entry for entry in parsed if not entry["error"]]
+        if not parsed:
+            return None
+        session["upload_key"], _ = merge_sources(parsed, custom_categories, settings)
+        return upload_cache.load(session["upload_key"], columns)
+
+    filepath = session.get("filepath")
+    if not filepath or not os.path.exists(filepath):
+        return None
+    from jobs import _new_tracker, _resolve_schema, upload_settings
+
+    # The cached schema, so dates that fit both day- and month-first read as they did at upload
+    schema, _ = _resolve_schema(filepath, upload_settings(app))
+    tracker = _new_tracker(custom_categories)
+    if schema is None or not tracker.load_data(filepath, schema=schema):
+        return None
+    tracker.categorize_expenses()
+    cache_key = upload_cache.key_for(filepath, tracker.categories)
+    upload_cache.store(cache_key, tracker.df)
+    session["upload_key"] = cache_key
+    return tracker.df[columns] if columns else tracker.df
+
+
+def adopt_upload_job(job):
+    """Hand a finished upload job's results over to the session"""
+    if job.status == "done":
+        session["result_id"] = job.result_id
+        session["upload_key"] = job.upload_key
+    if job.finished:
+        session.pop("job_id", None)
+
+
+def pending_upload_job():
+    """The session's upload job while it is still queued or running, else None"""
+    job_id = session.get("job_id")
+    job = db.session.get(UploadJob, job_id) if job_id else None
+    if job is None:
+        session.pop("job_id", None)
+        return None
+    if job.finished:
+        if job.status == "failed":
+            flash(job.message, "error")
+        adopt_upload_job(job)
+        return None
+    return job
+
+
+def upload_month_totals():
+    """(year, month) -> {category: total} over the whole current upload, from its stored summaries"""
+    results = UploadResult.load(session.get("result_id"), ttl=app.config["UPLOAD_RESULT_TTL"])
+    if results is None:
+        return None
+    totals = {}
+    for row in results["monthly_summary"]:
+        month_totals = totals.setdefault((row["year"], row["month"]), {})
+        month_totals[row["category"]] = month_totals.get(row["category"], 0.0) + row["amount"]
+    return lambda year, month: totals.get((year, month), {})
+
+
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Recompute the monthly expense rollups from the expense table."""
+    ExpenseRollup.rebuild()
+    print("✅ Expense rollups rebuilt.")
+
+
+@app.cli.command("archive-chats")
+@click.option("--days", default=180, show_default=True, help="Archive chat entries older than this many days.")
+def archive_chats_command(days):
+    """Move old chat history entries to the chat_history_archive table."""
+    moved = ChatHistory.archive(datetime.now() - timedelta(days=days))
+    print(f"✅ Archived {moved} chat entries older than {days} days.")
+
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -98,30 +278,17 @@ def upload_file():
         flash("No file part", "error")
         return redirect(request.url)
 
-    file = request.files["file"]
+    files = [file for file in request.files.getlist("file") if file.filename]
 
-    if file.filename == "":
+    if not files:
         flash("No file selected", "error")
         return redirect(request.url)
 
-    if file and allowed_file(file.filename):
-        # Save file temporarily
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        file.save(filepath)
-
-        # Process the file
-        tracker = ExpenseTracker()
-        success = tracker.load_data(filepath)
-
-        if not success:
-            flash("Error loading data. Please check your CSV format.", "error")
-            return redirect(url_for("index"))
-
-        # Add custom categories if provided
+    if all(allowed_file(file.filename) for file in files):
+        # Parse custom categories here, so format errors are reported right away
+        custom_categories = {}
         if request.form.get("custom_categories"):
             try:
-                custom_categories = {}
                 categories_text = request.form.get("custom_categories")
                 for line in categories_text.split("\n"):
                     if ":" in line:
@@ -129,50 +296,20 @@ def upload_file():
                         custom_categories[category.strip()] = [
                             k.strip() for k in keywords.split(",")
                         ]
-
-                if custom_categories:
-                    tracker.add_custom_category_rules(custom_categories)
             except Exception as e:
+                custom_categories = {}
                 flash(
                     f"Error processing custom categories: {str(e)}", "warning")
 
-        # Categorize expenses
-        tracker.categorize_expenses()
-
-        # Store the required data in session
-        session["has_data"] = True
-        session["filepath"] = filepath
-
-        # Generate charts and get data
-        category_summary = tracker.get_category_summary()
-        monthly_summary = tracker.get_monthly_summary()
-        unusual_expenses = tracker.identify_unusual_expenses()
-
-        # Convert DataFrames to lists for JSON serialization
-        session["category_summary"] = (
-            category_summary.to_dict(
-                "records") if category_summary is not None else []
-        )
-        session["monthly_summary"] = (
-            monthly_summary.to_dict(
-                "records") if monthly_summary is not None else []
-        )
-        session["unusual_expenses"] = (
-            unusual_expenses.to_dict(
-                "records") if unusual_expenses is not None else []
-        )
-
-        # Generate and save charts
+        # Save the files (and the CSVs inside zip archives) temporarily, with the rules for reparsing them
         try:
-            # Category chart
-            tracker.plot_expenses_by_category()
-            # Monthly trend chart
-            tracker.plot_monthly_trend()
-
-            session["charts_generated"] = True
-        except Exception as e:
-            flash(f"Error generating charts: {str(e)}", "warning")
-            session["charts_generated"] = False
+            sources = save_uploads(files, custom_categories)
+        except (zipfile.BadZipFile, ValueError) as e:
+            flash(f"Could not read the uploaded archive: {e}", "error")
+            return redirect(url_for("index"))
+        if not sources:
+            flash("The uploaded archive holds no CSV files.", "error")
+            return redirect(url_for("index"))
 
         # User's budget (simple implementation)
         if request.form.get("budget"):
@@ -181,112 +318,326 @@ def upload_file():
             except ValueError:
                 flash("Invalid budget value. Using no budget comparison.", "warning")
 
+        # Forget the previous upload; the job fills these in when it finishes
+        UploadResult.discard(session.pop("result_id", None))
+        session.pop("upload_key", None)
+
+        # ⚙️ Parsing, categorizing and summarizing run in worker processes, one per file
+        from jobs import submit_upload
+
+        user_id = current_user.id if current_user.is_authenticated else None
+        job = UploadJob.create(user_id=user_id)
+        submit_upload(app, job.id, sources, custom_categories, user_id=user_id)
+
+        session["has_data"] = True
+        session["filepath"] = sources[0][1]
+        session["upload_folder"] = os.path.dirname(sources[0][1])
+        session["job_id"] = job.id
+
         return redirect(url_for("dashboard"))
 
-    flash("Invalid file format. Please upload a CSV file.", "error")
+    flash("Invalid file format. Please upload CSV files or zip archives of them.", "error")
     return redirect(url_for("index"))
 
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    """Progress of a background upload job, polled by the dashboard"""
+    job = db.session.get(UploadJob, job_id)
+    owned = current_user.is_authenticated and job is not None and job.user_id == current_user.id
+    if job is None or not (job_id == session.get("job_id") or owned):
+        return jsonify({"error": "Unknown job"}), 404
+
+    if job_id == session.get("job_id"):
+        adopt_upload_job(job)
+    return jsonify(job.to_dict())
+
+@app.route("/upload-results")
+def upload_results():
+    """Summaries of the current upload, fetched lazily by the dashboard"""
+    results = UploadResult.load(session.get("result_id"), ttl=app.config["UPLOAD_RESULT_TTL"])
+    if results is None:
+        return jsonify({"error": "No upload results available"}), 404
+    part = request.args.get("part")
+    if part:
+        if part not in results:
+            return jsonify({"error": f"Unknown part '{part}'"}), 404
+        return jsonify({part: results[part]})
+    return jsonify(results)
+
 @app.route("/upload-from-add-expense", methods=["POST"])
 @login_required
 def upload_from_add_expense():
     return upload_file()
 
 
-@app.route("/dashboard")
-@login_required
-def dashboard():
-    view_type = request.args.get("view", "monthly")
-    data_scope = request.args.get("scope", "present")
-    source = request.args.get("source", "manual")
+def month_bounds(now):
+    """Return the first day of now's month and of the following month"""
+    start = now.date().replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
 
-    is_returning = bool(session.get("filepath") or Expense.query.filter_by(user_id=current_user.id).first())
 
-    uploaded_data = []
-    if source == "csv" and session.get("filepath") and os.path.exists(session["filepath"]):
-        try:
-            df = pd.read_csv(session["filepath"])
-            for _, row in df.iterrows():
-                uploaded_data.append({
-                    "category": str(row.get("category", "unknown")).strip().lower(),
-                    "amount": float(row.get("amount", 0)),
-                    "date": row.get("date", datetime.now().strftime("%Y-%m-%d"))
-                })
-        except Exception as e:
-            flash(f"Error loading uploaded data: {e}", "danger")
+def scope_condition(year_month_column, data_scope, current_month):
+    """SQL condition for the dashboard scope: this month ("present") or every other month ("past")"""
+    if data_scope == "present":
+        return year_month_column == current_month
+    if data_scope == "past":
+        return year_month_column != current_month
+    return false()
 
-    manual_data = [
-        {
-            "category": exp.category,
-            "amount": exp.amount,
-            "date": exp.date.strftime("%Y-%m-%d")
-        }
-        for exp in Expense.query.filter_by(user_id=current_user.id).all()
-    ]
 
-    all_expenses = uploaded_data if (source == "csv" and uploaded_data) else manual_data
+def sql_expense_summaries(user_id, data_scope, current_month):
+    """Per-category and per-month sums of a user's expenses, read from the rollup table
 
-    now = datetime.now()
-    current_month = now.strftime("%Y-%m")
+    Returns (category_summary, history_summary, monthly_summary):
+    {category: {"sum", "count"}} for the scope, {category: sum} over all time
+    and {"YYYY-MM": sum} for the scope in chronological order. Every query
+    touches O(categories x months) ExpenseRollup rows, never raw expenses.
+    """
+    in_scope = scope_condition(ExpenseRollup.year_month, data_scope, current_month)
+    rollups = db.session.query(ExpenseRollup).filter(ExpenseRollup.user_id == user_id)
+
+    category_rows = (
+        rollups.filter(in_scope)
+        .with_entities(ExpenseRollup.category, func.sum(ExpenseRollup.total), func.sum(ExpenseRollup.count))
+        .group_by(ExpenseRollup.category)
+        .all()
+    )
+    history_rows = (
+        rollups.with_entities(ExpenseRollup.category, func.sum(ExpenseRollup.total))
+        .group_by(ExpenseRollup.category)
+        .all()
+    )
+    monthly_rows = (
+        rollups.filter(in_scope)
+        .with_entities(ExpenseRollup.year_month, func.sum(ExpenseRollup.total))
+        .group_by(ExpenseRollup.year_month)
+        .order_by(ExpenseRollup.year_month)
+        .all()
+    )
+
+    category_summary = {cat: {"sum": total or 0.0, "count": count} for cat, total, count in category_rows}
+    history_summary = {cat: total or 0.0 for cat, total in history_rows}
+    monthly_summary = {year_month: total or 0.0 for year_month, total in monthly_rows}
+    return category_summary, history_summary, monthly_summary
+
+
+def frame_expense_summaries(df, data_scope, month_start, month_end, now):
+    """Same summaries as sql_expense_summaries for an uploaded frame, grouped with pandas"""
+    import pandas as pd
+
+    dates = df["date"].fillna(pd.Timestamp(now))
+    category = df["category"].astype(str).str.strip().str.lower()
+    amount = df["amount"].fillna(0).astype(float)
+
+    in_month = (dates >= pd.Timestamp(month_start)) & (dates < pd.Timestamp(month_end))
+    if data_scope == "present":
+        in_scope = in_month
+    elif data_scope == "past":
+        in_scope = ~in_month
+    else:
+        in_scope = pd.Series(False, index=df.index)
+
+    scoped = amount[in_scope].groupby(category[in_scope]).agg(["sum", "count"])
+    history = amount.groupby(category).sum()
+    monthly = amount[in_scope].groupby(dates[in_scope].dt.strftime("%Y-%m")).sum().sort_index()
+
+    category_summary = {cat: {"sum": float(row["sum"]), "count": int(row["count"])} for cat, row in scoped.iterrows()}
+    history_summary = {cat: float(total) for cat, total in history.items()}
+    monthly_summary = {month: float(total) for month, total in monthly.items()}
+    return category_summary, history_summary, monthly_summary
+
+
+def chart_data(source, chart_type):
+    """{label: total} behind a chart: the current upload's results, or the user's rollups"""
+    if source == "csv":
+        results = UploadResult.load(session.get("result_id"), ttl=app.config["UPLOAD_RESULT_TTL"])
+        if results is None:
+            return None
+        return results.get("category_totals" if chart_type == "category" else "monthly_totals")
+
+    label = ExpenseRollup.category if chart_type == "category" else ExpenseRollup.year_month
+    rows = (
+        ExpenseRollup.query.filter_by(user_id=current_user.id)
+        .with_entities(label, func.sum(ExpenseRollup.total))
+        .group_by(label)
+        .order_by(label)
+        .all()
+    )
+    return {key: total or 0.0 for key, total in rows}
+
+
+@app.route("/charts/<chart_type>.png")
+@login_required
+def chart_image(chart_type):
+    """Rendered chart for the current user, cached and served with an ETag"""
+    if chart_type not in CHART_TYPES:
+        return jsonify({"error": f"Unknown chart '{chart_type}'"}), 404
+    source = request.args.get("source", "manual")
+    data = chart_data(source, chart_type)
+    if data is None:
+        return jsonify({"error": "No chart data available"}), 404
 
-    current_expenses = []
-    historical_expenses = []
+    etag, png = chart_cache.get(f"{current_user.id}-{source}", chart_type, data)
+    response = app.response_class(png, mimetype="image/png")
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = app.config["CHART_MAX_AGE"]
+    return response.make_conditional(request)
 
-    for item in all_expenses:
+
+@app.route("/import-upload", methods=["POST"])
+@login_required
+def import_upload():
+    """Import the current uploaded CSV into the user's saved expenses"""
+    from expense_import import import_expenses
+
+    columns = ["date", "amount", "description", "category"]
+    frames = upload_cache.open_frames(session.get("upload_key"), columns)
+    if frames is None:
+        df = load_uploaded_frame(columns)
+        frames = [df] if df is not None else []
+
+    try:
+        inserted, skipped = import_expenses(current_user.id, frames)
+        if inserted:
+            answer_cache.invalidate(current_user.id)
+            dashboard_cache.invalidate(current_user.id, "manual")
+    except Exception as e:
+        flash(f"Error importing uploaded data: {e}", "danger")
+        return redirect(url_for("dashboard", source="csv"))
+
+    if inserted or skipped:
+        flash(f"Imported {inserted} expenses ({skipped} duplicates or invalid rows skipped).", "success")
+    else:
+        flash("No uploaded data to import. Please upload a CSV first.", "warning")
+    return redirect(url_for("dashboard"))
+
+
+def expense_summaries(source, data_scope):
+    """(category, history, monthly) summaries for a dashboard source and scope, plus an error message
+
+    CSV summaries come from the current upload once its job has finished;
+    otherwise, or when the upload cannot be read, the user's saved expenses are used.
+    Both are memoized in dashboard_cache until the data behind them changes.
+    """
+    now = datetime.now()
+    month = now.strftime("%Y-%m")
+    # Any other scope selects nothing, so they all share one entry
+    scope_key = data_scope if data_scope in ("present", "past") else "none"
+    generation = dashboard_cache.generation(current_user.id)
+    error = None
+    if source == "csv" and session.get("filepath") and not session.get("job_id"):
+        upload_key = session.get("upload_key")
+        summaries = dashboard_cache.get((current_user.id, "csv", scope_key, month, upload_key)) if upload_key else None
+        if summaries is not None:
+            return summaries, None
         try:
-            date_obj = datetime.strptime(item.get("date", current_month), "%Y-%m-%d")
-        except:
-            date_obj = now
-
-        y_m = date_obj.strftime("%Y-%m")
-        category = item.get("category", "other").lower()
-        amount = float(item.get("amount", 0))
-
-        if data_scope == "present" and y_m == current_month:
-            current_expenses.append((category, amount))
-        elif data_scope == "past" and y_m != current_month:
-            current_expenses.append((category, amount))  # 💡 Here we treat "past" as current scope
-        historical_expenses.append((category, amount))  # 🔁 Always build historical from everything
-
-    # 🔹 Scope-based current summary
-    category_summary = {}
-    total_expenses = 0
-    for cat, amt in current_expenses:
-        total_expenses += amt
-        if cat not in category_summary:
-            category_summary[cat] = {"sum": 0, "count": 0}
-        category_summary[cat]["sum"] += amt
-        category_summary[cat]["count"] += 1
-
-    # 🔹 Historical includes everything
-    history_summary = {}
-    for cat, amt in historical_expenses:
-        if cat not in history_summary:
-            history_summary[cat] = 0
-        history_summary[cat] += amt
+            df = load_uploaded_frame(["date", "amount", "category"])
+            if df is not None and not df.empty:
+                month_start, month_end = month_bounds(now)
+                summaries = frame_expense_summaries(df, data_scope, month_start, month_end, now)
+                # load_uploaded_frame sets the key when it had to parse the file again
+                csv_key = (current_user.id, "csv", scope_key, month, session.get("upload_key"))
+                dashboard_cache.put(csv_key, summaries, generation)
+                return summaries, None
+        except Exception as e:
+            error = f"Error loading uploaded data: {e}"
 
-    # 🔸 Budget
+    key = (current_user.id, "manual", scope_key, month, None)
+    summaries = dashboard_cache.get(key)
+    if summaries is None:
+        summaries = sql_expense_summaries(current_user.id, data_scope, month)
+        dashboard_cache.put(key, summaries, generation)
+    return summaries, error
+
+
+def budget_summary(total_expenses):
+    """Budget, total, remaining and usage percentage, or None without a budget"""
     budget = session.get("budget", 0)
-    budget_status = {
+    return {
         "budget": budget,
         "total": total_expenses,
         "remaining": budget - total_expenses,
         "percentage": (total_expenses / budget) * 100 if budget else 0
     } if budget else None
 
-    # 🔸 Trend (simplified - only current scope)
-    monthly_summary = defaultdict(float)
-    for cat, amt in current_expenses:
-        monthly_summary[current_month] += amt
 
-    trend_data = {
-        "labels": list(monthly_summary.keys()),
-        "values": list(monthly_summary.values())
-    }
+def chart_series(summary):
+    """{label: value} as the labels/values pair Chart.js takes"""
+    return {"labels": list(summary.keys()), "values": list(summary.values())}
 
-    pie_data = {
-        "labels": list(category_summary.keys()),
-        "values": [c["sum"] for c in category_summary.values()]
-    }
+
+def api_response(payload):
+    """JSON response with an ETag over its content, revalidated on every use"""
+    response = jsonify(payload)
+    response.set_etag(data_digest(payload))
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route("/api/summary")
+@login_required
+def api_summary():
+    """Totals and budget status for the dashboard's source and scope"""
+    source = request.args.get("source", "manual")
+    data_scope = request.args.get("scope", "present")
+    (category_summary, history_summary, _), _ = expense_summaries(source, data_scope)
+    total_expenses = sum(c["sum"] for c in category_summary.values())
+    return api_response({
+        "source": source,
+        "scope": data_scope,
+        "total": total_expenses,
+        "count": sum(c["count"] for c in category_summary.values()),
+        "history_total": sum(history_summary.values()),
+        "budget": budget_summary(total_expenses),
+    })
+
+
+@app.route("/api/categories")
+@login_required
+def api_categories():
+    """Per-category totals in scope and over all time"""
+    source = request.args.get("source", "manual")
+    data_scope = request.args.get("scope", "present")
+    (category_summary, history_summary, _), _ = expense_summaries(source, data_scope)
+    return api_response({
+        "current": chart_series({cat: c["sum"] for cat, c in category_summary.items()}),
+        "history": chart_series(history_summary),
+    })
+
+
+@app.route("/api/trend")
+@login_required
+def api_trend():
+    """Monthly totals in scope, in chronological order"""
+    source = request.args.get("source", "manual")
+    data_scope = request.args.get("scope", "present")
+    (_, _, monthly_summary), _ = expense_summaries(source, data_scope)
+    return api_response(chart_series(monthly_summary))
+
+
+@app.route("/dashboard")
+@login_required
+def dashboard():
+    view_type = request.args.get("view", "monthly")
+    data_scope = request.args.get("scope", "present")
+    source = request.args.get("source", "manual")
+
+    is_returning = bool(session.get("filepath") or Expense.for_user(current_user.id).first())
+
+    upload_job = pending_upload_job()
+
+    # 🔹 Scope-based current summary and historical summary over everything, for the tables;
+    # the charts fetch the same aggregates from the JSON API
+    (category_summary, history_summary, _), error = expense_summaries(source, data_scope)
+    if error:
+        flash(error, "danger")
+    total_expenses = sum(c["sum"] for c in category_summary.values())
+
+    # 🔸 Budget
+    budget_status = budget_summary(total_expenses)
 
     category_table = [
         {
@@ -307,32 +658,26 @@ def dashboard():
         for cat, amt in history_summary.items()
     ]
 
-    history_pie = {
-        "labels": list(history_summary.keys()),
-        "values": list(history_summary.values())
-    }
-
     return render_template(
         "dashboard.html",
         is_returning=is_returning,
         budget_status=budget_status,
-        trend_data=trend_data,
-        pie_data=pie_data,
         category_table=category_table,
         data_scope=data_scope,
         view_type=view_type,
         source=source,
         history_table=history_table,
-        history_pie=history_pie
+        upload_job=upload_job.to_dict() if upload_job else None
     )
 
 
+@app.route("/dashboard/stats")
+@login_required
+def dashboard_stats():
+    """Hits, misses, patches and invalidations of the dashboard summary cache"""
+    return jsonify(dashboard_cache.stats())
 
 
-
-
-  # Ensure this is imported
-
 @app.route("/add-expense", methods=["GET", "POST"])
 @login_required
 def add_expense():
@@ -353,6 +698,7 @@ def add_expense():
 
             categories = ['rent', 'food', 'travel', 'electricity', 'entertainment', 'healthcare', 'other']
 
+            new_rows = []
             for cat in categories:
                 amount_str = request.form.get(f"category_{cat}")
                 date_str = request.form.get(f"date_{cat}")
@@ -367,18 +713,29 @@ def add_expense():
                         else:
                             date_obj = datetime.strptime(month_year + "-01", "%Y-%m-%d").date()
 
-                        expense = Expense(
-                            user_id=current_user.id,
-                            category=cat,
-                            amount=amount,
-                            date=date_obj
-                        )
-                        db.session.add(expense)
+                        new_rows.append({
+                            "user_id": current_user.id,
+                            "category": cat,
+                            "amount": amount,
+                            "date": date_obj
+                        })
 
                     except ValueError:
                         flash(f"Invalid amount or date for {cat}", "warning")
 
+            # One executemany for all categories; rollups are updated in the same transaction
+            Expense.bulk_insert(new_rows)
             db.session.commit()
+            # Cached assistant answers about the changed months are stale now
+            for month in {row["date"].strftime("%Y-%m") for row in new_rows}:
+                answer_cache.invalidate(current_user.id, month)
+            # Cached dashboards only need the new amounts added to their month and category cells
+            partials = {}
+            for row in new_rows:
+                cell = (row["date"].strftime("%Y-%m"), row["category"].lower())
+                total, count = partials.get(cell, (0.0, 0))
+                partials[cell] = (total + row["amount"], count + 1)
+            dashboard_cache.patch(current_user.id, partials)
             session["has_data"] = True
             flash("Budget and expenses saved successfully!", "success")
             return redirect(url_for("dashboard"))
@@ -396,24 +753,112 @@ def add_expense():
 
 @app.route("/reset")
 def reset():
-    # Clear session data
+    # Drop the stored upload summaries, then clear session data
+    UploadResult.discard(session.get("result_id"))
+    if current_user.is_authenticated:
+        dashboard_cache.invalidate(current_user.id, "csv")
+    folder = session.get("upload_folder")
     session.clear()
-    # Remove temporary files
-    if "filepath" in session and os.path.exists(session["filepath"]):
-        try:
-            os.remove(session["filepath"])
-        except:
-            pass
+    # Remove the upload's temporary files
+    if folder and os.path.dirname(os.path.abspath(folder)) == os.path.abspath(app.config["UPLOAD_FOLDER"]):
+        shutil.rmtree(folder, ignore_errors=True)
 
     flash("Data has been reset. You can upload a new file.", "info")
     return redirect(url_for("index"))
 
+def chat_frame(data_type, month):
+    """The selected month's expenses as a DataFrame, plus an error message"""
+    import pandas as pd
+
+    df = pd.DataFrame()
+
+    # Load from database (manual input), as arrays straight from the SQL rows
+    if data_type == "manual":
+        from expense_store import ExpenseStore
+
+        store = ExpenseStore.load(current_user.id, *Expense.month_range(month))
+        if len(store):
+            df = store.to_frame()
+
+    # Load from CSV
+    elif data_type == "csv" and session.get("filepath"):
+        try:
+            data = load_uploaded_frame()
+            if data is not None:
+                df = data[data["date"].dt.strftime("%Y-%m") == month].copy()
+        except Exception as e:
+            return df, f"Error loading uploaded data: {e}"
+    return df, None
+
+
+def chat_month():
+    """The "YYYY-MM" month a chat request is about, from the form or session
+
+    Anything that is not a valid month falls back to the current one, so a
+    bad value never reaches the month arithmetic.
+    """
+    current = datetime.now().strftime("%Y-%m")
+    month = request.form.get("month") or session.get("expense_month")
+    if not month:
+        return current
+    try:
+        return datetime.strptime(month, "%Y-%m").strftime("%Y-%m")
+    except (TypeError, ValueError):
+        flash(f"'{month}' is not a valid month; showing {current} instead.", "warning")
+        return current
+
+
+def question_context(question, df, data_type, selected_month):
+    """(fingerprint, agent_factory, local_answer keyword arguments) for a question about df"""
+    # Reuse the agent built for this user, month and data, if still pooled;
+    # it is only fetched for questions the local intents cannot answer
+    fingerprint = dataset_fingerprint(df)
+    user_id = current_user.id
+    if data_type == "manual":
+        month_totals = lambda year, month: ExpenseRollup.category_totals(user_id, f"{year:04d}-{month:02d}")
+    else:
+        month_totals = upload_month_totals()
+    year, month = map(int, selected_month.split("-"))
+    options = {
+        "df": df,
+        "month_totals": month_totals,
+        "budget": session.get("budget"),
+        "month": (year, month),
+        "answers": cached_answers(user_id, fingerprint, selected_month, df["category"].unique()),
+    }
+
+    compact = app.config["AGENT_COMPACT_CONTEXT"] and not needs_rows(question)
+
+    def agent_factory():
+        # 🔹 The LLM sees compact aggregates unless the question is about individual rows,
+        # or the rows are cheaper than the aggregates (small months)
+        context = context_cache.get(fingerprint, df, budget=app.config["AGENT_CONTEXT_TOKENS"]) if compact else None
+        if context is None or not context.pays_off:
+            context_stats.record("rows", frame_tokens(df), 0)
+            return agent_pool.get((user_id, fingerprint, selected_month, "rows"), df)
+        context_stats.record("compact", context.tokens, context.tokens_saved)
+        app.logger.info("Compact agent context: %d tokens, %d saved", context.tokens, context.tokens_saved)
+        return agent_pool.get((user_id, fingerprint, selected_month, "compact"), df, context=context)
+
+    return fingerprint, agent_factory, options
+
+
+def save_chat(question, answer, fingerprint, month):
+    new_chat = ChatHistory(
+        user_id=current_user.id,
+        question=question,
+        answer=answer,
+        data_fingerprint=fingerprint,
+        month=month,
+    )
+    db.session.add(new_chat)
+    db.session.commit()
+
+
 @app.route("/chat", methods=["GET", "POST"])
 @login_required
 def chat():
-    from datetime import timedelta
-
-    selected_month = request.form.get("month") or session.get("expense_month") or datetime.now().strftime("%Y-%m")
+    selected_month = chat_month()
     session["expense_month"] = selected_month
 
     selected_scope = request.form.get("scope", "present")
@@ -422,32 +867,9 @@ def chat():
     # ✅ Generate last 7 months for dropdown
     months_list = [(datetime.now() - timedelta(days=30 * i)).strftime("%Y-%m") for i in range(7)]
 
-    df = pd.DataFrame()
-
-    # Load from database (manual input)
-    if selected_data_type == "manual":
-        expenses = Expense.query.filter_by(user_id=current_user.id).all()
-        manual_data = [
-            {
-                "category": e.category,
-                "amount": e.amount,
-                "date": e.date.strftime("%Y-%m-%d")
-            }
-            for e in expenses
-            if e.date.strftime("%Y-%m") == selected_month
-        ]
-        df = pd.DataFrame(manual_data)
-
-    # Load from CSV
-    elif selected_data_type == "csv" and session.get("filepath") and os.path.exists(session["filepath"]):
-        try:
-            tracker = ExpenseTracker()
-            tracker.load_data(session["filepath"])
-            data = tracker.data.copy()
-            data["date"] = pd.to_datetime(data["date"])
-            df = data[data["date"].dt.strftime("%Y-%m") == selected_month].copy()
-        except Exception as e:
-            flash(f"Error loading uploaded data: {e}", "danger")
+    df, error = chat_frame(selected_data_type, selected_month)
+    if error:
+        flash(error, "danger")
 
     if df.empty:
         flash("No expense data found for the selected month.", "danger")
@@ -465,14 +887,12 @@ def chat():
     answer = None
     if request.method == "POST" and request.form.get("question"):
         question = request.form["question"]
-        agent = get_agent(df)
-        answer = ask_question(agent, question, df)
-
-        new_chat = ChatHistory(user_id=current_user.id, question=question, answer=answer)
-        db.session.add(new_chat)
-        db.session.commit()
+        fingerprint, agent_factory, options = question_context(question, df, selected_data_type, selected_month)
+        answer = ask_question(None, question, agent_factory=agent_factory, **options)
+        save_chat(question, answer, fingerprint, selected_month)
 
-    history = ChatHistory.query.filter_by(user_id=current_user.id).order_by(ChatHistory.timestamp.desc()).all()
+    # Only the latest exchanges; older ones are on the history page
+    history = ChatHistory.recent(current_user.id, app.config["CHAT_RECENT_LIMIT"])
 
     return render_template(
         "chat.html",
@@ -485,11 +905,138 @@ def chat():
     )
 
 
+def cached_answers(user_id, fingerprint, month, categories):
+    """The answer cache scope for a user's data, warmed from their chat history on first use"""
+    scope = (user_id, fingerprint, month)
+    keywords = [str(category) for category in categories]
+    if not answer_cache.is_warm(scope):
+        rows = (
+            ChatHistory.query.filter_by(user_id=user_id, data_fingerprint=fingerprint, month=month)
+            .order_by(ChatHistory.timestamp.desc())
+            .with_entities(ChatHistory.question, ChatHistory.answer)
+            .limit(app.config["ANSWER_CACHE_WARM"])
+            .all()
+        )
+        answer_cache.warm(
+            scope,
+            [(q, a) for q, a in reversed(rows) if a and not a.startswith(ERROR_PREFIX)],
+            keywords,
+        )
+    return answer_cache.scoped(scope, keywords)
+
+
+@app.route("/chat/stream", methods=["POST"])
+@login_required
+def chat_stream():
+    """Answer one chat question as server-sent events: status, delta, error, then done"""
+    question = request.form.get("question", "").strip()
+    selected_month = chat_month()
+    selected_data_type = request.form.get("data_type", "manual")
+    if not question:
+        return jsonify({"error": "No question asked"}), 400
+
+    df, error = chat_frame(selected_data_type, selected_month)
+    if df.empty:
+        message = error or "No expense data found for the selected month."
+        return Response(sse("error", {"text": message}) + sse("done", {"answer": None}), mimetype="text/event-stream")
+    fingerprint, agent_factory, options = question_context(question, df, selected_data_type, selected_month)
+
+    def generate():
+        try:
+            answer = local_answer(question, **options)
+        except Exception as e:
+            answer = f"{ERROR_PREFIX}: {e}"
+
+        if answer is not None:
+            yield sse("delta", {"text": answer})
+        else:
+            # ⏳ Only questions that need the LLM hold a streaming slot
+            parts, failure = [], None
+            for event, text in answer_streamer.stream(question, agent_factory):
+                if event == "delta":
+                    parts.append(text)
+                elif event == "error":
+                    text = failure = f"{ERROR_PREFIX}: {text}"
+                yield sse(event, {"text": text})
+            answer = "".join(parts).strip()
+            if failure:
+                answer = failure
+            elif options["answers"] is not None:
+                options["answers"].store(question, answer)
+
+        # Reached only when the answer completed; a disconnected client cancels the stream
+        save_chat(question, answer, fingerprint, selected_month)
+        yield sse("done", {"answer": answer})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def run_search(query, scope, limit):
+    """Chat and expense matches for a search, per scope ("all", "chats" or "expenses")"""
+    results = {"chats": [], "expenses": []}
+    if scope in ("all", "chats"):
+        results["chats"] = search_chats(current_user.id, query, limit)
+    if scope in ("all", "expenses"):
+        results["expenses"] = search_expenses(current_user.id, query, limit)
+    return results
+
+
+@app.route("/search")
+@login_required
+def search():
+    """Full-text search over the user's chat history and imported expense descriptions"""
+    query = request.args.get("q", "").strip()
+    scope = request.args.get("scope", "all")
+    results = {"chats": [], "expenses": []}
+    if query:
+        try:
+            results = run_search(query, scope, app.config["SEARCH_RESULTS_LIMIT"])
+        except OperationalError:
+            flash("Search is not set up yet. Run python create_database.py.", "warning")
+    return render_template("search.html", query=query, scope=scope, results=results)
+
+
+@app.route("/api/search")
+@login_required
+def api_search():
+    """Ranked search results as JSON; snippets are HTML-escaped with <mark> around matches"""
+    query = request.args.get("q", "").strip()
+    limit = min(request.args.get("limit", app.config["SEARCH_RESULTS_LIMIT"], type=int), 100)
+    try:
+        return jsonify(run_search(query, request.args.get("scope", "all"), max(limit, 1)))
+    except OperationalError:
+        return jsonify({"error": "Search is not set up yet"}), 503
+
+
+@app.route("/chat/stats")
+@login_required
+def chat_stats():
+    """Hit rate and latency per chat intent (and the LLM fall-through), and prompt tokens sent/saved"""
+    return jsonify({"intents": intent_stats.snapshot(), "prompt_context": context_stats.snapshot()})
+
+
 @app.route("/chat-history")
 @login_required
 def chat_history():
-    history = ChatHistory.query.filter_by(user_id=current_user.id).order_by(ChatHistory.timestamp.desc()).all()
-    return render_template("chat_history.html", chat_history=history)
+    # First page rendered here; the page fetches the rest from /api/chat-history as it scrolls
+    history, next_cursor = ChatHistory.page(current_user.id, app.config["CHAT_HISTORY_PAGE_SIZE"])
+    return render_template("chat_history.html", chat_history=history, next_cursor=next_cursor)
+
+
+@app.route("/api/chat-history")
+@login_required
+def api_chat_history():
+    """One page of the user's chat history, newest first; pass the returned cursor for the next"""
+    limit = min(request.args.get("limit", app.config["CHAT_HISTORY_PAGE_SIZE"], type=int), 200)
+    try:
+        history, next_cursor = ChatHistory.page(current_user.id, max(limit, 1), request.args.get("cursor"))
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    return jsonify({"items": [entry.to_dict() for entry in history], "next_cursor": next_cursor})
 
 
 
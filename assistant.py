@@ -1,38 +1,107 @@
-import pandas as pd
+import hashlib
 import os
-import re
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
-from langchain_experimental.agents import create_pandas_dataframe_agent
-from langchain.agents.agent import AgentExecutor
-from langchain_groq import ChatGroq
+from intents import ExpenseData, intent_stats, route
+
+# pandas, httpx and LangChain take seconds to import; they are loaded when the
+# first agent is built, so importing this module (and the app) stays cheap
+if TYPE_CHECKING:
+    import pandas as pd
 
 load_dotenv()
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
+# "groq" for the real model, "stub" for the offline StubAgent
+ASSISTANT_LLM = os.getenv("ASSISTANT_LLM", "groq")
+
+# Start of every answer that reports a failure instead of answering
+ERROR_PREFIX = "⚠️ Sorry, I couldn't process that"
+
+# Agent prompt prefix when the LLM gets aggregates instead of rows
+COMPACT_PREFIX = """You are a personal finance assistant. These aggregates summarize every expense of the period:
+{context}
+
+You are working with a pandas dataframe in Python holding the per-category aggregates above. The name of the dataframe is `df`.
+You should use the tools below to answer the question posed of you:"""
+
+# One LLM client for the whole process, sharing a keep-alive connection pool
+_llm = None
+_llm_lock = threading.Lock()
+
 def load_expense_dataframe():
     """
     Placeholder if needed later for global data access.
     """
+    import pandas as pd
+
     return pd.DataFrame()
 
-def get_agent(df: pd.DataFrame):
+def get_llm():
+    """
+    Shared Groq chat model; built once and reused by every agent.
+    """
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            import httpx
+            from langchain_groq import ChatGroq
+
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+            _llm = ChatGroq(
+                temperature=0,
+                model_name="deepseek-r1-distill-llama-70b",  # You can switch to "llama3-70b-8192"
+                api_key=GROQ_API_KEY,
+                http_client=http_client
+            )
+    return _llm
+
+def dataset_fingerprint(df: "pd.DataFrame"):
+    """
+    Short digest of a DataFrame's columns and contents.
+    """
+    import pandas as pd
+
+    digest = hashlib.sha256(repr(list(df.columns)).encode("utf-8"))
+    if not df.empty:
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+def get_agent(df: "pd.DataFrame", context=None):
     """
     Create a LangChain agent using Groq LLM and your DataFrame.
+
+    With a compact context (agent_context.CompactContext) the agent gets the
+    context's aggregates in its prompt and works on the small aggregate frame
+    instead of the raw rows.
     """
-    llm = ChatGroq(
-        temperature=0,
-        model_name="deepseek-r1-distill-llama-70b",  # You can switch to "llama3-70b-8192"
-        api_key=GROQ_API_KEY
-    )
+    if ASSISTANT_LLM == "stub":
+        return StubAgent(df, context)
+
+    from langchain_experimental.agents import create_pandas_dataframe_agent
+    from langchain.agents.agent import AgentExecutor
+
+    options = {}
+    if context is not None:
+        df = context.frame
+        # Braces would be read as prompt template variables
+        options["prefix"] = COMPACT_PREFIX.format(context=context.text.replace("{", "{{").replace("}", "}}"))
 
     # Enable output parsing error handling to avoid crashing
     agent = create_pandas_dataframe_agent(
-        llm,
+        get_llm(),
         df,
         verbose=False,
         allow_dangerous_code=True,
-        handle_parsing_errors=True
+        handle_parsing_errors=True,
+        **options
     )
 
     return AgentExecutor(
@@ -43,40 +112,136 @@ def get_agent(df: pd.DataFrame):
     )
 
 
-def ask_question(agent, question, df=None):
+class AgentPool:
     """
-    Handle AI summary questions or forward to LangChain agent.
+    LRU of built agents keyed by (user, dataset fingerprint, month).
+
+    Agents are dropped when unused for ttl seconds or when more than
+    max_agents are held, least recently used first.
+    """
+
+    def __init__(self, max_agents=32, ttl=30 * 60):
+        self.max_agents = max_agents
+        self.ttl = ttl
+        self._agents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, df, **options):
+        """Return the agent for key, building one over df (with get_agent options) on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._agents.get(key)
+            if entry is not None:
+                self._agents[key] = (entry[0], now)
+                self._agents.move_to_end(key)
+                return entry[0]
+
+        agent = get_agent(df, **options)
+        with self._lock:
+            self._agents[key] = (agent, now)
+            self._agents.move_to_end(key)
+            while len(self._agents) > self.max_agents:
+                self._agents.popitem(last=False)
+        return agent
+
+    def _expire(self, now):
+        while self._agents:
+            key, (_, last_used) = next(iter(self._agents.items()))
+            if now - last_used <= self.ttl:
+                break
+            del self._agents[key]
+
+
+def local_answer(question, df=None, month_totals=None, budget=None, month=None, answers=None):
+    """
+    Answer a question without the LLM: from the local intents, then from the answer cache.
+
+    Returns None when the question needs the LLM. Arguments are as for ask_question.
+    """
+    start = time.perf_counter()
+    data = ExpenseData(df, month_totals=month_totals, budget=budget, month=month)
+    intent, answer = route(question, data)
+    if answer is not None:
+        intent_stats.record(intent, time.perf_counter() - start)
+        return answer
+
+    # Same (or nearly the same) question about the same data: reuse the LLM's answer
+    if answers is not None:
+        answer = answers.lookup(question)
+        if answer is not None:
+            intent_stats.record("cache", time.perf_counter() - start)
+            return answer
+    return None
+
+
+def ask_question(agent, question, df=None, month_totals=None, budget=None, month=None, agent_factory=None,
+                 answers=None):
+    """
+    Answer common questions locally (see intents.INTENTS) or forward to the LangChain agent.
+
+    month_totals, if given, is a callable (year, month) -> {category: total}
+    (e.g. backed by the rollup table) used for month totals instead of df.
+    month is the (year, month) questions without one refer to. When agent is
+    None, agent_factory() builds it, only for questions that need the LLM.
+    answers, an answer_cache.ScopedAnswers, short-circuits repeated LLM questions.
     """
     try:
-        # Match: "summary of my May 2025 expenses"
-        summary_match = re.search(r"summary.*(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s+(\d{4})", question.lower())
-        if summary_match and df is not None:
-            month_str = summary_match.group(1)
-            year = int(summary_match.group(2))
+        answer = local_answer(question, df, month_totals, budget, month, answers)
+        if answer is not None:
+            return answer
+
+        # Otherwise: use LLM for generic queries like "how can I save money"
+        start = time.perf_counter()
+        if agent is None:
+            agent = agent_factory()
+        answer = agent.run(question)
+        intent_stats.record("llm", time.perf_counter() - start)
+        if answers is not None:
+            answers.store(question, answer)
+        return answer
 
-            # Convert short month name to month number
-            month_num = pd.to_datetime(month_str[:3], format="%b").month
+    except Exception as e:
+        return f"{ERROR_PREFIX}: {str(e)}"
 
-            # Convert and filter
-            df['date'] = pd.to_datetime(df['date'])
-            filtered = df[(df['date'].dt.month == month_num) & (df['date'].dt.year == year)]
 
-            if filtered.empty:
-                return f"🔍 No data found for {month_str.capitalize()} {year}."
+def answer_chunks(agent, question):
+    """
+    Yield ("status", text) and ("delta", text) pieces of the agent's answer as they arrive.
 
-            total = filtered["amount"].sum()
-            top_categories = filtered.groupby("category")["amount"].sum().sort_values(ascending=False).head(3)
+    The deltas concatenate to the full answer. Agents without stream() yield it in one piece.
+    """
+    if not hasattr(agent, "stream"):
+        yield "delta", agent.run(question)
+        return
+    for chunk in agent.stream({"input": question}):
+        for action in chunk.get("actions", []):
+            yield "status", f"Using {action.tool}…"
+        if "output" in chunk:
+            yield "delta", chunk["output"]
 
-            response = f"📊 **Summary for {month_str.capitalize()} {year}**\n"
-            response += f"- Total expenses: ₹{total:.2f}\n"
-            response += "- Top 3 categories:\n"
-            for cat, amt in top_categories.items():
-                response += f"  • {cat.title()}: ₹{amt:.2f}\n"
 
-            return response
+class StubAgent:
+    """
+    Local stand-in for the LLM agent (ASSISTANT_LLM=stub): answers without any
+    network call, streamed word by word, for development and tests.
+    """
 
-        # Otherwise: use LLM for generic queries like "how can I save money"
-        return agent.run(question)
+    def __init__(self, df=None, context=None, delay=0.05):
+        self.df = df
+        self.context = context
+        self.delay = delay
 
-    except Exception as e:
-        return f"⚠️ Sorry, I couldn't process that: {str(e)}"
\ No newline at end of file
+    def _answer(self, question):
+        if self.context is not None:
+            return f"(stub) You asked: {question} I can see {self.context.tokens} tokens of aggregates."
+        rows = 0 if self.df is None else len(self.df)
+        return f"(stub) You asked: {question} I can see {rows} expense rows."
+
+    def run(self, question):
+        return self._answer(question)
+
+    def stream(self, inputs):
+        for word in self._answer(inputs["input"]).split(" "):
+            time.sleep(self.delay)
+            yield {"output": word + " "}
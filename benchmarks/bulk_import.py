@@ -0,0 +1,61 @@
+"""Throughput of expense_import.import_expenses on SQLite
+
+Usage: python benchmarks/bulk_import.py [rows]
+
+Imports a synthetic categorized upload into a fresh database, then imports it
+again to time the all-duplicates path.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from flask import Flask
+
+from models import db, User, Expense, ExpenseRollup
+from expense_import import import_expenses
+
+CATEGORIES = ["groceries", "dining", "transportation", "utilities", "shopping", "housing", "miscellaneous"]
+
+
+def synthetic_upload(rows):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "date": pd.Timestamp("2018-01-01") + pd.to_timedelta(rng.integers(0, 2500, rows), unit="D"),
+        "amount": rng.lognormal(3, 1, rows).round(2),
+        "description": pd.Series(rng.integers(0, 50_000, rows)).map("Card purchase #{}".format),
+        "category": rng.choice(CATEGORIES, rows),
+    })
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    db.init_app(app)
+    frame = synthetic_upload(rows)
+
+    with app.app_context():
+        db.create_all()
+        user = User(username="bench", password_hash="x")
+        db.session.add(user)
+        db.session.commit()
+
+        for label in ("fresh import", "re-import (all duplicates)"):
+            start = time.perf_counter()
+            inserted, skipped = import_expenses(user.id, [frame])
+            elapsed = time.perf_counter() - start
+            print(f"{label:<28} {inserted:>9,} inserted {skipped:>9,} skipped "
+                  f"{elapsed:7.2f} s  {rows / elapsed:>10,.0f} rows/s")
+
+        stored = db.session.query(db.func.sum(Expense.amount)).scalar()
+        rolled = db.session.query(db.func.sum(ExpenseRollup.total)).scalar()
+        print(f"expense total {stored:,.2f} == rollup total {rolled:,.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Schema detection and parse time of a bank-style CSV, against the old read-everything-and-guess load
+
+Usage: python benchmarks/csv_schema.py [rows]
+
+Writes a statement with extra columns, month-first dates and spending as
+negative amounts, then times detecting its schema (fresh and from the
+schema cache) and loading it with explicit formats. The old load read every
+column and let pd.to_datetime work out the date format, and could only do
+that after the columns were renamed to date, amount and description.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from csv_schema import SchemaCache, detect_schema
+from expense_tracker import ExpenseTracker
+
+MERCHANTS = ["STARBUCKS #1123", "UBER TRIP", "AMAZON MKTPL", "SHELL OIL 5744", "NETFLIX.COM", "WHOLE FOODS",
+             "CVS PHARMACY", "DELTA AIR", "SPOTIFY", "TARGET 00012"]
+
+
+def write_statement(path, rows):
+    rng = np.random.default_rng(0)
+    dates = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 1800, rows), unit="D")
+    pd.DataFrame({
+        "Transaction Date": dates.strftime("%m/%d/%Y"),
+        "Post Date": (dates + pd.Timedelta(days=1)).strftime("%m/%d/%Y"),
+        "Description": np.array(MERCHANTS)[rng.integers(0, len(MERCHANTS), rows)],
+        "Category": "Shopping",
+        "Type": "Sale",
+        "Amount": -rng.uniform(1, 500, rows).round(2),
+        "Memo": "",
+    }).to_csv(path, index=False)
+
+
+def old_load(path):
+    df = pd.read_csv(path)
+    df = df.rename(columns={"Transaction Date": "date", "Amount": "amount", "Description": "description"})
+    df["date"] = pd.to_datetime(df["date"])
+    df["amount"] = -pd.to_numeric(df["amount"], errors="coerce")
+    return df
+
+
+def timed(function, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, "statement.csv")
+    write_statement(path, rows)
+    print(f"{rows:,} rows, {os.path.getsize(path) / 2**20:.1f} MiB")
+
+    schema, detect = timed(detect_schema, path, repeat=20)
+    cache = SchemaCache(os.path.join(folder, "schemas"))
+    cache.resolve(path)
+    _, cached = timed(cache.resolve, path, repeat=20)
+    print(f"detect schema          {detect * 1000:8.2f} ms  (format {schema['date_format']}, sign {schema['amount_sign']})")
+    print(f"schema cache hit       {cached * 1000:8.2f} ms")
+
+    reference, old = timed(old_load, path)
+    tracker = ExpenseTracker()
+    _, new = timed(tracker.load_data, path, schema)
+    print(f"old load               {old:8.2f} s")
+    print(f"load with schema       {new:8.2f} s  ({old / new:.1f}x)")
+
+    assert (tracker.df["date"].to_numpy() == reference["date"].to_numpy()).all()
+    assert np.allclose(tracker.df["amount"].to_numpy(), reference["amount"].to_numpy())
+
+
+if __name__ == "__main__":
+    main()
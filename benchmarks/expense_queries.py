@@ -0,0 +1,96 @@
+"""Query latency of the Expense helpers with and without the composite indexes
+
+Usage: python benchmarks/expense_queries.py [rows_per_user]
+
+Builds a throwaway SQLite database with two users (the second one as noise),
+then times month, range and category lookups plus a grouped monthly sum.
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import func, text
+
+from models import db, Expense, upgrade_schema
+
+CATEGORIES = ["rent", "food", "travel", "electricity", "entertainment", "healthcare", "other"]
+
+
+def populate(path, rows_per_user):
+    start = date(2015, 1, 1)
+    connection = sqlite3.connect(path)
+    connection.execute("INSERT INTO user (id, username, password_hash) VALUES (1, 'bench', 'x'), (2, 'noise', 'x')")
+    for user_id in (1, 2):
+        batch = (
+            (user_id, random.choice(CATEGORIES), round(random.uniform(1, 500), 2),
+             (start + timedelta(days=random.randint(0, 3650))).isoformat())
+            for _ in range(rows_per_user)
+        )
+        connection.executemany("INSERT INTO expense (user_id, category, amount, date) VALUES (?, ?, ?, ?)", batch)
+    connection.commit()
+    connection.close()
+
+
+def timed(label, func, repeat=20):
+    func()  # Warm the page cache
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat * 1000
+    print(f"  {label:<32} {elapsed:9.2f} ms   ({result})")
+
+
+def run_queries():
+    timed("month (count)", lambda: Expense.in_month(1, "2020-06").count())
+    timed("month (sum)", lambda: Expense.in_month(1, "2020-06").with_entities(func.sum(Expense.amount)).scalar())
+    timed("quarter range (count)", lambda: Expense.in_range(1, date(2020, 1, 1), date(2020, 4, 1)).count())
+    timed("category in month (count)", lambda: Expense.in_category(1, "food", *Expense.month_range("2020-06")).count())
+    timed(
+        "category sums in month",
+        lambda: len(
+            Expense.in_month(1, "2020-06")
+            .with_entities(Expense.category, func.sum(Expense.amount))
+            .group_by(Expense.category)
+            .all()
+        ),
+    )
+
+
+def main():
+    rows_per_user = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}"
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        for index in Expense.__table__.indexes:
+            index.drop(db.engine)
+
+        print(f"Inserting {rows_per_user:,} expenses for each of 2 users...")
+        populate(path, rows_per_user)
+
+        print("Without indexes:")
+        run_queries()
+
+        start = time.perf_counter()
+        upgrade_schema(db.engine)
+        with db.engine.connect() as connection:
+            connection.execute(text("ANALYZE"))
+        print(f"Creating indexes took {time.perf_counter() - start:.1f} s")
+
+        print("With indexes:")
+        run_queries()
+
+
+if __name__ == "__main__":
+    main()
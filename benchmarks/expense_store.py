@@ -0,0 +1,115 @@
+"""Memory and build time of a user's expenses as ORM rows, row dicts, a DataFrame and an ExpenseStore
+
+Usage: python benchmarks/expense_store.py [rows]
+
+Fills a throwaway SQLite database with one user's expenses, then loads them
+each way. Retained memory is what the result keeps alive, per million rows:
+traced Python allocations, or the deep size of frames (their Arrow-backed
+strings are not traced). Peak is the whole load, unscaled.
+"""
+import gc
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from flask import Flask
+
+from expense_store import ExpenseStore
+from models import db, Expense
+
+CATEGORIES = ["rent", "food", "travel", "electricity", "entertainment", "healthcare", "other"]
+
+
+def populate(path, rows):
+    start = date(2015, 1, 1)
+    connection = sqlite3.connect(path)
+    connection.execute("INSERT INTO user (id, username, password_hash) VALUES (1, 'bench', 'x')")
+    batch = (
+        (1, random.choice(CATEGORIES), round(random.uniform(1, 500), 2),
+         (start + timedelta(days=random.randint(0, 3650))).isoformat())
+        for _ in range(rows)
+    )
+    connection.executemany("INSERT INTO expense (user_id, category, amount, date) VALUES (?, ?, ?, ?)", batch)
+    connection.commit()
+    connection.close()
+
+
+def orm_rows():
+    return Expense.for_user(1).all()
+
+
+def row_dicts():
+    # What the chat page used to build before handing rows to pandas
+    return [
+        {"category": e.category, "amount": e.amount, "date": e.date.strftime("%Y-%m-%d")}
+        for e in Expense.for_user(1).all()
+    ]
+
+
+def dict_frame():
+    return pd.DataFrame(row_dicts())
+
+
+def store():
+    return ExpenseStore.load(1)
+
+
+def store_frame():
+    return ExpenseStore.load(1).to_frame()
+
+
+def footprint(result, traced):
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(deep=True).sum())
+    return traced
+
+
+def measure(build):
+    db.session.expunge_all()
+    gc.collect()
+    tracemalloc.start()
+    begin = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - begin
+    db.session.expunge_all()  # Rows the session still tracks are not part of the result
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, footprint(result, retained), peak
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}"
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        populate(path, rows)
+        print(f"{rows:,} expenses; retained memory per million rows")
+        for label, build in (("ORM objects", orm_rows), ("row dicts", row_dicts), ("DataFrame of dicts", dict_frame),
+                             ("ExpenseStore", store), ("ExpenseStore.to_frame", store_frame)):
+            result, elapsed, retained, peak = measure(build)
+            scale = 1_000_000 / rows
+            print(f"{label:<22} retained {retained * scale / 2**20:8.1f} MiB  peak {peak / 2**20:8.1f} MiB  "
+                  f"load {elapsed:6.2f} s")
+            del result
+
+        # The store's frame gives the same totals as the rows
+        reference = pd.DataFrame(row_dicts()).groupby("category")["amount"].sum()
+        totals = store_frame().groupby("category", observed=True)["amount"].sum()
+        assert all(abs(totals[c] - reference[c]) < 1e-6 * max(1.0, abs(reference[c])) for c in reference.index)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Latency of the FTS5 chat history and expense description search on SQLite
+
+Usage: python benchmarks/search.py [rows]
+
+Fills a fresh database with synthetic chat entries and imported expenses
+spread over many users (indexed by the search triggers as they are
+inserted), then times searches for one user.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from flask import Flask
+
+from models import db
+from search import install_search, search_chats, search_expenses
+
+USERS = 1000
+WORDS = ["grocery", "uber", "rent", "netflix", "coffee", "pharmacy", "electricity", "flight", "hotel", "salary",
+         "budget", "saving", "restaurant", "fuel", "insurance", "gym", "books", "amazon", "internet", "water"]
+QUERIES = ["netflix", "coffee shop", "how save", "flig", "electricity bill", "insurance gym"]
+
+
+def fill(rows):
+    rng = np.random.default_rng(0)
+    users = rng.integers(1, USERS + 1, rows).tolist()
+    words = np.array(WORDS)
+    connection = db.session.connection().connection
+    cursor = connection.cursor()
+    for start in range(0, rows, 100_000):
+        n = min(100_000, rows - start)
+        picks = rng.integers(0, len(WORDS), (n, 6))
+        texts = [" ".join(row) for row in words[picks]]
+        cursor.executemany(
+            "INSERT INTO chat_history (user_id, question, answer, timestamp) VALUES (?, ?, ?, '2024-01-01 00:00:00')",
+            ((users[start + i], f"how do I save on {texts[i][:20]}", f"You could spend less on {texts[i]}") for i in range(n)),
+        )
+        cursor.executemany(
+            "INSERT INTO expense (user_id, category, amount, date, description) VALUES (?, ?, ?, '2024-01-01', ?)",
+            ((users[start + i], WORDS[picks[i, 0]], 10.0, f"Card purchase {texts[i]} #{start + i}") for i in range(n)),
+        )
+    connection.commit()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        install_search(db.engine)
+        start = time.perf_counter()
+        fill(rows)
+        print(f"indexed {rows:,} chat entries and {rows:,} expenses in {time.perf_counter() - start:.1f} s")
+
+        for search, label in ((search_chats, "chats"), (search_expenses, "expenses")):
+            for query in QUERIES:
+                search(7, query)  # Warm the page cache
+                timings = []
+                for user_id in range(1, 51):
+                    begin = time.perf_counter()
+                    results = search(user_id, query)
+                    timings.append(time.perf_counter() - begin)
+                print(f"{label:<9} {query!r:<20} median {np.median(timings) * 1000:6.2f} ms  "
+                      f"p95 {np.percentile(timings, 95) * 1000:6.2f} ms  ({len(results)} results)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+
+CHART_TYPES = ("category", "trend")
+
+
+def _new_figure():
+    # matplotlib is imported on the first render, not when the app starts
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    # A bare Figure on an Agg canvas: no pyplot state, so safe to use from any thread
+    figure = Figure(figsize=(12, 6))
+    FigureCanvasAgg(figure)
+    return figure
+
+
+def _png(figure):
+    buffer = io.BytesIO()
+    figure.canvas.print_png(buffer)
+    return buffer.getvalue()
+
+
+def render_category_chart(category_totals):
+    """PNG bar chart of {category: total}"""
+    figure = _new_figure()
+    ax = figure.add_subplot()
+    ax.bar(list(category_totals.keys()), list(category_totals.values()), color='skyblue')
+    ax.set_title('Total Expenses by Category')
+    ax.set_xlabel('Category')
+    ax.set_ylabel('Amount')
+    ax.tick_params(axis='x', labelrotation=45)
+    figure.tight_layout()
+    return _png(figure)
+
+
+def render_trend_chart(monthly_totals):
+    """PNG line chart of {"YYYY-MM": total}, in chronological order"""
+    months = sorted(monthly_totals)
+    figure = _new_figure()
+    ax = figure.add_subplot()
+    ax.plot(months, [monthly_totals[month] for month in months], marker='o', linestyle='-')
+    ax.set_title('Monthly Expense Trend')
+    ax.set_xlabel('Month')
+    ax.set_ylabel('Total Expenses')
+    ax.grid(True, linestyle='--', alpha=0.7)
+    ax.tick_params(axis='x', labelrotation=45)
+    figure.tight_layout()
+    return _png(figure)
+
+
+RENDERERS = {
+    "category": render_category_chart,
+    "trend": render_trend_chart,
+}
+
+
+def data_digest(data):
+    """Short digest of the JSON-serializable data a chart is drawn from"""
+    encoded = json.dumps(data, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class ChartCache:
+    """In-memory LRU of rendered chart PNGs keyed by (owner, data digest, chart type)
+
+    Charts are only rendered when their data changed since the last request,
+    and the key doubles as the ETag the image route sends.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def etag_for(owner, chart_type, data):
+        return f"{owner}-{chart_type}-{data_digest(data)}"
+
+    def get(self, owner, chart_type, data):
+        """Return (etag, png) for a chart of data, rendering it on a miss"""
+        if chart_type not in RENDERERS:
+            raise ValueError(f"Unknown chart type '{chart_type}'")
+        etag = self.etag_for(owner, chart_type, data)
+        with self._lock:
+            png = self._entries.get(etag)
+            if png is not None:
+                self._entries.move_to_end(etag)
+                return etag, png
+
+        # Render outside the lock; two concurrent misses just render twice
+        png = RENDERERS[chart_type](data)
+        with self._lock:
+            if etag not in self._entries:
+                self._entries[etag] = png
+                self._bytes += len(png)
+            self._evict()
+        return etag, png
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, png = self._entries.popitem(last=False)
+            self._bytes -= len(png)
@@ -0,0 +1,79 @@
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from assistant import answer_chunks, intent_stats
+
+_DONE = object()
+
+
+def sse(event, data):
+    """One server-sent event carrying a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class AnswerStreamer:
+    """Runs LLM answers on a bounded pool of threads and streams them out in pieces
+
+    At most max_concurrent answers are generated at once; a request that cannot
+    get a slot within queue_timeout seconds is turned away instead of queueing
+    without bound. Answers taking longer than timeout seconds, and answers whose
+    client went away, are cancelled: the worker stops at the next chunk.
+    """
+
+    def __init__(self, max_concurrent=4, timeout=60, queue_timeout=5):
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="llm")
+
+    def stream(self, question, agent_factory):
+        """Yield ("status" | "delta" | "error", text) events for the LLM's answer to question
+
+        Error text is the bare reason (e.g. the exception message); the caller
+        adds its own prefix.
+        """
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            yield "error", "The assistant is busy right now. Please try again in a moment."
+            return
+
+        events = queue.Queue()
+        cancelled = threading.Event()
+        start = time.perf_counter()
+
+        def work():
+            try:
+                agent = agent_factory()
+                for event in answer_chunks(agent, question):
+                    if cancelled.is_set():
+                        return
+                    events.put(event)
+                intent_stats.record("llm", time.perf_counter() - start)
+            except Exception as e:
+                events.put(("error", str(e)))
+            finally:
+                events.put(_DONE)
+                self._slots.release()
+
+        future = self._executor.submit(work)
+        deadline = time.monotonic() + self.timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    yield "error", f"The assistant took longer than {self.timeout} seconds and was stopped."
+                    return
+                try:
+                    event = events.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+                if event is _DONE:
+                    return
+                yield event
+        finally:
+            # Timed out, finished, or the client disconnected (GeneratorExit)
+            cancelled.set()
+            if future.cancel():  # Never started, so it will not release its slot itself
+                self._slots.release()
@@ -1,9 +1,16 @@
-from app import app
-from models import db
+from factory import create_app
+from models import db, upgrade_schema, ExpenseRollup
+from search import install_search
 
-# Create all tables within the app context
+app = create_app()
+
+# Create all tables (and any indexes missing from existing ones) within the app context
 with app.app_context():
-    db.create_all()
+    upgrade_schema(db.engine)
+    # Full-text search indexes over chat history and expense descriptions
+    install_search(db.engine)
+    # Backfill the monthly rollups from any existing expenses
+    ExpenseRollup.rebuild()
     print("✅ Database initialized successfully.")
 
 
@@ -0,0 +1,324 @@
+import csv
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+
+# Bytes read from the start of a file to detect its layout
+SAMPLE_BYTES = 64 * 1024
+
+# Header names banks use for each role, compared after normalize_header().
+# Roles are matched in this order, so "debit amount" is a debit, not an amount.
+HEADER_SYNONYMS = {
+    "date": ["date", "transaction date", "posting date", "posted date", "post date", "trans date", "txn date",
+             "booking date", "value date", "completed date"],
+    "debit": ["debit", "debits", "debit amount", "withdrawal", "withdrawals", "withdrawal amount", "money out",
+              "paid out", "outflow", "spent"],
+    "credit": ["credit", "credits", "credit amount", "deposit", "deposits", "deposit amount", "money in",
+               "paid in", "inflow", "received"],
+    "amount": ["amount", "transaction amount", "value", "sum", "total"],
+    "description": ["description", "transaction description", "details", "transaction details", "memo",
+                    "narrative", "payee", "merchant", "merchant name", "name", "particulars", "reference"],
+}
+
+# Tried in order on the sampled dates; the first one that parses all of them wins.
+# Month-first comes before day-first, as in pd.to_datetime, for samples that fit both.
+DATE_FORMATS = [
+    "%Y-%m-%d", "%Y/%m/%d", "%m/%d/%Y", "%d/%m/%Y", "%m-%d-%Y", "%d-%m-%Y", "%d.%m.%Y",
+    "%m/%d/%y", "%d/%m/%y", "%d.%m.%y", "%Y%m%d", "%d %b %Y", "%d-%b-%Y", "%d %b %y", "%b %d, %Y",
+    "%d %B %Y", "%B %d, %Y", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%m/%d/%Y %H:%M", "%d/%m/%Y %H:%M",
+]
+
+DELIMITERS = ",;\t|"
+
+# Spending is read as written negative only when this share of the sampled amounts,
+# and at least NEGATIVE_SPENDING_ROWS of them, are negative
+NEGATIVE_SPENDING_SHARE = 0.75
+NEGATIVE_SPENDING_ROWS = 3
+
+# Part of header signatures, so schemas cached by older inference rules are inferred again
+SCHEMA_VERSION = 2
+
+PLAIN_NUMBER = re.compile(r"^-?\d+(\.\d+)?$")
+COMMA_DECIMAL = re.compile(r"^[^\d]*-?\d{1,3}(\.\d{3})*,\d{1,2}[^\d]*$|^[^\d]*-?\d+,\d{1,2}[^\d]*$")
+NUMBER_LIKE = re.compile(r"^[-+(]?\s*[^\d\s]{0,3}\s*-?[\d.,' ]*\d\s*[^\d\s]{0,3}\)?-?$")
+
+
+def normalize_header(name):
+    """Lowercase a header name and reduce punctuation and runs of spaces to single spaces"""
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", str(name).lower()).split())
+
+
+def read_sample(file_path, sample_bytes=SAMPLE_BYTES):
+    """The first sample_bytes of a file as (text, encoding), cut at the last complete line"""
+    with open(file_path, "rb") as f:
+        raw = f.read(sample_bytes)
+        complete = len(raw) < sample_bytes or not f.read(1)
+    if not complete and b"\n" in raw:
+        raw = raw[:raw.rindex(b"\n") + 1]
+    for encoding in ("utf-8-sig", "cp1252", "latin-1"):
+        try:
+            return raw.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+
+
+def sniff_layout(text):
+    """Delimiter, preamble lines to skip and the parsed sample rows of a CSV sample
+
+    The delimiter is the one splitting the most rows into the same number of
+    fields (more than one). The header is the first row with that many fields,
+    so account details some banks print above it are skipped.
+    """
+    lines = text.splitlines()
+    if not any(line.strip() for line in lines):
+        raise ValueError("The file is empty")
+    best = None
+    for delimiter in DELIMITERS:
+        rows = [row for row in csv.reader(lines, delimiter=delimiter) if any(field.strip() for field in row)]
+        width, count = Counter(len(row) for row in rows).most_common(1)[0]
+        if width > 1 and (best is None or (count, width) > best[0]):
+            best = ((count, width), delimiter, rows)
+    if best is None:
+        raise ValueError("No delimiter splits the rows into columns")
+    (_, width), delimiter, rows = best
+    start = next(i for i, row in enumerate(rows) if len(row) == width)
+    skiprows = 0
+    for line in lines:
+        if next(csv.reader([line], delimiter=delimiter), None) == rows[start]:
+            break
+        skiprows += 1
+    return delimiter, skiprows, rows[start:]
+
+
+def header_signature(delimiter, header):
+    """Digest identifying a file layout by its delimiter and header names"""
+    names = [normalize_header(name) for name in header]
+    return hashlib.sha256(repr((SCHEMA_VERSION, delimiter, names)).encode("utf-8")).hexdigest()[:24]
+
+
+def date_format_for(values):
+    """The first DATE_FORMATS entry parsing every value, or None"""
+    values = [value.strip() for value in values if value.strip()]
+    if not values:
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            for value in values:
+                datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return fmt
+    return None
+
+
+def number_style(values):
+    """How amounts are written: {"decimal", "thousands", "clean_amounts"}
+
+    clean_amounts is set when values carry currency symbols, parentheses or
+    other text pd.read_csv cannot parse as numbers by itself.
+    """
+    values = [value.strip() for value in values if value.strip()]
+    comma_decimal = bool(values) and sum(bool(COMMA_DECIMAL.match(v)) for v in values) > len(values) / 2
+    decimal, thousands = (",", ".") if comma_decimal else (".", ",")
+    plain = all(PLAIN_NUMBER.match(v.replace(thousands, "").replace(decimal, ".")) for v in values)
+    return {
+        "decimal": decimal,
+        "thousands": thousands if any(thousands in v for v in values) else None,
+        "clean_amounts": not plain,
+    }
+
+
+def parse_number(value, style):
+    """One sampled amount as a float, written in the given style; None if it is not a number"""
+    text = value.strip()
+    negative = text.startswith("(") and text.endswith(")") or text.endswith("-")
+    text = re.sub(r"[^\d.,\-]", "", text).rstrip("-")
+    if style["thousands"]:
+        text = text.replace(style["thousands"], "")
+    try:
+        number = float(text.replace(style["decimal"], "."))
+    except ValueError:
+        return None
+    return -abs(number) if negative else number
+
+
+def _is_number(value):
+    return bool(NUMBER_LIKE.match(value.strip())) and any(c.isdigit() for c in value)
+
+
+def _column_roles(header, rows):
+    """{role: column index} from header names, then from the sampled values of unmatched roles"""
+    names = [normalize_header(name) for name in header]
+    roles = {}
+    # Exact names first, then names containing a synonym as whole words ("transaction date (utc)")
+    for exact in (True, False):
+        for role, synonyms in HEADER_SYNONYMS.items():
+            if role in roles:
+                continue
+            for index, name in enumerate(names):
+                if index in roles.values():
+                    continue
+                if any(name == s if exact else re.search(rf"\b{re.escape(s)}\b", name) for s in synonyms):
+                    roles[role] = index
+                    break
+
+    columns = [[row[i] if i < len(row) else "" for row in rows] for i in range(len(header))]
+    free = [i for i in range(len(header)) if i not in roles.values()]
+    if "date" not in roles:
+        dated = [i for i in free if date_format_for(columns[i])]
+        if dated:
+            roles["date"] = dated[0]
+            free.remove(dated[0])
+    if "amount" not in roles and "debit" not in roles:
+        numeric = [i for i in free if any(v.strip() for v in columns[i]) and all(_is_number(v) for v in columns[i] if v.strip())]
+        if numeric:
+            roles["amount"] = numeric[-1]  # Amounts tend to follow references and account numbers
+            free.remove(numeric[-1])
+    if "description" not in roles:
+        text = [i for i in free if not all(_is_number(v) for v in columns[i] if v.strip())]
+        if text:
+            roles["description"] = max(text, key=lambda i: len(set(columns[i])))
+    return roles
+
+
+def infer_schema(delimiter, skiprows, rows, encoding="utf-8"):
+    """Work out the column mapping, date format and number style of parsed sample rows
+
+    The result is a JSON-safe dict consumed by the tracker's readers. Without a
+    header row, columns are referred to by position. Raises ValueError when no
+    date, description or amount column can be found.
+    """
+    first = rows[0]
+    named = any(normalize_header(field) in synonyms for field in first for synonyms in HEADER_SYNONYMS.values())
+    has_header = named or not any(date_format_for([field]) for field in first)
+    header, data = (first, rows[1:]) if has_header else ([str(i) for i in range(len(first))], rows)
+    roles = _column_roles(header if has_header else [""] * len(first), data)
+
+    missing = [role for role in ("date", "description") if role not in roles]
+    if "amount" not in roles and "debit" not in roles:
+        missing.append("amount")
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}. Available columns: {', '.join(header)}")
+
+    def values(role):
+        return [row[roles[role]] for row in data if roles[role] < len(row)] if role in roles else []
+
+    amounts = values("amount") + values("debit") + values("credit")
+    style = number_style(amounts)
+    sign = 1
+    if "amount" in roles and "debit" not in roles:
+        # Banks exporting one signed column often write spending as negative amounts; a
+        # sample with about as many of each keeps the amounts as they are
+        numbers = [n for n in (parse_number(v, style) for v in values("amount") if v.strip()) if n]
+        negative = sum(n < 0 for n in numbers)
+        if negative >= NEGATIVE_SPENDING_ROWS and negative >= NEGATIVE_SPENDING_SHARE * len(numbers):
+            sign = -1
+
+    column = (lambda role: header[roles[role]] if role in roles else None) if has_header else \
+        (lambda role: roles.get(role))
+    return {
+        "delimiter": delimiter,
+        "encoding": encoding,
+        "skiprows": skiprows,
+        "header": has_header,
+        "columns": {role: column(role) for role in ("date", "description", "amount", "debit", "credit")},
+        "date_format": date_format_for(values("date")),
+        "amount_sign": sign,
+        **style,
+    }
+
+
+def schema_fits(schema, rows):
+    """Whether a cached schema still reads these sample rows: same header, dates in its format"""
+    if not schema["header"]:
+        return False
+    header = rows[0]
+    if any(name is not None and name not in header for name in schema["columns"].values()):
+        return False
+    if schema["date_format"]:
+        index = header.index(schema["columns"]["date"])
+        dates = [row[index].strip() for row in rows[1:] if index < len(row) and row[index].strip()]
+        try:
+            for value in dates:
+                datetime.strptime(value, schema["date_format"])
+        except ValueError:
+            return False
+    return True
+
+
+def detect_schema(file_path, sample_bytes=SAMPLE_BYTES):
+    """Infer the schema of a CSV file from its first sample_bytes"""
+    text, encoding = read_sample(file_path, sample_bytes)
+    delimiter, skiprows, rows = sniff_layout(text)
+    return infer_schema(delimiter, skiprows, rows, encoding)
+
+
+class SchemaCache:
+    """Detected schemas stored per header signature, as JSON files
+
+    A file whose delimiter and header match an earlier upload, e.g. the next
+    statement from the same bank, reuses that upload's mapping and date format
+    instead of running inference again. A cached schema is only used while
+    the sample's dates still parse with its format; otherwise it is replaced.
+    Reusing it also settles dates that fit both month-first and day-first
+    formats the way an earlier, unambiguous statement did.
+    """
+
+    def __init__(self, directory, sample_bytes=SAMPLE_BYTES):
+        self.directory = directory
+        self.sample_bytes = sample_bytes
+        self._entries = {}
+        self._stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, signature):
+        return os.path.join(self.directory, signature + ".json")
+
+    def resolve(self, file_path):
+        """The schema of a CSV file, from the cache when its header was seen before"""
+        text, encoding = read_sample(file_path, self.sample_bytes)
+        delimiter, skiprows, rows = sniff_layout(text)
+        signature = header_signature(delimiter, rows[0])
+        schema = self.get(signature)
+        if schema is not None and schema_fits(schema, rows):
+            with self._lock:
+                self._stats["hits"] += 1
+            return dict(schema, encoding=encoding, skiprows=skiprows)
+
+        with self._lock:
+            self._stats["misses"] += 1
+        schema = infer_schema(delimiter, skiprows, rows, encoding)
+        if schema["header"]:
+            self.put(signature, schema)
+        return schema
+
+    def get(self, signature):
+        with self._lock:
+            if signature in self._entries:
+                return self._entries[signature]
+        try:
+            with open(self.path_for(signature), encoding="utf-8") as f:
+                schema = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._entries[signature] = schema
+        return schema
+
+    def put(self, signature, schema):
+        path = self.path_for(signature)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(schema, f)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._entries[signature] = schema
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
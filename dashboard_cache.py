@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def patch_summaries(summaries, scope, month, partials):
+    """Fold {("YYYY-MM", category): (total, count)} of new expenses into cached summaries
+
+    Gives what sql_expense_summaries would now return for the same scope and
+    current month, without querying.
+    """
+    category_summary = {category: dict(summary) for category, summary in summaries[0].items()}
+    history_summary, monthly_summary = dict(summaries[1]), dict(summaries[2])
+    for (year_month, category), (total, count) in partials.items():
+        history_summary[category] = history_summary.get(category, 0.0) + total
+        in_scope = year_month == month if scope == "present" else year_month != month if scope == "past" else False
+        if in_scope:
+            summary = category_summary.setdefault(category, {"sum": 0.0, "count": 0})
+            summary["sum"] += total
+            summary["count"] += count
+            monthly_summary[year_month] = monthly_summary.get(year_month, 0.0) + total
+    # Same order as the GROUP BY results
+    return dict(sorted(category_summary.items())), dict(sorted(history_summary.items())), dict(sorted(monthly_summary.items()))
+
+
+def _digest(value):
+    return hashlib.sha256(repr(value).encode("utf-8")).hexdigest()[:16]
+
+
+class DashboardCache:
+    """Dashboard summaries per (user_id, source, scope, "YYYY-MM", data version)
+
+    Entries live in an in-process LRU and, with a directory, in JSON files
+    shared by every worker process. A memory hit is checked against its file,
+    so an entry patched or dropped by another process is never served stale.
+    Writes go through patch() (new manual expenses) or invalidate(); storing
+    an entry for a new month or data version drops the user's older files.
+    Without a directory, writes only reach this process's entries, so it only
+    suits a single worker process.
+    """
+
+    def __init__(self, max_entries=1024, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self._entries = OrderedDict()  # key -> (summaries, file version or None)
+        self._generations = {}  # user_id -> writes seen, so summaries computed before a write are not stored
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "patches": 0, "invalidations": 0}
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key):
+        user_id, source, _, month, data_version = key
+        return os.path.join(self.directory, f"{user_id}-{source}-{_digest((month, data_version))}-{_digest(key)}.json")
+
+    def get(self, key):
+        """Cached (category, history, monthly) summaries for key, or None"""
+        version = self._version(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.directory is None or entry[1] == version):
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[0]
+        summaries = self._read(key) if version is not None else None
+        with self._lock:
+            if summaries is None:
+                self._entries.pop(key, None)
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            self._remember(key, summaries, version)
+        return summaries
+
+    def generation(self, user_id):
+        """Token to pass to put() for summaries computed from now on"""
+        with self._lock:
+            return self._generation(user_id)
+
+    def put(self, key, summaries, generation=None):
+        """Store summaries, unless the user's data was written since generation was taken"""
+        with self._lock:
+            if generation is not None and generation != self._generation(key[0]):
+                return
+            version = self._write(key, summaries)
+            if generation is not None and generation != self._generation(key[0]):
+                # Another process wrote the user's data while the file was written
+                self._remove(self.path_for(key))
+                return
+            self._remember(key, summaries, version)
+        if self.directory:
+            # Files of a past month or replaced upload are never asked for again
+            user_id, source, _, month, data_version = key
+            current = f"{user_id}-{source}-{_digest((month, data_version))}-"
+            for name in os.listdir(self.directory):
+                if name.startswith(f"{user_id}-{source}-") and not name.startswith(current):
+                    self._remove(os.path.join(self.directory, name))
+
+    def patch(self, user_id, partials):
+        """Apply new manual expenses, {("YYYY-MM", category): (total, count)}, to a user's entries"""
+        if not partials:
+            return
+        with self._lock:
+            self._written(user_id)
+            keys = [key for key in self._entries if key[0] == user_id and key[1] == "manual"]
+            if self.directory:
+                keys += [key for key in self._disk_keys(user_id, "manual") if key not in keys]
+            for key in keys:
+                entry = self._entries.get(key)
+                summaries = entry[0] if entry is not None and entry[1] == self._version(key) else self._read(key)
+                if summaries is None:
+                    self._entries.pop(key, None)
+                    continue
+                _, _, scope, month, _ = key
+                patched = patch_summaries(summaries, scope, month, partials)
+                self._remember(key, patched, self._write(key, patched))
+                self._stats["patches"] += 1
+
+    def invalidate(self, user_id, source=None):
+        """Drop a user's entries, for one source ("manual" or "csv") or all of them"""
+        with self._lock:
+            self._written(user_id)
+            for key in [key for key in self._entries if key[0] == user_id and source in (None, key[1])]:
+                del self._entries[key]
+            if self.directory:
+                prefix = f"{user_id}-{source}-" if source else f"{user_id}-"
+                for name in os.listdir(self.directory):
+                    if name.startswith(prefix):
+                        self._remove(os.path.join(self.directory, name))
+            self._stats["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def _remember(self, key, summaries, version):
+        self._entries[key] = (summaries, version)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _generation(self, user_id):
+        """Writes to the user's data seen by this process and, with a directory, by any process"""
+        return self._generations.get(user_id, 0), self._stat(self._marker_path(user_id))
+
+    def _written(self, user_id):
+        """Record a write to the user's data, so summaries computed before it are not stored"""
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        if self.directory:
+            path = self._marker_path(user_id)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            open(tmp_path, "w").close()
+            os.replace(tmp_path, path)
+
+    def _marker_path(self, user_id):
+        return os.path.join(self.directory, f"written-{user_id}") if self.directory else None
+
+    def _version(self, key):
+        """Identity of an entry's file: every write replaces it with a new inode"""
+        return self._stat(self.path_for(key)) if self.directory else None
+
+    @staticmethod
+    def _stat(path):
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _read(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self.path_for(key), encoding="utf-8") as f:
+                return tuple(json.load(f)["summaries"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write(self, key, summaries):
+        """Store an entry's file atomically; returns its version, or None without a directory"""
+        if not self.directory:
+            return None
+        path = self.path_for(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"key": list(key), "summaries": summaries}, f)
+        os.replace(tmp_path, path)
+        return self._version(key)
+
+    def _disk_keys(self, user_id, source):
+        prefix = f"{user_id}-{source}-"
+        keys = []
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                        keys.append(tuple(json.load(f)["key"]))
+                except (OSError, ValueError, KeyError):
+                    continue
+        return keys
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,88 @@
+import pandas as pd
+
+from models import db, ExpenseRollup
+
+INSERT_COLUMNS = ["user_id", "category", "amount", "date", "description", "description_hash"]
+
+INSERT_SQL = (
+    f"INSERT OR IGNORE INTO expense ({', '.join(INSERT_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in INSERT_COLUMNS)})"
+)
+
+EXISTING_SQL = (
+    "SELECT date, amount, description_hash FROM expense "
+    "WHERE user_id = ? AND date >= ? AND date <= ? AND description_hash IS NOT NULL"
+)
+
+
+def description_hashes(descriptions):
+    """Stable signed 64-bit hashes of descriptions, used as part of the dedup key"""
+    hashed = pd.util.hash_pandas_object(descriptions.fillna("").astype(str), index=False)
+    return hashed.to_numpy().view("int64")
+
+
+def prepare_chunk(user_id, chunk):
+    """Turn a categorized upload chunk into deduplicated rows for the expense table"""
+    rows = pd.DataFrame({
+        "user_id": user_id,
+        "category": chunk["category"].astype(str).str.strip().str.lower(),
+        "amount": chunk["amount"].astype("float64"),
+        "date": chunk["date"].dt.strftime("%Y-%m-%d"),
+        "description": chunk["description"].astype(object),
+    }).dropna(subset=["amount", "date"])
+    rows["description_hash"] = description_hashes(rows["description"])
+    return rows.drop_duplicates(["date", "amount", "description_hash"])
+
+
+def drop_existing(cursor, user_id, rows):
+    """Remove rows whose dedup key is already stored for the user"""
+    existing = set(cursor.execute(EXISTING_SQL, (user_id, rows["date"].min(), rows["date"].max())).fetchall())
+    if not existing:
+        return rows
+    keys = zip(rows["date"].tolist(), rows["amount"].tolist(), rows["description_hash"].tolist())
+    return rows[[key not in existing for key in keys]]
+
+
+def rollup_partials(user_id, rows):
+    """Per (user, month, category) total/count/min/max of the inserted rows"""
+    grouped = rows.groupby([rows["date"].str[:7], rows["category"]])["amount"].agg(["sum", "count", "min", "max"])
+    return {
+        (user_id, year_month, category): (float(total), int(count), float(low), float(high))
+        for (year_month, category), (total, count, low, high) in grouped.iterrows()
+    }
+
+
+def import_expenses(user_id, frames, chunk_size=50_000):
+    """Import categorized upload frames into a user's expenses in one transaction
+
+    Rows are deduplicated on (user, date, amount, description hash), both
+    within the upload and against previously imported rows, inserted in
+    date order with one executemany per chunk, and folded into the monthly
+    rollups. Returns (inserted, skipped).
+    """
+    # Raw DB-API cursor on the session's connection: same transaction, no ORM/Core overhead
+    cursor = db.session.connection().connection.cursor()
+    inserted = skipped = 0
+    try:
+        for frame in frames:
+            # Date-ordered chunks keep the dedup lookups narrow and the index inserts local
+            frame = frame.sort_values("date", kind="stable")
+            for start in range(0, len(frame), chunk_size):
+                chunk = frame.iloc[start:start + chunk_size]
+                rows = prepare_chunk(user_id, chunk)
+                if not rows.empty:
+                    rows = drop_existing(cursor, user_id, rows)
+                skipped += len(chunk) - len(rows)
+                if rows.empty:
+                    continue
+
+                cursor.executemany(INSERT_SQL, zip(*(rows[column].tolist() for column in INSERT_COLUMNS)))
+                ExpenseRollup.apply_partials(rollup_partials(user_id, rows))
+                inserted += len(rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        cursor.close()
+    return inserted, skipped
@@ -0,0 +1,71 @@
+import numpy as np
+from sqlalchemy import func
+
+from models import db, Expense
+
+# julianday() of 1970-01-01 00:00, so day numbers line up with numpy's datetime64[D]
+EPOCH_JULIAN_DAY = 2440587.5
+
+
+class ExpenseStore:
+    """Expenses as parallel NumPy arrays instead of ORM objects or row dicts
+
+    days holds int32 days since 1970-01-01, amounts float64 and codes uint16
+    indexes into categories (dictionary encoding). That is 14 bytes per
+    expense plus one string per distinct category.
+    """
+
+    def __init__(self, days, amounts, codes, categories):
+        self.days = days
+        self.amounts = amounts
+        self.codes = codes
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def nbytes(self):
+        return self.days.nbytes + self.amounts.nbytes + self.codes.nbytes
+
+    @classmethod
+    def load(cls, user_id, start=None, end=None, chunk_size=65536):
+        """A user's expenses with start <= date < end, read as plain SQL tuples in chunks"""
+        day = db.cast(func.julianday(Expense.date) - EPOCH_JULIAN_DAY, db.Integer)
+        stmt = db.select(Expense.category, Expense.amount, day).where(Expense.user_id == user_id)
+        if start is not None:
+            stmt = stmt.where(Expense.date >= start)
+        if end is not None:
+            stmt = stmt.where(Expense.date < end)
+        result = db.session.execute(stmt.execution_options(yield_per=chunk_size))
+        return cls.from_rows(result.partitions())
+
+    @classmethod
+    def from_rows(cls, chunks):
+        """Build from chunks of (category, amount, day number) tuples"""
+        index = {}
+        days, amounts, codes = [], [], []
+        for chunk in chunks:
+            if not chunk:
+                continue
+            chunk_categories, chunk_amounts, chunk_days = zip(*chunk)
+            codes.append(np.fromiter((index.setdefault(c, len(index)) for c in chunk_categories), np.uint32, len(chunk)))
+            amounts.append(np.array(chunk_amounts, dtype=np.float64))
+            days.append(np.array(chunk_days, dtype=np.int32))
+        if not days:
+            return cls(np.empty(0, np.int32), np.empty(0, np.float64), np.empty(0, np.uint16), [])
+        codes = np.concatenate(codes)
+        # uint16 holds every realistic category list; wider only if a user somehow has more
+        if len(index) <= np.iinfo(np.uint16).max + 1:
+            codes = codes.astype(np.uint16)
+        return cls(np.concatenate(days), np.concatenate(amounts), codes, list(index))
+
+    def to_frame(self):
+        """DataFrame with category (categorical), amount and date (datetime64) columns"""
+        import pandas as pd
+
+        return pd.DataFrame({
+            "category": pd.Categorical.from_codes(self.codes.astype(np.int32), self.categories).remove_unused_categories(),
+            "amount": self.amounts,
+            "date": self.days.astype("datetime64[D]").astype("datetime64[ns]"),
+        })
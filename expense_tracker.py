@@ -1,7 +1,232 @@
 import pandas as pd
-import matplotlib.pyplot as plt
+import numpy as np
 from datetime import datetime
 import os
+import re
+
+from aggregates import ExpenseAggregates
+from charts import render_category_chart, render_trend_chart
+from csv_schema import detect_schema
+
+
+class CategoryMatcher:
+    """Compiled keyword rules, built once from an ordered category dict.
+
+    Each category becomes a single alternation regex. Categories are tried in
+    dict order and the first one with any matching keyword wins, which is the
+    same priority as the original nested keyword loop.
+    """
+
+    def __init__(self, categories, default='miscellaneous'):
+        self.default = default
+        self.signature = self.signature_of(categories)
+        self.patterns = [
+            (category, re.compile('|'.join(re.escape(k) for k in keywords)))
+            for category, keywords in categories.items()
+            if keywords
+        ]
+
+    @staticmethod
+    def signature_of(categories):
+        return tuple((category, tuple(keywords)) for category, keywords in categories.items())
+
+    def match_values(self, values):
+        """Return the category for each already-lowercased string in values"""
+        values = pd.Series(values, dtype=object)
+        result = np.full(len(values), self.default, dtype=object)
+        unassigned = np.ones(len(values), dtype=bool)
+        for category, pattern in self.patterns:
+            if not unassigned.any():
+                break
+            hits = values[unassigned].str.contains(pattern, regex=True).to_numpy(dtype=bool)
+            idx = np.flatnonzero(unassigned)[hits]
+            result[idx] = category
+            unassigned[idx] = False
+        return result
+
+    def categorize(self, descriptions):
+        """Categorize a description Series, matching each distinct value only once"""
+        codes, uniques = pd.factorize(descriptions, use_na_sentinel=False)
+        lowered = [str(value).lower() for value in uniques]
+        categories = self.match_values(lowered)
+        return pd.Series(categories[codes], index=descriptions.index, name='category')
+
+
+# Outlier detectors. Each takes the expense frame plus a threshold and returns
+# (baseline, mask): the per-row reference amount reported as category_avg and a
+# boolean Series marking unusual rows. Everything is computed with groupby
+# transforms over 'category', so no detector loops over rows in Python.
+
+def detect_mean_factor(df, threshold=2.0):
+    """Flag amounts above threshold times their category mean"""
+    baseline = df.groupby('category')['amount'].transform('mean')
+    return baseline, df['amount'] > baseline * threshold
+
+
+def detect_median_mad(df, threshold=3.5):
+    """Flag amounts whose robust z-score (median/MAD) exceeds threshold"""
+    groups = df.groupby('category')['amount']
+    baseline = groups.transform('median')
+    deviation = df['amount'] - baseline
+    mad = deviation.abs().groupby(df['category']).transform('median')
+    robust_z = 0.6745 * deviation / mad.replace(0, np.nan)
+    return baseline, robust_z > threshold
+
+
+def detect_rolling_zscore(df, threshold=3.0, window=30, min_periods=5):
+    """Flag amounts far above the rolling mean of earlier expenses in the same category
+
+    The window covers the previous `window` expenses of the category by date.
+    Window sums come from prefix sums over the (category, date) ordering, with
+    amounts centred on their category mean to keep the sums well conditioned.
+    """
+    codes = pd.factorize(df['category'])[0]
+    order = np.lexsort((df['date'].to_numpy(), codes))
+    codes = codes[order]
+    amounts = df['amount'].to_numpy(dtype=float)[order]
+    category_mean = pd.Series(amounts).groupby(codes).transform('mean').to_numpy()
+    centred = amounts - category_mean
+
+    valid = ~np.isnan(centred)
+    centred = np.where(valid, centred, 0.0)
+    zero = np.zeros(1)
+    total = np.concatenate([zero, np.cumsum(centred)])
+    squares = np.concatenate([zero, np.cumsum(centred ** 2)])
+    counts = np.concatenate([zero, np.cumsum(valid)])
+
+    positions = np.arange(len(order))
+    starts = np.maximum.accumulate(np.where(np.r_[True, codes[1:] != codes[:-1]], positions, 0))
+    lo = np.maximum(starts, positions - window)
+    n = counts[positions] - counts[lo]
+    window_sum = total[positions] - total[lo]
+    window_sq = squares[positions] - squares[lo]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = window_sum / n
+        std = np.sqrt(np.maximum(window_sq - window_sum * mean, 0.0) / (n - 1))
+        z = (centred - mean) / np.where(std > 0, std, np.nan)
+    enough = n >= max(min_periods, 2)
+
+    baseline = np.full(len(order), np.nan)
+    flagged = np.zeros(len(order), dtype=bool)
+    baseline[order] = np.where(enough, category_mean + mean, np.nan)
+    flagged[order] = enough & valid & (z > threshold)
+    return pd.Series(baseline, index=df.index), pd.Series(flagged, index=df.index)
+
+
+def detect_iqr(df, threshold=1.5):
+    """Flag amounts above Q3 + threshold * IQR of their category"""
+    groups = df.groupby('category')['amount']
+    q1 = groups.transform('quantile', 0.25)
+    q3 = groups.transform('quantile', 0.75)
+    baseline = groups.transform('median')
+    return baseline, df['amount'] > q3 + threshold * (q3 - q1)
+
+
+UNUSUAL_DETECTORS = {
+    'mean': detect_mean_factor,
+    'mad': detect_median_mad,
+    'zscore': detect_rolling_zscore,
+    'iqr': detect_iqr,
+}
+
+UNUSUAL_COLUMNS = ['date', 'description', 'amount', 'category', 'category_avg', 'times_above_avg']
+
+# Columns of every loaded frame, whatever the source file called them
+REQUIRED_COLUMNS = ['date', 'amount', 'description']
+
+# Explicit dtypes for streaming ingestion: repeated descriptions are stored once
+# per chunk as categoricals. Amounts stay float64: float32 turns 1234.57 into
+# 1234.5699462890625, which then reaches summaries, imports and dedup keys.
+STREAM_DTYPES = {'description': 'category', 'amount': 'float64'}
+
+
+def schema_read_options(schema, dtype=None):
+    """pd.read_csv arguments reading only the mapped columns of a csv_schema schema
+
+    dtype maps roles ('description', ...) to the dtype to read them with.
+    """
+    columns = dict(schema['columns'], credit=None)  # Credits are money coming in, never read
+    amount_columns = [columns[role] for role in ('amount', 'debit') if columns[role] is not None]
+    # Dates stay text for pd.to_datetime, so a thousands separator such as '.' cannot turn them into numbers
+    dtypes = {columns['date']: str}
+    dtypes.update({columns[role]: value for role, value in (dtype or {}).items() if role in ('date', 'description')})
+    options = {
+        'sep': schema['delimiter'],
+        'encoding': schema['encoding'],
+        'skiprows': schema['skiprows'],
+        'header': 0 if schema['header'] else None,
+        'usecols': [name for name in columns.values() if name is not None],
+    }
+    if schema['clean_amounts']:
+        dtypes.update({name: str for name in amount_columns})
+    else:
+        options['decimal'] = schema['decimal']
+        options['thousands'] = schema['thousands']
+    options['dtype'] = dtypes
+    return options
+
+
+def parse_amounts(values, schema):
+    """Amounts written with currency symbols, separators or (parentheses) as floats"""
+    text = values.astype('string').str.strip()
+    negative = ((text.str.startswith('(') & text.str.endswith(')')) | text.str.endswith('-')).fillna(False)
+    text = text.str.replace(r'[^\d.,\-]', '', regex=True).str.rstrip('-')
+    if schema['thousands']:
+        text = text.str.replace(schema['thousands'], '', regex=False)
+    numbers = pd.to_numeric(text.str.replace(schema['decimal'], '.', regex=False), errors='coerce').astype('float64')
+    return numbers.where(~negative, -numbers.abs())
+
+
+def parse_dates(values, date_format=None):
+    """Parse a Series of date strings, converting each distinct value only once
+
+    Statements repeat a few thousand dates over many rows, and pd.to_datetime
+    runs strptime on every row for formats other than ISO 8601. Without a
+    format, pandas infers it and raises on values it cannot parse.
+    """
+    codes, uniques = pd.factorize(values)
+    if date_format:
+        parsed = pd.to_datetime(pd.Series(uniques), format=date_format, errors='coerce')
+    else:
+        parsed = pd.to_datetime(pd.Series(uniques))
+    # Missing values have code -1, which picks the NaT appended at the end
+    dates = np.append(parsed.to_numpy(), np.datetime64('NaT'))[codes]
+    return pd.Series(dates, index=values.index, name=values.name)
+
+
+def apply_schema(frame, schema):
+    """Turn a frame read with schema_read_options() into date, amount and description columns
+
+    A single signed amount column is kept as it is, so refunds net against
+    spending, unless the schema says the bank writes spending as negative:
+    then it is flipped and the rows left negative (salary, refunds) are
+    dropped. With split debit and credit columns, only rows with a debit are
+    kept.
+    """
+    columns = schema['columns']
+    
+    def amounts(role):
+        values = frame[columns[role]]
+        if schema['clean_amounts']:
+            return parse_amounts(values, schema)
+        return pd.to_numeric(values, errors='coerce')
+    
+    if columns['amount'] is None:
+        amount = amounts('debit').abs()
+        spending = amount > 0
+    elif schema['amount_sign'] < 0:
+        amount = -amounts('amount')
+        spending = ~(amount < 0)
+    else:
+        amount = amounts('amount')
+        spending = pd.Series(True, index=frame.index)
+    
+    dates = parse_dates(frame[columns['date']], schema['date_format'])
+    df = pd.DataFrame({'date': dates, 'amount': amount, 'description': frame[columns['description']]},
+                      columns=REQUIRED_COLUMNS)
+    return df[spending].reset_index(drop=True)
+
 
 class ExpenseTracker:
     def __init__(self):
@@ -20,26 +245,33 @@ class ExpenseTracker:
             'personal care': ['haircut', 'salon', 'spa', 'gym'],
             'miscellaneous': []
         }
+        self._matcher = None
+        # Set by stream_data(): a callable re-yielding the chunks, and their folded aggregates.
+        # For loaded data, aggregates and unusual expenses are memoized until the
+        # data or the categorization changes (see _invalidate).
+        self.stream_source = None
+        self.aggregates = None
+        self._unusual_cache = {}
     
-    def load_data(self, file_path):
-        """Load expense data from CSV file"""
+    def get_matcher(self):
+        """Return the compiled category matcher, rebuilding it only if the rules changed"""
+        signature = CategoryMatcher.signature_of(self.categories)
+        if self._matcher is None or self._matcher.signature != signature:
+            self._matcher = CategoryMatcher(self.categories)
+        return self._matcher
+    
+    def load_data(self, file_path, schema=None):
+        """Load expense data from CSV file
+
+        schema comes from csv_schema (detect_schema() or SchemaCache.resolve());
+        it is detected from the start of the file when not given.
+        """
         try:
-            self.df = pd.read_csv(file_path)
-            
-            # Check if required columns exist
-            required_cols = ['date', 'amount', 'description']
-            missing_cols = [col for col in required_cols if col not in self.df.columns]
-            
-            if missing_cols:
-                print(f"Error: Missing required columns: {', '.join(missing_cols)}")
-                print(f"Available columns: {', '.join(self.df.columns)}")
-                return False
-            
-            # Convert date to datetime
-            self.df['date'] = pd.to_datetime(self.df['date'])
-            
-            # Ensure amount is numeric
-            self.df['amount'] = pd.to_numeric(self.df['amount'], errors='coerce')
+            schema = schema or detect_schema(file_path)
+            # Read only the mapped columns, with the detected delimiter, number style and date format
+            self.df = apply_schema(pd.read_csv(file_path, **schema_read_options(schema)), schema)
+            self.stream_source = None
+            self._invalidate()
             
             # Add month and year columns for easier analysis
             self.df['month'] = self.df['date'].dt.month
@@ -51,21 +283,107 @@ class ExpenseTracker:
             print(f"Error loading data: {e}")
             return False
     
+    def iter_chunks(self, file_path, schema, chunksize=100_000, progress=None):
+        """Yield categorized chunks of a CSV file read with a schema and explicit dtypes
+
+        progress, if given, is called after every chunk with
+        (rows_read, bytes_read, total_bytes).
+        """
+        total_bytes = os.path.getsize(file_path)
+        rows_read = 0
+        with open(file_path, 'rb') as handle:
+            reader = pd.read_csv(
+                handle,
+                chunksize=chunksize,
+                **schema_read_options(schema, dtype=STREAM_DTYPES),
+            )
+            for chunk in reader:
+                chunk = apply_schema(chunk, schema)
+                chunk['amount'] = chunk['amount'].astype(STREAM_DTYPES['amount'])
+                chunk['category'] = self.get_matcher().categorize(chunk['description'])
+                rows_read += len(chunk)
+                if progress is not None:
+                    progress(rows_read, handle.tell(), total_bytes)
+                yield chunk
+    
+    def stream_data(self, file_path, chunksize=100_000, schema=None, progress=None, sink=None):
+        """Load and categorize a CSV chunk by chunk, keeping only aggregates in memory
+
+        Unlike load_data(), the rows are not kept in self.df: each chunk is folded
+        into self.aggregates, so memory stays bounded by the chunk size and the
+        number of (year, month, category) groups. Custom category rules must be
+        added before calling this. sink, if given, receives every categorized
+        chunk of this first pass (e.g. to write a cache entry). schema is
+        detected from the start of the file when not given, as in load_data().
+        """
+        try:
+            schema = schema or detect_schema(file_path)
+            return self.stream_chunks(
+                lambda: self.iter_chunks(file_path, schema, chunksize, progress), sink
+            )
+        except Exception as e:
+            print(f"Error loading data: {e}")
+            return False
+    
+    def stream_chunks(self, source, sink=None):
+        """Fold the categorized chunks yielded by source() into self.aggregates
+
+        source is kept so the rows can be streamed again later, e.g. for unusual
+        expenses or after the category rules change.
+        """
+        aggregates = ExpenseAggregates()
+        for chunk in source():
+            if sink is not None:
+                sink(chunk)
+            aggregates = aggregates.combine(ExpenseAggregates.from_frame(chunk))
+        
+        self.df = None
+        self.stream_source = source
+        self._invalidate()
+        self.aggregates = aggregates
+        print(f"Successfully streamed {aggregates.records} expense records")
+        return True
+    
+    def load_frame(self, df):
+        """Use an already parsed and categorized frame, e.g. from the upload cache"""
+        if 'year' not in df.columns or 'month' not in df.columns:
+            df['month'] = df['date'].dt.month
+            df['year'] = df['date'].dt.year
+        self.df = df
+        self.stream_source = None
+        self._invalidate()
+    
+    def _invalidate(self):
+        """Forget memoized aggregates after the data or its categories change"""
+        self.aggregates = None
+        self._unusual_cache = {}
+    
+    def _has_summaries(self):
+        if self.df is not None:
+            return 'category' in self.df.columns
+        return self.aggregates is not None
+    
+    def get_aggregates(self):
+        """Return the year/month/category aggregates, computing them in one pass if needed
+
+        Summaries, charts and the report all read from this object instead of
+        grouping self.df themselves.
+        """
+        if not self._has_summaries():
+            print("Data not loaded or expenses not categorized yet")
+            return None
+        if self.aggregates is None:
+            self.aggregates = ExpenseAggregates.from_frame(self.df)
+        return self.aggregates
+    
     def categorize_expenses(self):
         """Categorize expenses based on description keywords"""
         if self.df is None:
             print("No data loaded. Please load data first.")
             return
         
-        def assign_category(description):
-            description = str(description).lower()
-            for category, keywords in self.categories.items():
-                for keyword in keywords:
-                    if keyword in description:
-                        return category
-            return 'miscellaneous'
-        
-        self.df['category'] = self.df['description'].apply(assign_category)
+        self.df['category'] = self.get_matcher().categorize(self.df['description'])
+        self._invalidate()
         print("Expenses categorized successfully")
     
     def add_custom_category_rules(self, rules_dict):
@@ -81,132 +399,168 @@ class ExpenseTracker:
         # Re-categorize if data is already loaded
         if self.df is not None:
             self.categorize_expenses()
+        elif self.stream_source is not None:
+            source = self.stream_source
+            matcher = self.get_matcher()
+            
+            def recategorized():
+                for chunk in source():
+                    chunk['category'] = matcher.categorize(chunk['description'])
+                    yield chunk
+            
+            self.stream_chunks(recategorized)
     
     def get_monthly_summary(self):
         """Generate monthly expense summary"""
-        if self.df is None or 'category' not in self.df.columns:
+        if not self._has_summaries():
             print("Data not loaded or expenses not categorized yet")
             return None
         
-        monthly_summary = self.df.groupby(['year', 'month', 'category'])['amount'].sum().reset_index()
-        return monthly_summary
+        return self.get_aggregates().monthly_summary()
     
     def get_category_summary(self):
         """Generate summary by category"""
-        if self.df is None or 'category' not in self.df.columns:
+        if not self._has_summaries():
             print("Data not loaded or expenses not categorized yet")
             return None
         
-        category_summary = self.df.groupby('category')['amount'].agg(['sum', 'mean', 'count']).reset_index()
-        category_summary = category_summary.sort_values('sum', ascending=False)
-        return category_summary
+        return self.get_aggregates().category_summary()
     
-    def plot_expenses_by_category(self):
-        """Plot expenses by category"""
-        if self.df is None or 'category' not in self.df.columns:
+    def plot_expenses_by_category(self, path=None):
+        """Render the total-per-category bar chart as PNG bytes, saved to path if given"""
+        if not self._has_summaries():
             print("Data not loaded or expenses not categorized yet")
-            return
-        
-        plt.figure(figsize=(12, 6))
-        category_totals = self.df.groupby('category')['amount'].sum().sort_values(ascending=False)
-        category_totals.plot(kind='bar', color='skyblue')
-        plt.title('Total Expenses by Category')
-        plt.xlabel('Category')
-        plt.ylabel('Amount')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig('static/images/expenses_by_category.png')
-        plt.close()
-        print("Plot saved as 'expenses_by_category.png'")
-    
-    def plot_monthly_trend(self):
-        """Plot monthly expense trend"""
-        if self.df is None:
-            print("No data loaded. Please load data first.")
-            return
+            return None
         
-        plt.figure(figsize=(12, 6))
-        monthly_data = self.df.groupby(['year', 'month'])['amount'].sum().reset_index()
-        monthly_data['date'] = monthly_data.apply(lambda x: datetime(int(x['year']), int(x['month']), 1), axis=1)
-        monthly_data = monthly_data.sort_values('date')
+        png = render_category_chart(self.category_totals())
+        if path:
+            with open(path, 'wb') as f:
+                f.write(png)
+            print(f"Plot saved as '{path}'")
+        return png
+    
+    def plot_monthly_trend(self, path=None):
+        """Render the monthly total line chart as PNG bytes, saved to path if given"""
+        if not self._has_summaries():
+            print("Data not loaded or expenses not categorized yet")
+            return None
         
-        plt.plot(monthly_data['date'], monthly_data['amount'], marker='o', linestyle='-')
-        plt.title('Monthly Expense Trend')
-        plt.xlabel('Month')
-        plt.ylabel('Total Expenses')
-        plt.grid(True, linestyle='--', alpha=0.7)
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig('static/images/monthly_expense_trend.png')
-        plt.close()
-        print("Plot saved as 'monthly_expense_trend.png'")
-    
-    def identify_unusual_expenses(self, threshold_factor=2.0):
-        """Identify unusually large expenses"""
-        if self.df is None or 'category' not in self.df.columns:
+        png = render_trend_chart(self.monthly_totals())
+        if path:
+            with open(path, 'wb') as f:
+                f.write(png)
+            print(f"Plot saved as '{path}'")
+        return png
+    
+    def category_totals(self):
+        """{category: total amount}, largest first"""
+        summary = self.get_aggregates().category_summary()
+        return dict(zip(summary['category'].astype(str), summary['sum'].astype(float)))
+    
+    def monthly_totals(self):
+        """{"YYYY-MM": total amount}, in chronological order"""
+        monthly = self.get_aggregates().monthly_totals()
+        return {
+            f"{year:04d}-{month:02d}": float(amount)
+            for year, month, amount in zip(monthly['year'], monthly['month'], monthly['amount'])
+        }
+    
+    def identify_unusual_expenses(self, threshold_factor=None, method='mean', **options):
+        """Identify unusually large expenses with one of UNUSUAL_DETECTORS
+
+        threshold_factor is passed to the detector as its threshold; when omitted
+        the detector's own default is used (2x the category mean for 'mean').
+        After stream_data() only 'mean' is available; it re-reads the file in
+        chunks against the folded category means.
+        """
+        if not self._has_summaries():
             print("Data not loaded or expenses not categorized yet")
             return None
         
-        # Calculate average expense amount by category
-        category_avg = self.df.groupby('category')['amount'].mean()
+        if method not in UNUSUAL_DETECTORS:
+            print(f"Unknown detector '{method}'. Available: {', '.join(UNUSUAL_DETECTORS)}")
+            return None
         
-        # Find expenses that exceed the category average by the threshold factor
-        unusual_expenses = []
-        for _, row in self.df.iterrows():
-            category = row['category']
-            amount = row['amount']
-            avg = category_avg[category]
-            
-            if amount > avg * threshold_factor:
-                unusual_expenses.append({
-                    'date': row['date'].strftime('%Y-%m-%d'),
-                    'description': row['description'],
-                    'amount': amount,
-                    'category': category,
-                    'category_avg': avg,
-                    'times_above_avg': amount / avg
-                })
+        if threshold_factor is not None:
+            options['threshold'] = threshold_factor
+        
+        key = (method, tuple(sorted(options.items())))
+        if key in self._unusual_cache:
+            return self._unusual_cache[key].copy()
         
-        unusual_df = pd.DataFrame(unusual_expenses)
-        if len(unusual_df) > 0:
+        if self.df is None:
+            if method != 'mean':
+                print(f"Detector '{method}' needs the rows in memory; use load_data() instead of stream_data()")
+                return None
+            unusual_df = self._stream_unusual_expenses(**options)
+        else:
+            baseline, mask = UNUSUAL_DETECTORS[method](self.df, **options)
+            unusual_df = self._unusual_frame(self.df, baseline, mask)
             unusual_df = unusual_df.sort_values('times_above_avg', ascending=False)
         
-        return unusual_df
+        self._unusual_cache[key] = unusual_df
+        return unusual_df.copy()
+    
+    def _stream_unusual_expenses(self, threshold=2.0):
+        category_avg = self.aggregates.category_stats()['mean']
+        frames = []
+        for chunk in self.stream_source():
+            baseline = chunk['category'].map(category_avg)
+            frames.append(self._unusual_frame(chunk, baseline, chunk['amount'] > baseline * threshold))
+        if not frames:
+            return pd.DataFrame(columns=UNUSUAL_COLUMNS)
+        unusual_df = pd.concat(frames, ignore_index=True)
+        return unusual_df.sort_values('times_above_avg', ascending=False)
+    
+    @staticmethod
+    def _unusual_frame(df, baseline, mask):
+        mask = mask.fillna(False).astype(bool)
+        flagged = df.loc[mask]
+        avg = baseline[mask]
+        return pd.DataFrame({
+            'date': flagged['date'].dt.strftime('%Y-%m-%d'),
+            'description': flagged['description'].astype(object),
+            'amount': flagged['amount'].astype('float64'),
+            'category': flagged['category'],
+            'category_avg': avg,
+            'times_above_avg': flagged['amount'] / avg,
+        }, columns=UNUSUAL_COLUMNS).reset_index(drop=True)
     
     def generate_report(self, output_file='expense_report.txt'):
         """Generate a comprehensive expense report"""
-        if self.df is None or 'category' not in self.df.columns:
-            print("Data not loaded or expenses not categorized yet")
+        aggregates = self.get_aggregates()
+        if aggregates is None:
             return
         
         with open(output_file, 'w') as f:
             f.write("===== EXPENSE ANALYSIS REPORT =====\n\n")
             
+            monthly_data = aggregates.monthly_totals()
+            
             # Overall summary
             f.write("OVERALL SUMMARY:\n")
-            f.write(f"Total Records: {len(self.df)}\n")
-            f.write(f"Date Range: {self.df['date'].min().strftime('%Y-%m-%d')} to {self.df['date'].max().strftime('%Y-%m-%d')}\n")
-            f.write(f"Total Expenses: ${self.df['amount'].sum():.2f}\n")
-            f.write(f"Average Monthly Expenses: ${self.df.groupby(['year', 'month'])['amount'].sum().mean():.2f}\n\n")
+            f.write(f"Total Records: {aggregates.records}\n")
+            f.write(f"Date Range: {aggregates.date_min.strftime('%Y-%m-%d')} to {aggregates.date_max.strftime('%Y-%m-%d')}\n")
+            f.write(f"Total Expenses: ${aggregates.total:.2f}\n")
+            f.write(f"Average Monthly Expenses: ${monthly_data['amount'].mean():.2f}\n\n")
             
             # Category summary
             f.write("CATEGORY SUMMARY:\n")
-            category_summary = self.get_category_summary()
+            category_summary = aggregates.category_summary()
             for _, row in category_summary.iterrows():
                 f.write(f"{row['category'].capitalize()}: ${row['sum']:.2f} ({row['count']} transactions, avg ${row['mean']:.2f})\n")
             f.write("\n")
             
             # Monthly breakdown
             f.write("MONTHLY BREAKDOWN:\n")
-            monthly_data = self.df.groupby(['year', 'month'])['amount'].sum().reset_index()
-            for _, row in monthly_data.sort_values(['year', 'month']).iterrows():
+            for _, row in monthly_data.iterrows():
                 month_name = datetime(int(row['year']), int(row['month']), 1).strftime('%B %Y')
                 f.write(f"{month_name}: ${row['amount']:.2f}\n")
             f.write("\n")
             
             # Top expenses
             f.write("TOP 10 LARGEST EXPENSES:\n")
-            top_expenses = self.df.sort_values('amount', ascending=False).head(10)
+            top_expenses = aggregates.top_expenses(10)
             for i, (_, row) in enumerate(top_expenses.iterrows(), 1):
                 f.write(f"{i}. ${row['amount']:.2f} - {row['description']} ({row['date'].strftime('%Y-%m-%d')}) - {row['category'].capitalize()}\n")
             f.write("\n")
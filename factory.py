@@ -0,0 +1,63 @@
+import os
+from datetime import timedelta
+
+from flask import Flask
+from flask_login import LoginManager
+
+from models import db, User
+
+login_manager = LoginManager()
+login_manager.login_view = "login"
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    return User.query.get(int(user_id))
+
+
+def create_app(config=None):
+    """The configured Flask app with its database and login manager, without any routes
+
+    Only Flask and the models are imported, so scripts that just need the
+    database (create_database.py, upload workers) skip the analysis stack.
+    """
+    app = Flask(__name__)
+    app.secret_key = "s3cr3t"  # Change this to a random secret key
+    app.config["UPLOAD_FOLDER"] = "uploads"
+    app.config["MAX_CONTENT_LENGTH"] = 512 * 1024 * 1024  # 512MB max upload
+    app.config["STREAMING_THRESHOLD"] = 16 * 1024 * 1024  # Stream CSVs larger than 16MB in chunks
+    app.config["ALLOWED_EXTENSIONS"] = {"csv", "zip"}  # Zip archives of CSVs are extracted
+    app.config["UPLOAD_CACHE_FOLDER"] = os.path.join("uploads", "cache")
+    app.config["UPLOAD_CACHE_MAX_BYTES"] = 1024 * 1024 * 1024  # 1GB of parsed uploads
+    app.config["UPLOAD_CACHE_MAX_AGE"] = 7 * 24 * 3600  # Evict parsed uploads after a week
+    app.config["SCHEMA_CACHE_FOLDER"] = os.path.join("uploads", "schemas")  # Detected CSV layouts, one per bank header
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///users.db"
+    app.config["UPLOAD_RESULT_TTL"] = timedelta(days=1)  # How long upload summaries stay retrievable
+    app.config["UNUSUAL_RESULTS_LIMIT"] = 1000  # Largest unusual expenses kept per upload
+    app.config["UPLOAD_WORKERS"] = None  # Upload worker processes (None: one per CPU)
+    app.config["UPLOAD_JOBS_INLINE"] = False  # Process uploads inside the request instead
+    app.config["AGENT_POOL_SIZE"] = 32  # Chat agents kept ready for reuse
+    app.config["AGENT_POOL_TTL"] = 30 * 60  # Seconds an unused chat agent is kept
+    app.config["AGENT_COMPACT_CONTEXT"] = True  # Give the LLM aggregates unless a question needs rows
+    app.config["AGENT_CONTEXT_TOKENS"] = 1500  # Token budget of the compact context
+    app.config["ANSWER_CACHE_ENTRIES"] = 2048  # Assistant answers kept for repeated questions
+    app.config["ANSWER_CACHE_WARM"] = 50  # Past answers loaded from the chat history per data set
+    app.config["CHAT_STREAM_CONCURRENCY"] = 4  # LLM answers generated at the same time
+    app.config["CHAT_STREAM_TIMEOUT"] = 60  # Seconds before a streamed answer is cancelled
+    app.config["CHAT_RECENT_LIMIT"] = 20  # Exchanges shown on the chat page
+    app.config["CHAT_HISTORY_PAGE_SIZE"] = 50  # Entries per history page
+    app.config["SEARCH_RESULTS_LIMIT"] = 20  # Matches shown per search and kind
+    app.config["DASHBOARD_CACHE_ENTRIES"] = 1024  # Dashboard summaries kept in memory
+    app.config["DASHBOARD_CACHE_FOLDER"] = os.path.join("uploads", "dashboard")  # Shared by worker processes (None: one process only)
+    app.config["CHART_CACHE_ENTRIES"] = 256  # Rendered chart images kept in memory
+    app.config["SERVER_CHARTS"] = False  # Also show server-rendered PNG charts of uploads
+    app.config["CHART_MAX_AGE"] = 60  # Seconds browsers may reuse a chart before revalidating
+    if config:
+        app.config.update(config)
+
+    db.init_app(app)
+    login_manager.init_app(app)
+
+    # Create upload folder if it doesn't exist
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+    return app
@@ -0,0 +1,279 @@
+import re
+import threading
+from datetime import date
+
+MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+
+# Full month names and their abbreviations only, so "market" or "junk" is not a month
+MONTH_RE = re.compile(
+    r"\b(this month|last month|previous month|"
+    r"(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|"
+    r"oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?(?:\s+(\d{4}))?)\b"
+)
+# "may" is usually the verb: it names the month only with a year or right after "in" / "of"
+MAY_PREFIX_RE = re.compile(r"\b(?:in|of)\s+$")
+COUNT_RE = re.compile(r"\btop\s+(\d+)\b|\b(\d+)\s+(?:largest|biggest|highest|top)\b")
+
+
+class ExpenseData:
+    """
+    What the local intents answer from: per-month category totals and,
+    where available, the expense rows of the month being discussed.
+
+    month_totals is a callable (year, month) -> {category: total}; without it
+    totals are grouped from df. month is the (year, month) questions default to.
+    """
+
+    def __init__(self, df=None, month_totals=None, budget=None, month=None):
+        self.df = df if df is not None and not df.empty else None
+        if self.df is not None:
+            import pandas as pd
+
+            self.df = self.df.assign(date=pd.to_datetime(self.df["date"]))
+        self.month_totals = month_totals
+        self.budget = budget
+        if month is None:
+            today = date.today()
+            month = (today.year, today.month)
+        self.month = month
+
+    def totals(self, year, month):
+        """Category totals of a month as a Series, largest first"""
+        import pandas as pd
+
+        if self.month_totals is not None:
+            totals = pd.Series(self.month_totals(year, month), dtype="float64")
+        else:
+            rows = self.rows(year, month)
+            totals = rows.groupby("category")["amount"].sum() if rows is not None else pd.Series(dtype="float64")
+        return totals.sort_values(ascending=False)
+
+    def rows(self, year, month):
+        """Expense rows of a month, or None when rows are not available"""
+        if self.df is None:
+            return None
+        dates = self.df["date"]
+        return self.df[(dates.dt.year == year) & (dates.dt.month == month)]
+
+
+def month_label(year, month):
+    return f"{MONTHS[month - 1].capitalize()} {year}"
+
+
+def shift_month(year, month, months):
+    index = year * 12 + (month - 1) + months
+    return index // 12, index % 12 + 1
+
+
+def month_matches(question):
+    """MONTH_RE matches in a lowercased question, leaving out "may" used as a verb"""
+    for match in MONTH_RE.finditer(question):
+        if match.group(2) == "may" and not match.group(3) and not MAY_PREFIX_RE.search(question[:match.start()]):
+            continue
+        yield match
+
+
+def named_months(question):
+    """Month numbers (1-12) named in a lowercased question, in order"""
+    return [MONTHS.index(match.group(2)[:3]) + 1 for match in month_matches(question) if match.group(2)]
+
+
+def find_months(question, default):
+    """(year, month) pairs mentioned in a question, in order; default fills missing years"""
+    months = []
+    for match in month_matches(question):
+        phrase = match.group(1)
+        today = date.today()
+        if phrase == "this month":
+            months.append((today.year, today.month))
+        elif phrase in ("last month", "previous month"):
+            months.append(shift_month(today.year, today.month, -1))
+        else:
+            year = int(match.group(3)) if match.group(3) else default[0]
+            months.append((year, MONTHS.index(match.group(2)[:3]) + 1))
+    return months
+
+
+def find_category(question, categories):
+    """First known category named in a question"""
+    for category in sorted(categories, key=len, reverse=True):
+        if re.search(rf"\b{re.escape(str(category).lower())}\b", question):
+            return category
+    return None
+
+
+def requested_count(question, default=3):
+    match = COUNT_RE.search(question)
+    return int(match.group(1) or match.group(2)) if match else default
+
+
+# --- Intent handlers: (question, data) -> answer, or None to fall through ---
+
+def answer_summary(question, data):
+    year, month = (find_months(question, data.month) or [data.month])[0]
+    totals = data.totals(year, month)
+    if totals.empty:
+        return f"🔍 No data found for {month_label(year, month)}."
+
+    response = f"📊 **Summary for {month_label(year, month)}**\n"
+    response += f"- Total expenses: ₹{totals.sum():.2f}\n"
+    response += "- Top 3 categories:\n"
+    for cat, amt in totals.head(3).items():
+        response += f"  • {str(cat).title()}: ₹{amt:.2f}\n"
+    return response
+
+
+def answer_compare(question, data):
+    months = find_months(question, data.month)
+    if len(months) < 2:
+        return None
+    (first, second) = months[:2]
+    first_totals, second_totals = data.totals(*first), data.totals(*second)
+    difference = second_totals.sum() - first_totals.sum()
+
+    response = f"📊 **{month_label(*first)} vs {month_label(*second)}**\n"
+    response += f"- {month_label(*first)}: ₹{first_totals.sum():.2f}\n"
+    response += f"- {month_label(*second)}: ₹{second_totals.sum():.2f}\n"
+    response += f"- Difference: {'+' if difference >= 0 else '-'}₹{abs(difference):.2f}\n"
+    changes = second_totals.sub(first_totals, fill_value=0)
+    changes = changes[changes != 0]
+    if not changes.empty:
+        response += "- Biggest changes:\n"
+        for cat, change in changes.abs().sort_values(ascending=False).head(3).items():
+            response += f"  • {str(cat).title()}: {'+' if changes[cat] >= 0 else '-'}₹{change:.2f}\n"
+    return response
+
+
+def answer_budget(question, data):
+    if not data.budget:
+        return "💡 You haven't set a budget yet. Add one when uploading or adding expenses."
+    year, month = (find_months(question, data.month) or [data.month])[0]
+    spent = data.totals(year, month).sum()
+    remaining = data.budget - spent
+    response = f"💰 **Budget for {month_label(year, month)}**\n"
+    response += f"- Budget: ₹{data.budget:.2f}\n"
+    response += f"- Spent: ₹{spent:.2f} ({spent / data.budget * 100:.1f}%)\n"
+    if remaining >= 0:
+        response += f"- Remaining: ₹{remaining:.2f}\n"
+    else:
+        response += f"- Over budget by ₹{-remaining:.2f}\n"
+    return response
+
+
+def answer_largest(question, data):
+    year, month = (find_months(question, data.month) or [data.month])[0]
+    rows = data.rows(year, month)
+    if rows is None:
+        return None
+    if rows.empty:
+        return f"🔍 No data found for {month_label(year, month)}."
+    largest = rows.nlargest(requested_count(question), "amount")
+    response = f"🧾 **Largest expenses in {month_label(year, month)}**\n"
+    for row in largest.itertuples():
+        description = getattr(row, "description", None)
+        label = f"{description} ({row.category})" if description else str(row.category).title()
+        response += f"- {row.date:%d %b}: {label} ₹{row.amount:.2f}\n"
+    return response
+
+
+def answer_top_categories(question, data):
+    year, month = (find_months(question, data.month) or [data.month])[0]
+    totals = data.totals(year, month)
+    if totals.empty:
+        return f"🔍 No data found for {month_label(year, month)}."
+    response = f"🏷️ **Top categories in {month_label(year, month)}**\n"
+    for cat, amt in totals.head(requested_count(question)).items():
+        response += f"- {str(cat).title()}: ₹{amt:.2f} ({amt / totals.sum() * 100:.1f}%)\n"
+    return response
+
+
+def answer_average(question, data):
+    year, month = (find_months(question, data.month) or [data.month])[0]
+    rows = data.rows(year, month)
+    if rows is None:
+        return None
+    if rows.empty:
+        return f"🔍 No data found for {month_label(year, month)}."
+    averages = rows.groupby("category")["amount"].agg(["mean", "count"]).sort_values("mean", ascending=False)
+    category = find_category(question, averages.index)
+    if category is not None:
+        averages = averages.loc[[category]]
+    response = f"📐 **Average expense per category in {month_label(year, month)}**\n"
+    for cat, row in averages.iterrows():
+        response += f"- {str(cat).title()}: ₹{row['mean']:.2f} over {int(row['count'])} expense(s)\n"
+    return response
+
+
+def answer_total(question, data):
+    year, month = (find_months(question, data.month) or [data.month])[0]
+    totals = data.totals(year, month)
+    category = find_category(question, totals.index)
+    if category is not None:
+        return f"💸 You spent ₹{totals[category]:.2f} on {str(category).title()} in {month_label(year, month)}."
+    if totals.empty:
+        return f"🔍 No data found for {month_label(year, month)}."
+    return f"💸 Your total expenses for {month_label(year, month)} are ₹{totals.sum():.2f}."
+
+
+# Checked in order; the first pattern that matches picks the intent
+INTENTS = [
+    ("summary", re.compile(r"\bsummary\b|\bsummari[sz]e\b|\boverview\b"), answer_summary),
+    ("compare", re.compile(r"\bcompare\b|\bvs\.?\b|\bversus\b|\bdifference between\b"), answer_compare),
+    ("budget", re.compile(r"\bbudget\b|\bleft to spend\b|\bcan i still spend\b"), answer_budget),
+    # Before largest_expenses, so "top expense categories" gets category totals
+    ("top_categories", re.compile(
+        r"\b(top|largest|biggest|highest|most)\b.*\bcategor(y|ies)\b|\bwhere\b.*\bmost\b"
+    ), answer_top_categories),
+    ("largest_expenses", re.compile(
+        r"\b(largest|biggest|highest|most expensive|top)\b.*\b(expenses?|purchases?|transactions?|payments?)\b"
+    ), answer_largest),
+    ("average", re.compile(r"\b(average|avg|mean)\b"), answer_average),
+    ("total", re.compile(
+        r"\b(how much|total)\b.*\b(spen[dt]|spending|expenses?|pay|paid)\b|\bhow much\b.*\bon\b"
+    ), answer_total),
+]
+
+
+class IntentStats:
+    """
+    Per-intent hit counts and latency, plus the questions left to the LLM.
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, intent, seconds):
+        with self._lock:
+            entry = self._stats.setdefault(intent, {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+    def snapshot(self):
+        """{intent: count, hit rate, mean and max latency}, "llm" being the fall-through"""
+        with self._lock:
+            total = sum(entry["count"] for entry in self._stats.values())
+            return {
+                intent: {
+                    "count": entry["count"],
+                    "hit_rate": entry["count"] / total if total else 0.0,
+                    "mean_ms": entry["seconds"] / entry["count"] * 1000,
+                    "max_ms": entry["max_seconds"] * 1000,
+                }
+                for intent, entry in self._stats.items()
+            }
+
+
+intent_stats = IntentStats()
+
+
+def route(question, data):
+    """Return (intent, answer) for the first local intent that answers, else (None, None)"""
+    question = question.lower()
+    for name, pattern, handler in INTENTS:
+        if pattern.search(question):
+            answer = handler(question, data)
+            if answer is not None:
+                return name, answer
+    return None, None
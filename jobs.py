@@ -0,0 +1,447 @@
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from csv_schema import SchemaCache
+from expense_tracker import ExpenseTracker
+from factory import create_app
+from models import db, UploadJob, UploadResult
+from upload_cache import UploadCache
+
+# Process pool shared by every request of this server process, created on first use
+_executor = None
+
+# Minimal app bound to the same database, created once in each worker process
+_worker_app = None
+
+# Columns of a parsed file carried into a merged multi-file upload, which adds "source"
+MERGE_COLUMNS = ["date", "description", "amount", "category"]
+
+
+def records(df):
+    """JSON-safe list of row dicts for a DataFrame (NaN becomes None)"""
+    if df is None:
+        return []
+    return json.loads(df.to_json(orient="records", date_format="iso"))
+
+
+def _init_worker(database_uri):
+    global _worker_app
+    _worker_app = create_app({"SQLALCHEMY_DATABASE_URI": database_uri})
+
+
+def upload_settings(app):
+    """The parts of the app config an upload worker needs, as plain picklable values"""
+    return {
+        "cache_folder": os.path.abspath(app.config["UPLOAD_CACHE_FOLDER"]),
+        "cache_max_bytes": app.config["UPLOAD_CACHE_MAX_BYTES"],
+        "cache_max_age": app.config["UPLOAD_CACHE_MAX_AGE"],
+        "schema_folder": os.path.abspath(app.config["SCHEMA_CACHE_FOLDER"]),
+        "streaming_threshold": app.config["STREAMING_THRESHOLD"],
+        "unusual_limit": app.config["UNUSUAL_RESULTS_LIMIT"],
+        "result_ttl": app.config["UPLOAD_RESULT_TTL"].total_seconds(),
+    }
+
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        # spawn: workers must not inherit the server's open SQLite connections
+        _executor = ProcessPoolExecutor(
+            max_workers=app.config.get("UPLOAD_WORKERS") or os.cpu_count(),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(db.engine.url.render_as_string(hide_password=False),),
+        )
+    return _executor
+
+
+def submit_upload(app, job_id, sources, custom_categories, user_id=None):
+    """Queue an upload of [(source name, CSV path)] files for processing; returns immediately
+
+    Several files are parsed in parallel, one pool task each, and a last task
+    merges them once all are done. With UPLOAD_JOBS_INLINE set the job runs
+    in the calling request instead, which is handy for debugging and
+    single-process deployments.
+    """
+    sources = [(name, os.path.abspath(path)) for name, path in sources]
+    settings = upload_settings(app)
+    if app.config.get("UPLOAD_JOBS_INLINE"):
+        run_upload_job(job_id, sources, custom_categories, settings, user_id)
+        return
+
+    executor = _get_executor(app)
+
+    # Callbacks run on the pool's result-handling thread, shared by every upload:
+    # they only do bookkeeping, and the rare crash is written from a thread of its own
+    def fail(message):
+        threading.Thread(target=_mark_failed, args=(app, job_id, message), daemon=True).start()
+
+    def mark_crashed(done):
+        # The worker records its own failures; this only catches a worker that died
+        if done.exception() is not None:
+            fail(f"Worker crashed: {done.exception()}")
+
+    if len(sources) == 1:
+        future = executor.submit(run_upload_job, job_id, sources, custom_categories, settings, user_id)
+        future.add_done_callback(mark_crashed)
+        return
+
+    parsed = [None] * len(sources)
+    remaining = [len(sources)]
+    lock = threading.Lock()
+
+    def file_parsed(index, done):
+        if done.exception() is not None:
+            parsed[index] = {"source": sources[index][0], "error": f"Worker crashed: {done.exception()}"}
+        else:
+            parsed[index] = done.result()
+        with lock:
+            remaining[0] -= 1
+            left = remaining[0]
+        if left == 0:
+            try:
+                executor.submit(run_merge_job, job_id, parsed, custom_categories, settings, user_id).add_done_callback(mark_crashed)
+            except Exception as e:  # The pool broke while the files were parsed
+                fail(f"Worker crashed: {e}")
+
+    for index, (name, path) in enumerate(sources):
+        future = executor.submit(run_parse_job, job_id, name, path, custom_categories, settings, len(sources))
+        future.add_done_callback(functools.partial(file_parsed, index))
+
+
+def _mark_failed(app, job_id, message):
+    with app.app_context():
+        UploadJob.update(job_id, status="failed", message=message)
+
+
+def run_upload_job(job_id, sources, custom_categories, settings, user_id=None):
+    """Parse, categorize and summarize an upload, recording progress on its UploadJob"""
+    context = _worker_app.app_context() if _worker_app is not None else nullcontext()
+    with context:
+        try:
+            if len(sources) == 1:
+                UploadJob.update(job_id, status="running", progress=0.05, message="Reading file")
+                name, filepath = sources[0]
+                process_upload(job_id, filepath, custom_categories, settings, user_id, name=name)
+                return
+            parsed = []
+            for name, filepath in sources:
+                parsed.append(run_parse_task(name, filepath, custom_categories, settings))
+                UploadJob.update(
+                    job_id,
+                    status="running",
+                    progress=0.05 + 0.6 * len(parsed) / len(sources),
+                    message=f"Parsed {len(parsed)} of {len(sources)} files",
+                )
+            merge_upload(job_id, parsed, custom_categories, settings, user_id)
+        except Exception as e:
+            db.session.rollback()
+            UploadJob.update(job_id, status="failed", message=f"Error processing upload: {e}")
+
+
+def run_merge_job(job_id, parsed, custom_categories, settings, user_id=None):
+    """Merge and summarize the files of an upload parsed by run_parse_task"""
+    context = _worker_app.app_context() if _worker_app is not None else nullcontext()
+    with context:
+        try:
+            merge_upload(job_id, parsed, custom_categories, settings, user_id)
+        except Exception as e:
+            db.session.rollback()
+            UploadJob.update(job_id, status="failed", message=f"Error processing upload: {e}")
+
+
+def _new_tracker(custom_categories):
+    tracker = ExpenseTracker()
+    # Custom rules go in before loading, so streamed chunks use them
+    if custom_categories:
+        tracker.add_custom_category_rules(custom_categories)
+    return tracker
+
+
+def _new_cache(settings):
+    return UploadCache(
+        settings["cache_folder"],
+        max_bytes=settings["cache_max_bytes"],
+        max_age=settings["cache_max_age"],
+    )
+
+
+def _load_cached(tracker, cache, key, streaming):
+    """Load the cache entry for key into tracker; False on a miss, e.g. when another worker evicted it"""
+    if streaming:
+        try:
+            return tracker.stream_chunks(lambda: cache.iter_frames(key))
+        except FileNotFoundError:
+            return False
+    df = cache.load(key)
+    if df is None:
+        return False
+    tracker.load_frame(df)
+    return True
+
+
+def _resolve_schema(filepath, settings):
+    """The file's detected or cached schema, or (None, error message)"""
+    try:
+        return SchemaCache(settings["schema_folder"]).resolve(filepath), None
+    except Exception as e:
+        return None, f"Could not read the CSV: {e}"
+
+
+def process_upload(job_id, filepath, custom_categories, settings, user_id=None, name=None):
+    start = time.perf_counter()
+    tracker = _new_tracker(custom_categories)
+    cache = _new_cache(settings)
+    cache_key = cache.key_for(filepath, tracker.categories)
+    streaming = os.path.getsize(filepath) > settings["streaming_threshold"]
+
+    reported = {"progress": 0.05}
+
+    def report(rows_read, bytes_read, total_bytes):
+        # Parsing covers 5% - 70% of the job; only write when it moved by 2%+
+        progress = 0.05 + 0.65 * (bytes_read / total_bytes if total_bytes else 1)
+        if progress - reported["progress"] >= 0.02:
+            reported["progress"] = progress
+            UploadJob.update(job_id, progress=progress, message=f"Parsed {rows_read:,} rows")
+
+    # Same file with the same rules was parsed before: skip parsing entirely
+    cached = success = _load_cached(tracker, cache, cache_key, streaming)
+    if not cached:
+        # Columns, delimiter and date format, known already when the bank's header was seen before
+        schema, error = _resolve_schema(filepath, settings)
+        if schema is None:
+            UploadJob.update(job_id, status="failed", message=error)
+            return
+        if streaming:
+            # Large files are streamed in chunks and only their aggregates are kept
+            with cache.writer(cache_key) as write:
+                success = tracker.stream_data(filepath, schema=schema, progress=report, sink=write)
+            if not success:
+                cache.discard(cache_key)
+        else:
+            success = tracker.load_data(filepath, schema=schema)
+            if success:
+                tracker.categorize_expenses()
+                cache.store(cache_key, tracker.df)
+
+    if not success:
+        UploadJob.update(job_id, status="failed", message="Error loading data. Please check your CSV format.")
+        return
+
+    rows = len(tracker.df) if tracker.df is not None else tracker.aggregates.records
+    files = [{
+        "source": name or os.path.basename(filepath),
+        "rows": int(rows),
+        "seconds": round(time.perf_counter() - start, 3),
+        "cached": cached,
+        "error": None,
+    }]
+    save_results(job_id, tracker, cache_key, settings, user_id, {"files": files, "duplicates": 0})
+
+
+def run_parse_job(job_id, name, filepath, custom_categories, settings, files):
+    """Pool task parsing one file of a multi-file upload, counting it on the job's progress"""
+    entry = run_parse_task(name, filepath, custom_categories, settings)
+    step = 0.65 / files  # Parsing covers 0% - 65% of the job
+    context = _worker_app.app_context() if _worker_app is not None else nullcontext()
+    with context:
+        try:
+            UploadJob.advance(job_id, step, lambda progress: f"Parsed {round(progress / step)} of {files} files")
+        except Exception:
+            db.session.rollback()  # Progress is cosmetic; the merge still gets this file
+    return entry
+
+
+def run_parse_task(name, filepath, custom_categories, settings):
+    """parse_source() for a pool task: failures are returned, not raised, so the merge still runs"""
+    try:
+        return parse_source(name, filepath, custom_categories, settings)
+    except Exception as e:
+        return {"source": name, "error": str(e)}
+
+
+def parse_source(name, filepath, custom_categories, settings):
+    """Parse and categorize one file of a multi-file upload into the upload cache
+
+    Returns the file's entry for the upload results: source name, cache key,
+    path, rows, size, seconds spent, whether it was cached already, and any error.
+    """
+    start = time.perf_counter()
+    tracker = _new_tracker(custom_categories)
+    cache = _new_cache(settings)
+    cache_key = cache.key_for(filepath, tracker.categories)
+    size = os.path.getsize(filepath)
+    try:
+        rows = sum(len(frame) for frame in cache.iter_frames(cache_key, ["amount"]))
+        cached = True
+    except FileNotFoundError:  # Not parsed yet, or evicted by another worker
+        cached = False
+    if not cached:
+        schema, error = _resolve_schema(filepath, settings)
+        if schema is None:
+            return {"source": name, "error": error}
+        if size > settings["streaming_threshold"]:
+            with cache.writer(cache_key) as write:
+                success = tracker.stream_data(filepath, schema=schema, sink=write)
+        else:
+            success = tracker.load_data(filepath, schema=schema)
+            if success:
+                tracker.categorize_expenses()
+                cache.store(cache_key, tracker.df)
+        if not success:
+            cache.discard(cache_key)
+            return {"source": name, "error": "Error loading data. Please check the CSV format."}
+        rows = len(tracker.df) if tracker.df is not None else tracker.aggregates.records
+
+    return {
+        "source": name,
+        "path": filepath,
+        "key": cache_key,
+        "rows": rows,
+        "bytes": size,
+        "seconds": round(time.perf_counter() - start, 3),
+        "cached": cached,
+        "error": None,
+    }
+
+
+def _merge_frame(chunk):
+    """A cached chunk with the merged entry's column types, whichever way it was parsed"""
+    return pd.DataFrame({
+        "date": pd.to_datetime(chunk["date"]),
+        "description": chunk["description"].astype("string"),
+        "amount": chunk["amount"].astype("float64"),
+        "category": chunk["category"].astype(str),
+    })
+
+
+def _row_hashes(frame):
+    """64-bit hash of each row's (date, amount in cents, description)"""
+    key = pd.DataFrame({
+        "date": frame["date"],
+        "cents": (frame["amount"] * 100).round(),
+        "description": frame["description"].fillna(""),
+    })
+    return pd.util.hash_pandas_object(key, index=False).to_numpy()
+
+
+def _part_frames(cache, entry, custom_categories, settings):
+    """Chunks of a parsed file's cache entry, parsing the file again when it was evicted since"""
+    try:
+        yield from cache.iter_frames(entry["key"], MERGE_COLUMNS)
+        return
+    except FileNotFoundError:
+        pass
+    reparsed = parse_source(entry["source"], entry["path"], custom_categories, settings)
+    if reparsed["error"]:
+        raise ValueError(f"{entry['source']}: {reparsed['error']}")
+    yield from cache.iter_frames(reparsed["key"], MERGE_COLUMNS)
+
+
+def merge_sources(parsed, custom_categories, settings):
+    """Merge parsed files into one cache entry with a source column; returns (key, duplicates dropped)
+
+    A row whose date, amount and description already appeared in an earlier
+    file is dropped as an overlap between statements; repeats within a single
+    file are kept, since they can be genuine repeated purchases.
+    """
+    cache = _new_cache(settings)
+    listing = "\n".join(f"{entry['source']}\t{entry['key']}" for entry in parsed)
+    merged_key = hashlib.sha256(listing.encode("utf-8")).hexdigest() + "-merged"
+    try:
+        merged_rows = sum(len(frame) for frame in cache.iter_frames(merged_key, ["amount"]))
+    except FileNotFoundError:  # Not merged yet, or evicted by another worker
+        merged_rows = 0
+        seen = np.empty(0, dtype=np.uint64)
+        with cache.writer(merged_key) as write:
+            for entry in parsed:
+                hashes = []
+                for chunk in _part_frames(cache, entry, custom_categories, settings):
+                    chunk = _merge_frame(chunk)
+                    chunk_hashes = _row_hashes(chunk)
+                    hashes.append(chunk_hashes)
+                    kept = chunk[~np.isin(chunk_hashes, seen)]
+                    merged_rows += len(kept)
+                    write(kept.assign(source=entry["source"]))
+                if hashes:
+                    seen = np.union1d(seen, np.concatenate(hashes))
+    return merged_key, sum(entry["rows"] for entry in parsed) - merged_rows
+
+
+def merge_upload(job_id, parsed, custom_categories, settings, user_id=None):
+    """Merge the parsed files of an upload into one tracker and save its summaries"""
+    usable = [entry for entry in parsed if not entry.get("error")]
+    if not usable:
+        errors = "; ".join(f"{entry['source']}: {entry['error']}" for entry in parsed)
+        UploadJob.update(job_id, status="failed", message=f"No file could be read. {errors}")
+        return
+
+    UploadJob.update(job_id, progress=0.65, message=f"Merging {len(usable)} files")
+    start = time.perf_counter()
+    merged_key, duplicates = merge_sources(usable, custom_categories, settings)
+    merge_seconds = round(time.perf_counter() - start, 3)
+
+    cache = _new_cache(settings)
+    tracker = ExpenseTracker()
+    streaming = sum(entry["bytes"] for entry in usable) > settings["streaming_threshold"]
+    if not _load_cached(tracker, cache, merged_key, streaming):
+        # Evicted by another worker right after the merge: merge once more
+        merged_key, duplicates = merge_sources(usable, custom_categories, settings)
+        if not _load_cached(tracker, cache, merged_key, streaming):
+            UploadJob.update(job_id, status="failed", message="The merged upload was evicted from the cache. Please upload it again.")
+            return
+
+    files = [
+        {field: entry.get(field) for field in ("source", "rows", "seconds", "cached", "error")}
+        for entry in parsed
+    ]
+    sources = {"files": files, "duplicates": duplicates, "merge_seconds": merge_seconds}
+    save_results(job_id, tracker, merged_key, settings, user_id, sources)
+
+
+def save_results(job_id, tracker, cache_key, settings, user_id, sources):
+    """Summarize a loaded tracker into an UploadResult and finish the job"""
+    UploadJob.update(job_id, progress=0.7, message="Summarizing")
+    unusual_expenses = tracker.identify_unusual_expenses()
+    if unusual_expenses is not None:
+        unusual_expenses = unusual_expenses.head(settings["unusual_limit"])
+    result_id = UploadResult.save(
+        {
+            "category_summary": records(tracker.get_category_summary()),
+            "monthly_summary": records(tracker.get_monthly_summary()),
+            "unusual_expenses": records(unusual_expenses),
+            # Chart data, rendered on request by the chart route
+            "category_totals": tracker.category_totals(),
+            "monthly_totals": tracker.monthly_totals(),
+            # Per-file rows and timing, and the duplicates dropped when merging
+            "sources": sources,
+        },
+        user_id=user_id,
+        ttl=timedelta(seconds=settings["result_ttl"]),
+    )
+
+    failed = sum(1 for entry in sources["files"] if entry["error"])
+    message = "Done"
+    if len(sources["files"]) > 1:
+        message = f"Done: merged {len(sources['files']) - failed} files, dropped {sources['duplicates']} duplicate rows"
+        if failed:
+            message += f", {failed} files could not be read"
+    UploadJob.update(
+        job_id,
+        status="done",
+        progress=1.0,
+        message=message,
+        upload_key=cache_key,
+        result_id=result_id,
+    )
@@ -1,7 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, date, timedelta
+import json
+import secrets
 
 db = SQLAlchemy()
 
@@ -23,19 +27,368 @@ class User(db.Model, UserMixin):
 
 
 class ChatHistory(db.Model):
+    __table_args__ = (
+        # History pages are read newest first per user, continuing after a (timestamp, id) cursor
+        db.Index("ix_chat_history_user_timestamp", "user_id", "timestamp", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     question = db.Column(db.Text)
     answer = db.Column(db.Text)
-    timestamp = db.Column(db.DateTime, default=db.func.now())
+    # Set in Python, so stored values have the microseconds that page() cursors compare against
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # What the question was asked about, so answers can be reused for the same data
+    data_fingerprint = db.Column(db.String(16))
+    month = db.Column(db.String(7))  # "YYYY-MM"
 
     user = db.relationship("User", backref=db.backref("chats", lazy=True))
 
+    @classmethod
+    def page(cls, user_id, limit=20, cursor=None):
+        """Up to limit of a user's entries, newest first, older than cursor if given
+
+        Returns (entries, next_cursor); next_cursor is None on the last page.
+        Cursors are opaque "<timestamp>_<id>" strings from a previous page.
+        """
+        query = cls.query.filter(cls.user_id == user_id)
+        if cursor:
+            timestamp, entry_id = cls.parse_cursor(cursor)
+            query = query.filter(
+                db.or_(cls.timestamp < timestamp, db.and_(cls.timestamp == timestamp, cls.id < entry_id))
+            )
+        entries = query.order_by(cls.timestamp.desc(), cls.id.desc()).limit(limit + 1).all()
+        next_cursor = entries[limit - 1].cursor if len(entries) > limit else None
+        return entries[:limit], next_cursor
+
+    @classmethod
+    def recent(cls, user_id, limit=20):
+        return cls.page(user_id, limit)[0]
+
+    @property
+    def cursor(self):
+        return f"{self.timestamp.isoformat()}_{self.id}"
+
+    @staticmethod
+    def parse_cursor(cursor):
+        timestamp, _, entry_id = cursor.rpartition("_")
+        return datetime.fromisoformat(timestamp), int(entry_id)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "question": self.question,
+            "answer": self.answer,
+            "timestamp": self.timestamp.isoformat() if self.timestamp else None,
+            "month": self.month,
+        }
+
+    @classmethod
+    def archive(cls, older_than, batch_size=5000):
+        """Move entries older than a datetime to chat_history_archive, in batches
+
+        Each batch is copied and deleted in one transaction. Returns the number moved.
+        """
+        columns = [column.name for column in cls.__table__.columns]
+        moved = 0
+        while True:
+            ids = [
+                row.id for row in
+                db.session.query(cls.id).filter(cls.timestamp < older_than).order_by(cls.id).limit(batch_size)
+            ]
+            if not ids:
+                return moved
+            selected = db.select(*[cls.__table__.c[name] for name in columns]).where(cls.id.in_(ids))
+            db.session.execute(db.insert(ChatHistoryArchive.__table__).from_select(columns, selected))
+            db.session.execute(db.delete(cls).where(cls.id.in_(ids)))
+            db.session.commit()
+            moved += len(ids)
+
+
+class ChatHistoryArchive(db.Model):
+    """Chat entries moved out of chat_history by ChatHistory.archive"""
+    __tablename__ = "chat_history_archive"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), index=True)
+    question = db.Column(db.Text)
+    answer = db.Column(db.Text)
+    timestamp = db.Column(db.DateTime)
+    data_fingerprint = db.Column(db.String(16))
+    month = db.Column(db.String(7))
+
 class Expense(db.Model):
+    __table_args__ = (
+        # Every dashboard/chat lookup filters on the user first, then a date range
+        db.Index("ix_expense_user_date", "user_id", "date"),
+        db.Index("ix_expense_user_category_date", "user_id", "category", "date"),
+        # Imported rows are deduplicated on this key; manual rows have no hash (NULLs never collide)
+        db.Index("ux_expense_import_dedup", "user_id", "date", "amount", "description_hash", unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     category = db.Column(db.String(100), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
+    # Only set for rows imported from an uploaded CSV
+    description = db.Column(db.Text)
+    description_hash = db.Column(db.BigInteger)
 
     user = db.relationship("User", backref=db.backref("expenses", lazy=True))
+
+    @staticmethod
+    def month_range(month):
+        """Return [start, end) dates for a "YYYY-MM" string or a (year, month) tuple"""
+        if isinstance(month, str):
+            year, month = (int(part) for part in month.split("-")[:2])
+        else:
+            year, month = month
+        start = date(year, month, 1)
+        end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+        return start, end
+
+    @classmethod
+    def for_user(cls, user_id):
+        return cls.query.filter(cls.user_id == user_id)
+
+    @classmethod
+    def in_range(cls, user_id, start=None, end=None):
+        """Expenses of a user with start <= date < end (either bound optional)"""
+        query = cls.for_user(user_id)
+        if start is not None:
+            query = query.filter(cls.date >= start)
+        if end is not None:
+            query = query.filter(cls.date < end)
+        return query
+
+    @classmethod
+    def in_month(cls, user_id, month):
+        """Expenses of a user in a "YYYY-MM" month"""
+        return cls.in_range(user_id, *cls.month_range(month))
+
+    @classmethod
+    def in_category(cls, user_id, category, start=None, end=None):
+        """Expenses of a user in one category, optionally within [start, end)"""
+        return cls.in_range(user_id, start, end).filter(cls.category == category)
+
+    @classmethod
+    def bulk_insert(cls, rows):
+        """Insert expense dicts with a single executemany and update the rollups
+
+        Runs on db.session without committing.
+        """
+        if not rows:
+            return
+        db.session.execute(db.insert(cls), rows)
+        ExpenseRollup.apply((row["user_id"], row["category"], row["amount"], row["date"]) for row in rows)
+
+
+class ExpenseRollup(db.Model):
+    """Materialized per (user, month, category) totals of Expense rows
+
+    Kept in step with Expense by apply() in the same transaction as the
+    inserts. Deleting or editing expenses needs rebuild().
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    year_month = db.Column(db.String(7), primary_key=True)  # "YYYY-MM"
+    category = db.Column(db.String(100), primary_key=True)  # Lowercased
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    min_amount = db.Column(db.Float)
+    max_amount = db.Column(db.Float)
+
+    @classmethod
+    def apply(cls, rows):
+        """Fold new (user_id, category, amount, date) rows into the rollups
+
+        Runs on db.session without committing, so the caller commits the
+        expenses and their rollups together.
+        """
+        partials = {}
+        for user_id, category, amount, day in rows:
+            key = (user_id, day.strftime("%Y-%m"), category.lower())
+            total, count, low, high = partials.get(key, (0.0, 0, amount, amount))
+            partials[key] = (total + amount, count + 1, min(low, amount), max(high, amount))
+        cls.apply_partials(partials)
+
+    @classmethod
+    def apply_partials(cls, partials):
+        """Upsert {(user_id, "YYYY-MM", category): (total, count, min, max)} into the rollups"""
+        if not partials:
+            return
+
+        stmt = sqlite_insert(cls)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.user_id, cls.year_month, cls.category],
+            set_={
+                "total": cls.total + stmt.excluded.total,
+                "count": cls.count + stmt.excluded.count,
+                "min_amount": func.min(cls.min_amount, stmt.excluded.min_amount),
+                "max_amount": func.max(cls.max_amount, stmt.excluded.max_amount),
+            },
+        )
+        db.session.execute(stmt, [
+            {
+                "user_id": user_id,
+                "year_month": year_month,
+                "category": category,
+                "total": total,
+                "count": count,
+                "min_amount": low,
+                "max_amount": high,
+            }
+            for (user_id, year_month, category), (total, count, low, high) in partials.items()
+        ])
+
+    @classmethod
+    def rebuild(cls, user_id=None):
+        """Recompute the rollups from Expense, for one user or everyone (backfill)"""
+        delete = db.delete(cls)
+        source = db.select(
+            Expense.user_id,
+            func.strftime("%Y-%m", Expense.date),
+            func.lower(Expense.category),
+            func.sum(Expense.amount),
+            func.count(Expense.id),
+            func.min(Expense.amount),
+            func.max(Expense.amount),
+        ).group_by(Expense.user_id, func.strftime("%Y-%m", Expense.date), func.lower(Expense.category))
+        if user_id is not None:
+            delete = delete.where(cls.user_id == user_id)
+            source = source.where(Expense.user_id == user_id)
+
+        db.session.execute(delete)
+        db.session.execute(db.insert(cls).from_select(
+            ["user_id", "year_month", "category", "total", "count", "min_amount", "max_amount"], source
+        ))
+        db.session.commit()
+
+    @classmethod
+    def category_totals(cls, user_id, year_month):
+        """{category: total} for one "YYYY-MM" month"""
+        rows = (
+            db.session.query(cls.category, cls.total)
+            .filter(cls.user_id == user_id, cls.year_month == year_month)
+            .all()
+        )
+        return dict(rows)
+
+
+class UploadResult(db.Model):
+    """Server-side store for per-upload summaries, referenced from the session by id
+
+    Keeps DataFrame-sized payloads out of the signed session cookie. Rows expire
+    after a TTL and are purged whenever a new result is saved.
+    """
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    payload = db.Column(db.Text, nullable=False)
+
+    @classmethod
+    def save(cls, payload, user_id=None, ttl=timedelta(days=1)):
+        """Store a JSON-serializable dict and return its opaque id"""
+        cls.purge(ttl)
+        result = cls(id=secrets.token_hex(16), user_id=user_id, payload=json.dumps(payload))
+        db.session.add(result)
+        db.session.commit()
+        return result.id
+
+    @classmethod
+    def load(cls, result_id, ttl=timedelta(days=1)):
+        """Return the stored dict for result_id, or None if unknown or expired"""
+        if not result_id:
+            return None
+        result = db.session.get(cls, result_id)
+        if result is None or result.created_at < datetime.utcnow() - ttl:
+            return None
+        return json.loads(result.payload)
+
+    @classmethod
+    def discard(cls, result_id):
+        if result_id:
+            db.session.execute(db.delete(cls).where(cls.id == result_id))
+            db.session.commit()
+
+    @classmethod
+    def purge(cls, ttl=timedelta(days=1)):
+        db.session.execute(db.delete(cls).where(cls.created_at < datetime.utcnow() - ttl))
+
+
+class UploadJob(db.Model):
+    """Status of an upload being processed by a background worker"""
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
+    status = db.Column(db.String(16), nullable=False, default="queued")  # queued, running, done, failed
+    progress = db.Column(db.Float, nullable=False, default=0.0)  # 0.0 - 1.0
+    message = db.Column(db.Text)
+    upload_key = db.Column(db.String(128))
+    result_id = db.Column(db.String(32))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @classmethod
+    def create(cls, user_id=None):
+        job = cls(id=secrets.token_hex(16), user_id=user_id, message="Queued")
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    @classmethod
+    def update(cls, job_id, **fields):
+        fields["updated_at"] = datetime.utcnow()
+        db.session.execute(db.update(cls).where(cls.id == job_id).values(**fields))
+        db.session.commit()
+
+    @classmethod
+    def advance(cls, job_id, step, describe):
+        """Add step to a running job's progress and set describe(new progress) as its message
+
+        Both happen in one transaction, so workers advancing the same job at
+        once neither lose steps nor report them out of order.
+        """
+        db.session.execute(
+            db.update(cls).where(cls.id == job_id)
+            .values(status="running", progress=cls.progress + step, updated_at=datetime.utcnow())
+        )
+        progress = db.session.execute(db.select(cls.progress).where(cls.id == job_id)).scalar_one()
+        db.session.execute(db.update(cls).where(cls.id == job_id).values(message=describe(progress)))
+        db.session.commit()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "message": self.message,
+        }
+
+
+def upgrade_schema(engine):
+    """Bring an existing database up to date with the models
+
+    create_all() only creates missing tables, so columns and indexes added to
+    existing tables are created here as well. New columns must be nullable.
+    """
+    db.metadata.create_all(engine)
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(engine.dialect)
+                    connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+        # Chats saved with the database's now() have no fraction and compare before their own second
+        for table in ("chat_history", "chat_history_archive"):
+            connection.exec_driver_sql(
+                f"UPDATE {table} SET timestamp = timestamp || '.000000' WHERE length(timestamp) = 19"
+            )
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
@@ -0,0 +1,157 @@
+import html
+import re
+
+from sqlalchemy import text
+
+from models import db
+
+# Snippet boundaries, swapped for <mark> tags after the text around them is escaped
+MARK_START, MARK_END = "\x02", "\x03"
+
+# Each index reads from a view (its external content) that adds an "owner" token
+# per user, so a user's matches are found by the index itself and not filtered after.
+# Triggers keep the index in step with every write, including raw DB-API inserts;
+# prefix indexes keep the search-as-you-type prefix queries from scanning the vocabulary.
+SCHEMA = [
+    """CREATE VIEW IF NOT EXISTS chat_history_search AS
+       SELECT id, question, answer, 'u' || user_id AS owner FROM chat_history""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS chat_history_fts USING fts5(
+       question, answer, owner,
+       content='chat_history_search', content_rowid='id', tokenize='porter unicode61', prefix='2 3 4')""",
+    """CREATE TRIGGER IF NOT EXISTS chat_history_fts_insert AFTER INSERT ON chat_history BEGIN
+       INSERT INTO chat_history_fts(rowid, question, answer, owner)
+       VALUES (new.id, new.question, new.answer, 'u' || new.user_id);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_history_fts_delete AFTER DELETE ON chat_history BEGIN
+       INSERT INTO chat_history_fts(chat_history_fts, rowid, question, answer, owner)
+       VALUES ('delete', old.id, old.question, old.answer, 'u' || old.user_id);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_history_fts_update AFTER UPDATE ON chat_history BEGIN
+       INSERT INTO chat_history_fts(chat_history_fts, rowid, question, answer, owner)
+       VALUES ('delete', old.id, old.question, old.answer, 'u' || old.user_id);
+       INSERT INTO chat_history_fts(rowid, question, answer, owner)
+       VALUES (new.id, new.question, new.answer, 'u' || new.user_id);
+       END""",
+    # Only imported expenses have descriptions; manual rows are left out of the index
+    """CREATE VIEW IF NOT EXISTS expense_search AS
+       SELECT id, description, category, 'u' || user_id AS owner FROM expense""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS expense_fts USING fts5(
+       description, category, owner,
+       content='expense_search', content_rowid='id', tokenize='porter unicode61', prefix='2 3 4')""",
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_insert AFTER INSERT ON expense
+       WHEN new.description IS NOT NULL BEGIN
+       INSERT INTO expense_fts(rowid, description, category, owner)
+       VALUES (new.id, new.description, new.category, 'u' || new.user_id);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_delete AFTER DELETE ON expense
+       WHEN old.description IS NOT NULL BEGIN
+       INSERT INTO expense_fts(expense_fts, rowid, description, category, owner)
+       VALUES ('delete', old.id, old.description, old.category, 'u' || old.user_id);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_update AFTER UPDATE ON expense BEGIN
+       INSERT INTO expense_fts(expense_fts, rowid, description, category, owner)
+       SELECT 'delete', old.id, old.description, old.category, 'u' || old.user_id
+       WHERE old.description IS NOT NULL;
+       INSERT INTO expense_fts(rowid, description, category, owner)
+       SELECT new.id, new.description, new.category, 'u' || new.user_id
+       WHERE new.description IS NOT NULL;
+       END""",
+]
+
+CHAT_SQL = text("""
+    SELECT c.id, c.timestamp,
+           snippet(chat_history_fts, 0, :start, :end, '…', 12) AS question,
+           snippet(chat_history_fts, 1, :start, :end, '…', 24) AS answer
+    FROM chat_history_fts
+    JOIN chat_history AS c ON c.id = chat_history_fts.rowid
+    WHERE chat_history_fts MATCH :query
+    ORDER BY bm25(chat_history_fts, 2.0, 1.0, 0.0)
+    LIMIT :limit
+""")
+
+EXPENSE_SQL = text("""
+    SELECT e.id, e.date, e.amount, e.category,
+           snippet(expense_fts, 0, :start, :end, '…', 16) AS description
+    FROM expense_fts
+    JOIN expense AS e ON e.id = expense_fts.rowid
+    WHERE expense_fts MATCH :query
+    ORDER BY bm25(expense_fts, 1.0, 0.5, 0.0)
+    LIMIT :limit
+""")
+
+
+def install_search(engine):
+    """Create the FTS5 indexes and their triggers, then index rows written before they existed"""
+    with engine.begin() as connection:
+        existed = connection.exec_driver_sql(
+            "SELECT count(*) FROM sqlite_master WHERE name IN ('chat_history_fts', 'expense_fts')"
+        ).scalar()
+        for statement in SCHEMA:
+            connection.exec_driver_sql(statement)
+        if existed < 2:
+            connection.exec_driver_sql("INSERT INTO chat_history_fts(chat_history_fts) VALUES ('rebuild')")
+            # The view holds every expense; only those with a description belong in the index
+            connection.exec_driver_sql("INSERT INTO expense_fts(expense_fts) VALUES ('delete-all')")
+            connection.exec_driver_sql(
+                "INSERT INTO expense_fts(rowid, description, category, owner) "
+                "SELECT id, description, category, 'u' || user_id FROM expense WHERE description IS NOT NULL"
+            )
+
+
+def match_query(user_id, query, columns):
+    """FTS5 query for the words of free text within columns, restricted to a user
+
+    Words are quoted, so search text can never be read as FTS5 syntax; the
+    last word also matches as a prefix, for search-as-you-type.
+    """
+    words = re.findall(r"\w+", query.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return f'owner : "u{int(user_id)}" AND {{{" ".join(columns)}}} : ({" ".join(terms)})'
+
+
+def highlight(snippet):
+    """Escape a snippet for HTML and mark its matches"""
+    escaped = html.escape(snippet or "")
+    return escaped.replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+def search_chats(user_id, query, limit=20):
+    """A user's chat entries matching query, best first, with highlighted snippets"""
+    match = match_query(user_id, query, ["question", "answer"])
+    if match is None:
+        return []
+    rows = db.session.execute(
+        CHAT_SQL, {"query": match, "limit": limit, "start": MARK_START, "end": MARK_END}
+    ).mappings()
+    return [
+        {
+            "id": row["id"],
+            "timestamp": str(row["timestamp"])[:19],  # To the second, without microseconds
+            "question": highlight(row["question"]),
+            "answer": highlight(row["answer"]),
+        }
+        for row in rows
+    ]
+
+
+def search_expenses(user_id, query, limit=20):
+    """A user's imported expenses whose description or category matches query, best first"""
+    match = match_query(user_id, query, ["description", "category"])
+    if match is None:
+        return []
+    rows = db.session.execute(
+        EXPENSE_SQL, {"query": match, "limit": limit, "start": MARK_START, "end": MARK_END}
+    ).mappings()
+    return [
+        {
+            "id": row["id"],
+            "date": str(row["date"]),
+            "amount": row["amount"],
+            "category": row["category"],
+            "description": highlight(row["description"]),
+        }
+        for row in rows
+    ]
@@ -39,4 +39,45 @@ document.addEventListener('DOMContentLoaded', function() {
             }, 300);
         });
     }
-});
\ No newline at end of file
+
+    // Draw charts from the JSON chart-data API
+    drawApiCharts();
+});
+
+const CHART_PALETTES = {
+    primary: ['#4e79a7', '#f28e2b', '#e15759', '#76b7b2', '#59a14f', '#edc949', '#af7aa1'],
+    muted: ['#a0cbe8', '#ffbe7d', '#ff9d9a', '#9c755f', '#bab0ab', '#d37295', '#fabfd2']
+};
+
+// Canvases with data-chart-url are drawn from the API; canvases sharing a URL share one request
+function drawApiCharts() {
+    const canvases = document.querySelectorAll('canvas[data-chart-url]');
+    if (!canvases.length || typeof Chart === 'undefined') {
+        return;
+    }
+
+    const requests = {};
+    canvases.forEach(canvas => {
+        const url = canvas.dataset.chartUrl;
+        requests[url] = requests[url] || fetch(url).then(response => response.json());
+        requests[url].then(payload => {
+            const series = canvas.dataset.chartSeries ? payload[canvas.dataset.chartSeries] : payload;
+            new Chart(canvas, {
+                type: canvas.dataset.chartType,
+                data: {
+                    labels: series.labels,
+                    datasets: [chartDataset(canvas, series.values)]
+                }
+            });
+        });
+    });
+}
+
+function chartDataset(canvas, values) {
+    const dataset = { label: canvas.dataset.chartLabel, data: values };
+    if (canvas.dataset.chartType === 'line') {
+        return Object.assign(dataset, { fill: false, borderColor: '#007bff', tension: 0.3 });
+    }
+    dataset.backgroundColor = CHART_PALETTES[canvas.dataset.chartPalette || 'primary'];
+    return dataset;
+}
\ No newline at end of file
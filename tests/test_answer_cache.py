@@ -0,0 +1,21 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from answer_cache import AnswerCache, key_terms, tokenize
+
+
+def test_key_terms_only_count_real_months():
+    assert key_terms(tokenize("Groceries at the market")) == frozenset()
+    assert key_terms(tokenize("Spending in March 2024")) == key_terms(tokenize("spending in mar 2024"))
+
+
+def test_single_scope_stays_within_max_entries():
+    cache = AnswerCache(max_entries=5)
+    scope = (1, "data", "2025-01")
+    for i in range(20):
+        cache.store(scope, f"question number {i}", i)
+    assert cache._entries == 5
+    assert cache.lookup(scope, "question number 19") == 19
+    assert cache.lookup(scope, "question number 0") is None
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from expense_tracker import CategoryMatcher, ExpenseTracker
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Expense_dataset.csv")
+
+EDGE_CASES = ["", "GAS BILL for March", "Gas station", "c++ lessons", "A.B. co", "AxB co", "Café", "1234", None, np.nan]
+
+
+def nested_loop(categories, descriptions):
+    """The categorizer before CategoryMatcher: first category with a keyword in the description wins"""
+    def assign_category(description):
+        description = str(description).lower()
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                if keyword in description:
+                    return category
+        return 'miscellaneous'
+    return descriptions.apply(assign_category)
+
+
+def descriptions():
+    return pd.concat([pd.read_csv(DATASET)["description"], pd.Series(EDGE_CASES, dtype=object)], ignore_index=True)
+
+
+def test_matcher_agrees_with_the_nested_loop():
+    categories = ExpenseTracker().categories
+    values = descriptions()
+    expected = nested_loop(categories, values)
+    assert (CategoryMatcher(categories).categorize(values) == expected).all()
+    assert expected.nunique() > 5
+
+
+def test_matcher_agrees_with_the_nested_loop_with_custom_rules():
+    tracker = ExpenseTracker()
+    tracker.add_custom_category_rules({
+        "coding": ["c++", "a.b."],  # Regex characters are matched literally
+        "utilities": ["water"],  # Extends an existing category, keeping its place in the order
+        "Upper": ["CAFÉ"],  # Keywords are not lowercased, so this never matches
+        "empty": [],
+    })
+    values = descriptions()
+    expected = nested_loop(tracker.categories, values)
+    assert (tracker.get_matcher().categorize(values) == expected).all()
+    assert {"coding", "utilities"} <= set(expected)
+
+
+def test_rules_added_after_loading_recategorize():
+    tracker = ExpenseTracker()
+    assert tracker.load_data(DATASET)
+    tracker.categorize_expenses()
+    tracker.add_custom_category_rules({"gifts": ["gifts"]})
+    expected = nested_loop(tracker.categories, tracker.df["description"])
+    assert (tracker.df["category"] == expected).all()
+    assert (tracker.df["category"] == "gifts").any()
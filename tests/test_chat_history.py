@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from models import ChatHistory, db, upgrade_schema
+
+
+def all_pages(user_id, limit):
+    pages, cursor = [], None
+    while True:
+        entries, cursor = ChatHistory.page(user_id, limit, cursor)
+        pages.append([entry.id for entry in entries])
+        if cursor is None or len(pages) > 10:
+            return pages
+
+
+def test_pages_over_chats_saved_within_one_second(user):
+    for i in range(7):
+        db.session.add(ChatHistory(user_id=user.id, question=f"q{i}", answer="a"))
+    db.session.commit()
+    assert all_pages(user.id, 3) == [[7, 6, 5], [4, 3, 2], [1]]
+
+
+def test_pages_over_chats_sharing_a_timestamp(user):
+    second = datetime(2026, 1, 1, 12, 0, 0)
+    for i in range(7):
+        db.session.add(ChatHistory(user_id=user.id, question=f"q{i}", answer="a", timestamp=second))
+    db.session.add(ChatHistory(user_id=user.id, question="older", answer="a", timestamp=datetime(2025, 12, 31)))
+    db.session.commit()
+    assert all_pages(user.id, 3) == [[7, 6, 5], [4, 3, 2], [1, 8]]
+
+
+def test_chats_saved_by_the_database_clock_page_after_upgrade(user):
+    for i in range(5):
+        db.session.execute(db.text(
+            "INSERT INTO chat_history (user_id, question, answer, timestamp) "
+            "VALUES (:user_id, :question, 'a', '2026-01-01 12:00:00')"
+        ), {"user_id": user.id, "question": f"q{i}"})
+    db.session.commit()
+    upgrade_schema(db.engine)
+    assert all_pages(user.id, 2) == [[5, 4], [3, 2], [1]]
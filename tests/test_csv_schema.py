@@ -0,0 +1,87 @@
+import pytest
+
+from csv_schema import detect_schema
+from expense_tracker import ExpenseTracker
+
+
+def load(tmp_path, text, name="statement.csv"):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    tracker = ExpenseTracker()
+    assert tracker.load_data(str(path))
+    return detect_schema(str(path)), tracker.df
+
+
+def rows(df):
+    return [(day.strftime("%Y-%m-%d"), amount, description)
+            for day, amount, description in zip(df["date"], df["amount"].round(2), df["description"])]
+
+
+def test_repo_format_keeps_refunds_netted(tmp_path):
+    schema, df = load(tmp_path, "date,amount,description\n2024-01-05,50,Market\n2024-01-06,-20,Market refund\n")
+    assert schema["amount_sign"] == 1
+    assert rows(df) == [("2024-01-05", 50.0, "Market"), ("2024-01-06", -20.0, "Market refund")]
+
+
+def test_spending_written_negative_is_flipped_and_payments_dropped(tmp_path):
+    schema, df = load(tmp_path, (
+        "Transaction Date,Post Date,Description,Category,Type,Amount,Memo\n"
+        "01/15/2024,01/16/2024,STARBUCKS #123,Food & Drink,Sale,-5.75,\n"
+        "01/17/2024,01/18/2024,UBER TRIP,Travel,Sale,-23.10,\n"
+        "01/20/2024,01/20/2024,Payment Thank You,,Payment,500.00,\n"
+        "01/21/2024,01/22/2024,AMAZON MKTPL,Shopping,Sale,-41.99,\n"
+    ))
+    assert schema["amount_sign"] == -1
+    assert rows(df) == [
+        ("2024-01-15", 5.75, "STARBUCKS #123"),
+        ("2024-01-17", 23.1, "UBER TRIP"),
+        ("2024-01-21", 41.99, "AMAZON MKTPL"),
+    ]
+
+
+def test_mixed_signs_without_a_clear_majority_are_kept_as_written(tmp_path):
+    schema, df = load(tmp_path, (
+        "Date,Description,Amount\n"
+        "2024-01-02,Payroll,2500.00\n"
+        "2024-01-03,Rent,-900.00\n"
+        "2024-01-04,Refund,15.00\n"
+        "2024-01-05,Groceries,-80.00\n"
+    ))
+    assert schema["amount_sign"] == 1
+    assert [amount for _, amount, _ in rows(df)] == [2500.0, -900.0, 15.0, -80.0]
+
+
+def test_split_debit_and_credit_columns_keep_debits(tmp_path):
+    schema, df = load(tmp_path, (
+        "Account: 12345678\nStatement period: Jan 2024\n\n"
+        "Date;Details;Money Out;Money In;Balance\n"
+        "13.01.2024;TESCO STORES;12,50;;1.000,00\n"
+        "14.01.2024;SALARY;;2.500,00;3.487,50\n"
+        "15.01.2024;NETFLIX;1.234,99;;2.252,51\n"
+    ))
+    assert schema["columns"]["debit"] == "Money Out" and schema["columns"]["credit"] == "Money In"
+    assert rows(df) == [("2024-01-13", 12.5, "TESCO STORES"), ("2024-01-15", 1234.99, "NETFLIX")]
+
+
+def test_currency_symbols_and_parentheses(tmp_path):
+    schema, df = load(tmp_path, (
+        "Posted Date\tPayee\tAmount\n"
+        "2024-02-01\tShell Gas\t\"$1,040.00\"\n"
+        "2024-02-02\tPharmacy\t($12.00)\n"
+        "2024-02-03\tCoffee\t$4.50\n"
+    ))
+    assert schema["delimiter"] == "\t" and schema["amount_sign"] == 1
+    assert [amount for _, amount, _ in rows(df)] == [1040.0, -12.0, 4.5]
+
+
+def test_file_without_a_header(tmp_path):
+    schema, df = load(tmp_path, "2024-03-01,Grocery market,55.20\n2024-03-02,Cinema movie,12.00\n2024-03-05,Rent,900\n")
+    assert not schema["header"]
+    assert rows(df)[0] == ("2024-03-01", 55.2, "Grocery market")
+
+
+@pytest.mark.parametrize("content", [b"\xff\xfe\x00\x00binary", b"", b"just,one,line\n"])
+def test_unreadable_files_fail_to_load_without_raising(tmp_path, content):
+    path = tmp_path / "broken.csv"
+    path.write_bytes(content)
+    assert ExpenseTracker().load_data(str(path)) is False
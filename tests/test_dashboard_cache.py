@@ -0,0 +1,89 @@
+from datetime import date
+
+import pytest
+
+from app import sql_expense_summaries
+from dashboard_cache import DashboardCache, patch_summaries
+from models import Expense, db
+
+MONTH = "2024-03"
+
+
+def rounded(summaries):
+    category_summary, history_summary, monthly_summary = summaries
+    return (
+        {category: (round(summary["sum"], 2), summary["count"]) for category, summary in category_summary.items()},
+        {category: round(total, 2) for category, total in history_summary.items()},
+        {month: round(total, 2) for month, total in monthly_summary.items()},
+    )
+
+
+def add_expenses(user_id, rows):
+    """Save (category, amount, date) rows as /add-expense does; returns the partials it patches with"""
+    Expense.bulk_insert([
+        {"user_id": user_id, "category": category, "amount": amount, "date": day} for category, amount, day in rows
+    ])
+    db.session.commit()
+    partials = {}
+    for category, amount, day in rows:
+        cell = (day.strftime("%Y-%m"), category.lower())
+        total, count = partials.get(cell, (0.0, 0))
+        partials[cell] = (total + amount, count + 1)
+    return partials
+
+
+@pytest.fixture
+def expenses(user):
+    add_expenses(user.id, [
+        ("rent", 900.0, date(2024, 1, 1)),
+        ("food", 45.5, date(2024, 2, 10)),
+        ("food", 30.25, date(2024, 3, 2)),
+        ("travel", 120.0, date(2024, 3, 15)),
+    ])
+    return user
+
+
+NEW_EXPENSES = [
+    ("food", 12.75, date(2024, 3, 20)),  # Existing cell this month
+    ("Health", 60.0, date(2024, 3, 21)),  # New category this month
+    ("rent", 950.0, date(2024, 2, 1)),  # Earlier month
+    ("gifts", 25.0, date(2023, 12, 24)),  # Month not seen before
+]
+
+
+@pytest.mark.parametrize("scope", ["present", "past", "none"])
+def test_patch_summaries_matches_a_fresh_query(expenses, scope):
+    before = sql_expense_summaries(expenses.id, scope, MONTH)
+    partials = add_expenses(expenses.id, NEW_EXPENSES)
+    assert rounded(patch_summaries(before, scope, MONTH, partials)) == rounded(
+        sql_expense_summaries(expenses.id, scope, MONTH)
+    )
+
+
+@pytest.mark.parametrize("directory", [False, True])
+def test_patched_entries_match_a_fresh_query(expenses, tmp_path, directory):
+    cache = DashboardCache(directory=str(tmp_path / "dashboard") if directory else None)
+    keys = {scope: (expenses.id, "manual", scope, MONTH, None) for scope in ("present", "past")}
+    for scope, key in keys.items():
+        cache.put(key, sql_expense_summaries(expenses.id, scope, MONTH), cache.generation(expenses.id))
+
+    cache.patch(expenses.id, add_expenses(expenses.id, NEW_EXPENSES))
+    for scope, key in keys.items():
+        assert rounded(cache.get(key)) == rounded(sql_expense_summaries(expenses.id, scope, MONTH))
+    assert cache.stats()["patches"] == 2
+
+
+def test_another_process_sees_patches_and_invalidations(expenses, tmp_path):
+    first, second = (DashboardCache(directory=str(tmp_path / "dashboard")) for _ in range(2))
+    key = (expenses.id, "manual", "present", MONTH, None)
+    first.put(key, sql_expense_summaries(expenses.id, "present", MONTH), first.generation(expenses.id))
+    assert second.get(key) is not None
+
+    second.patch(expenses.id, add_expenses(expenses.id, NEW_EXPENSES[:1]))
+    assert rounded(first.get(key)) == rounded(sql_expense_summaries(expenses.id, "present", MONTH))
+
+    stale = sql_expense_summaries(expenses.id, "present", MONTH)
+    generation = first.generation(expenses.id)
+    second.invalidate(expenses.id, "manual")
+    first.put(key, stale, generation)  # Computed before the other process's write
+    assert first.get(key) is None and second.get(key) is None
@@ -0,0 +1,78 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from expense_import import import_expenses
+from models import Expense, ExpenseRollup, User, db
+
+
+def upload(rows):
+    return pd.DataFrame({
+        "date": pd.to_datetime([row[0] for row in rows]),
+        "amount": [row[1] for row in rows],
+        "description": [row[2] for row in rows],
+        "category": [row[3] for row in rows],
+    })
+
+
+STATEMENT = [
+    ("2024-01-03", 12.5, "Cafe latte", "dining"),
+    ("2024-01-03", 12.5, "Cafe latte", "dining"),  # Repeated within the file
+    ("2024-01-09", 80.0, "Grocery market", "Groceries"),
+    ("2024-01-31", 900.0, "Rent", "housing"),
+    ("2024-02-02", 45.25, "Grocery market", "groceries"),
+    ("2024-02-14", 60.0, "Restaurant", "dining"),
+]
+
+
+def rollups(user_id):
+    return {
+        (row.year_month, row.category): (round(row.total, 2), row.count, row.min_amount, row.max_amount)
+        for row in ExpenseRollup.query.filter_by(user_id=user_id)
+    }
+
+
+def recomputed(user_id):
+    rows = db.session.execute(db.text(
+        "SELECT strftime('%Y-%m', date), lower(category), sum(amount), count(*), min(amount), max(amount) "
+        "FROM expense WHERE user_id = :user_id GROUP BY 1, 2"
+    ), {"user_id": user_id})
+    return {(month, category): (round(total, 2), count, low, high) for month, category, total, count, low, high in rows}
+
+
+def test_second_import_of_the_same_upload_adds_nothing(user):
+    assert import_expenses(user.id, [upload(STATEMENT)]) == (5, 1)
+    assert import_expenses(user.id, [upload(STATEMENT)]) == (0, 6)
+    assert Expense.query.filter_by(user_id=user.id).count() == 5
+
+
+def test_overlapping_statements_only_add_new_rows(user):
+    import_expenses(user.id, [upload(STATEMENT[:4])])
+    next_statement = STATEMENT[3:] + [("2024-03-01", 30.0, "Netflix", "entertainment")]
+    assert import_expenses(user.id, [upload(next_statement)], chunk_size=2) == (3, 1)
+    assert Expense.query.filter_by(user_id=user.id).count() == 6
+
+
+def test_imports_are_kept_apart_per_user(user):
+    other = User(username="bob", password_hash="-")
+    db.session.add(other)
+    db.session.commit()
+    import_expenses(user.id, [upload(STATEMENT)])
+    assert import_expenses(other.id, [upload(STATEMENT)]) == (5, 1)
+
+
+@pytest.mark.parametrize("chunk_size", [2, 50_000])
+def test_rollups_match_a_recompute_from_the_expenses(user, chunk_size):
+    import_expenses(user.id, [upload(STATEMENT)], chunk_size=chunk_size)
+    Expense.bulk_insert([
+        {"user_id": user.id, "category": "Dining", "amount": 7.0, "date": date(2024, 2, 20)},
+        {"user_id": user.id, "category": "travel", "amount": 300.0, "date": date(2024, 3, 5)},
+    ])
+    db.session.commit()
+    import_expenses(user.id, [upload(STATEMENT + [("2024-03-06", 20.0, "Taxi", "travel")])], chunk_size=chunk_size)
+
+    assert rollups(user.id) == recomputed(user.id)
+    assert rollups(user.id)[("2024-02", "dining")] == (67.0, 2, 7.0, 60.0)
+    ExpenseRollup.rebuild(user.id)
+    assert rollups(user.id) == recomputed(user.id)
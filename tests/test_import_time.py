@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use by the routes that need them, never at import
+HEAVY = ["pandas", "numpy", "matplotlib", "pyarrow", "httpx", "langchain", "langchain_groq", "langchain_experimental"]
+
+PROBE = """
+import sys
+import {module}
+print("heavy:" + ",".join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+@pytest.mark.parametrize("module", ["factory", "app"])
+def test_entry_point_imports_no_heavy_modules(module):
+    # A fresh interpreter, since this test session has imported pandas already
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    loaded = result.stdout.rpartition("heavy:")[2].strip()
+    assert loaded == "", f"import {module} loaded {loaded}"
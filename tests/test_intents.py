@@ -0,0 +1,63 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intents import ExpenseData, find_months, named_months, route
+
+
+@pytest.fixture
+def data():
+    df = pd.DataFrame({
+        "date": ["2025-01-05", "2025-01-20", "2025-01-25", "2025-03-02", "2025-03-15"],
+        "category": ["groceries", "rent", "groceries", "groceries", "dining"],
+        "description": ["Market", "Rent", "Market", "Market", "Cafe"],
+        "amount": [40.0, 900.0, 60.0, 25.0, 15.0],
+    })
+    return ExpenseData(df, month=(2025, 1))
+
+
+@pytest.mark.parametrize("question", [
+    "how much did i spend on groceries at the market?",
+    "maybe i overspent",
+    "may i see my total spending?",
+    "junk food and decorations",
+    "octopus dinner",
+])
+def test_words_starting_like_months_are_not_months(question):
+    assert named_months(question) == []
+    assert find_months(question, (2025, 1)) == []
+
+
+@pytest.mark.parametrize("question, months", [
+    ("spending in march", [(2025, 3)]),
+    ("what did i spend in may?", [(2025, 5)]),
+    ("total of may", [(2025, 5)]),
+    ("may 2024 total", [(2024, 5)]),
+    ("compare jan and sept. 2024", [(2025, 1), (2024, 9)]),
+    ("june vs july", [(2025, 6), (2025, 7)]),
+    ("dec. spending", [(2025, 12)]),
+])
+def test_month_names_and_abbreviations(question, months):
+    assert find_months(question, (2025, 1)) == months
+
+
+def test_market_question_answers_for_the_default_month(data):
+    intent, answer = route("How much did I spend on groceries at the market?", data)
+    assert intent == "total"
+    assert "Jan 2025" in answer and "100.00" in answer
+
+
+def test_top_expense_categories_gives_category_totals(data):
+    intent, answer = route("What are my top expense categories?", data)
+    assert intent == "top_categories"
+    assert "Rent" in answer and "Groceries" in answer
+
+
+def test_largest_expenses_still_lists_transactions(data):
+    intent, answer = route("What were my biggest expenses in march?", data)
+    assert intent == "largest_expenses"
+    assert "Mar 2025" in answer and "Market" in answer
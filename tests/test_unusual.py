@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from expense_tracker import UNUSUAL_COLUMNS, UNUSUAL_DETECTORS, ExpenseTracker
+
+DESCRIPTIONS = ["Grocery market", "Cafe latte", "Uber ride", "Netflix", "Rent payment", "Pharmacy", "Hotel stay"]
+
+
+@pytest.fixture
+def statement(tmp_path):
+    rng = np.random.default_rng(7)
+    rows = 400
+    amounts = rng.gamma(2.0, 30.0, rows).round(2)
+    amounts[rng.choice(rows, 12, replace=False)] *= 8  # A few clear outliers
+    pd.DataFrame({
+        "date": (pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, rows), unit="D")).strftime("%Y-%m-%d"),
+        "amount": amounts,
+        "description": np.array(DESCRIPTIONS)[rng.integers(0, len(DESCRIPTIONS), rows)],
+    }).to_csv(tmp_path / "statement.csv", index=False)
+    return str(tmp_path / "statement.csv")
+
+
+def loaded(path):
+    tracker = ExpenseTracker()
+    assert tracker.load_data(path)
+    tracker.categorize_expenses()
+    return tracker
+
+
+def row_loop(df, threshold_factor=2.0):
+    """identify_unusual_expenses before the detectors: one pass over the rows against the category means"""
+    category_avg = df.groupby('category')['amount'].mean()
+    unusual_expenses = []
+    for _, row in df.iterrows():
+        avg = category_avg[row['category']]
+        if row['amount'] > avg * threshold_factor:
+            unusual_expenses.append({
+                'date': row['date'].strftime('%Y-%m-%d'),
+                'description': row['description'],
+                'amount': row['amount'],
+                'category': row['category'],
+                'category_avg': avg,
+                'times_above_avg': row['amount'] / avg,
+            })
+    return pd.DataFrame(unusual_expenses).sort_values('times_above_avg', ascending=False)
+
+
+def same_rows(left, right):
+    columns = ['date', 'description', 'category']
+    left, right = left.reset_index(drop=True), right.reset_index(drop=True)
+    assert len(left) == len(right) > 0
+    assert (left[columns].astype(str) == right[columns].astype(str)).all().all()
+    for column in ['amount', 'category_avg', 'times_above_avg']:
+        assert np.allclose(left[column].to_numpy(dtype=float), right[column].to_numpy(dtype=float))
+
+
+@pytest.mark.parametrize("threshold", [None, 1.5, 3.0])
+def test_mean_detector_matches_the_row_loop(statement, threshold):
+    tracker = loaded(statement)
+    expected = row_loop(tracker.df, 2.0 if threshold is None else threshold)
+    same_rows(tracker.identify_unusual_expenses(threshold), expected)
+
+
+def test_streamed_mean_detector_matches_the_row_loop(statement):
+    expected = row_loop(loaded(statement).df)
+    tracker = ExpenseTracker()
+    assert tracker.stream_data(statement, chunksize=50)
+    same_rows(tracker.identify_unusual_expenses(), expected)
+
+
+@pytest.mark.parametrize("method", list(UNUSUAL_DETECTORS))
+def test_every_detector_returns_the_same_columns(statement, method):
+    unusual = loaded(statement).identify_unusual_expenses(method=method)
+    assert list(unusual.columns) == UNUSUAL_COLUMNS
+    assert len(unusual) > 0
+    assert unusual['times_above_avg'].is_monotonic_decreasing
+    assert unusual['date'].str.match(r"^\d{4}-\d{2}-\d{2}$").all()
+    assert unusual['amount'].dtype == np.float64
+
+
+@pytest.mark.parametrize("method", list(UNUSUAL_DETECTORS))
+def test_nothing_unusual_still_has_the_columns(statement, method):
+    unusual = loaded(statement).identify_unusual_expenses(1e9, method=method)
+    assert list(unusual.columns) == UNUSUAL_COLUMNS
+    assert len(unusual) == 0
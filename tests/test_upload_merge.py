@@ -0,0 +1,94 @@
+import zipfile
+
+import pytest
+
+from app import extract_csvs
+from jobs import _new_cache, merge_sources, parse_source, run_upload_job, upload_settings
+from models import UploadJob, UploadResult, db
+
+JANUARY = (
+    "date,amount,description\n"
+    "2024-01-05,40.00,Grocery market\n"
+    "2024-01-20,12.50,Cafe\n"
+    "2024-01-20,12.50,Cafe\n"  # Bought twice that day: repeats within a file are kept
+    "2024-01-31,900.00,Rent\n"
+)
+# Overlaps January's last two days, as consecutive statements often do
+FEBRUARY = (
+    "date,amount,description\n"
+    "2024-01-20,12.50,Cafe\n"
+    "2024-01-31,900.00,Rent\n"
+    "2024-02-03,25.00,Uber ride\n"
+)
+MARCH = (
+    "date,amount,description\n"
+    "2024-01-31,900.00,Rent\n"
+    "2024-03-01,15.99,Netflix\n"
+)
+
+
+@pytest.fixture
+def settings(app, tmp_path):
+    return dict(upload_settings(app), cache_folder=str(tmp_path / "cache"), schema_folder=str(tmp_path / "schemas"))
+
+
+def write(folder, files):
+    folder.mkdir(exist_ok=True)
+    sources = []
+    for name, text in files.items():
+        (folder / name).write_text(text, encoding="utf-8")
+        sources.append((name, str(folder / name)))
+    return sources
+
+
+def merged(sources, settings):
+    parsed = [parse_source(name, path, {}, settings) for name, path in sources]
+    key, duplicates = merge_sources(parsed, {}, settings)
+    df = _new_cache(settings).load(key)
+    return duplicates, sorted(zip(df["date"].dt.strftime("%Y-%m-%d"), df["amount"], df["description"], df["source"]))
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_merge_drops_rows_repeated_across_files(settings, tmp_path, streaming):
+    settings["streaming_threshold"] = 0 if streaming else settings["streaming_threshold"]
+    sources = write(tmp_path / "upload", {"jan.csv": JANUARY, "feb.csv": FEBRUARY, "mar.csv": MARCH})
+    duplicates, rows = merged(sources, settings)
+    assert duplicates == 3
+    assert rows == [
+        ("2024-01-05", 40.0, "Grocery market", "jan.csv"),
+        ("2024-01-20", 12.5, "Cafe", "jan.csv"),
+        ("2024-01-20", 12.5, "Cafe", "jan.csv"),
+        ("2024-01-31", 900.0, "Rent", "jan.csv"),
+        ("2024-02-03", 25.0, "Uber ride", "feb.csv"),
+        ("2024-03-01", 15.99, "Netflix", "mar.csv"),
+    ]
+
+
+def test_zip_members_are_merged_like_separate_files(settings, tmp_path):
+    folder = tmp_path / "upload"
+    folder.mkdir()
+    archive = folder / "statements.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("2024/jan.csv", JANUARY)
+        zf.writestr("2024/feb.csv", FEBRUARY)
+        zf.writestr("__MACOSX/2024/._feb.csv", "junk")
+        zf.writestr("notes.txt", "not a statement")
+    sources = extract_csvs(str(archive), "statements.zip", str(folder))
+    assert [name for name, _ in sources] == ["statements.zip/2024/jan.csv", "statements.zip/2024/feb.csv"]
+
+    duplicates, rows = merged(sources, settings)
+    assert duplicates == 2
+    assert [row[3] for row in rows].count("statements.zip/2024/feb.csv") == 1
+
+
+def test_upload_job_reports_the_duplicates_dropped(app, user, settings, tmp_path):
+    sources = write(tmp_path / "upload", {"jan.csv": JANUARY, "feb.csv": FEBRUARY, "mar.csv": MARCH})
+    job = UploadJob.create(user.id)
+    run_upload_job(job.id, sources, {}, settings, user.id)
+
+    db.session.expire_all()
+    job = db.session.get(UploadJob, job.id)
+    assert job.status == "done", job.message
+    assert job.message == "Done: merged 3 files, dropped 3 duplicate rows"
+    files = UploadResult.load(job.result_id)["sources"]["files"]
+    assert [(entry["source"], entry["rows"]) for entry in files] == [("jan.csv", 4), ("feb.csv", 3), ("mar.csv", 2)]
@@ -0,0 +1,208 @@
+import functools
+import hashlib
+import itertools
+import os
+import time
+from contextlib import contextmanager
+
+
+@functools.lru_cache(maxsize=None)
+def _arrow():
+    """pyarrow, imported on first use rather than with the app; None when it is not installed"""
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+    except ImportError:  # Fall back to pickled frames when pyarrow is not installed
+        return None
+    return pa
+
+
+# Part of every key; bump it when parsing changes what an entry holds, so older entries are not reused
+FORMAT_VERSION = 4
+
+
+def file_digest(file_path, block_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def rules_digest(categories):
+    """Short digest of an ordered {category: [keywords]} dict"""
+    signature = tuple((category, tuple(keywords)) for category, keywords in categories.items())
+    return hashlib.sha256(repr(signature).encode("utf-8")).hexdigest()[:16]
+
+
+class UploadCache:
+    """On-disk cache of parsed, categorized uploads keyed by content hash
+
+    Entries are Arrow IPC (Feather v2) files read through a memory map, so
+    loading a cached upload only touches the columns that are asked for.
+    Without pyarrow, entries are stored as pickled DataFrames instead.
+    """
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024, max_age=7 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def extension(self):
+        return ".arrow" if _arrow() is not None else ".pkl"
+
+    def key_for(self, file_path, categories):
+        """Cache key for a file parsed and categorized with the given rules"""
+        return f"{file_digest(file_path)}-{rules_digest(categories)}-v{FORMAT_VERSION}"
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key + self.extension)
+
+    def has(self, key):
+        return bool(key) and os.path.exists(self.path_for(key))
+
+    def load(self, key, columns=None):
+        """Return the cached frame for key, or None on a miss"""
+        if not key:
+            return None
+        path = self.path_for(key)
+        pa = _arrow()
+        try:
+            os.utime(path)  # Mark as recently used for eviction
+            if pa is None:
+                import pandas as pd
+
+                df = pd.read_pickle(path)
+                return df[columns] if columns else df
+            source = pa.memory_map(path, "r")
+        except FileNotFoundError:  # Never cached, or evicted by another worker
+            return None
+        with source:
+            table = pa.ipc.open_file(source).read_all()
+            if columns:
+                table = table.select([c for c in columns if c in table.column_names])
+            return table.to_pandas()
+
+    def iter_frames(self, key, columns=None):
+        """Yield the cached entry for key one record batch at a time
+
+        Raises FileNotFoundError on a miss, before the first batch; once the
+        entry is open, evicting it no longer affects the iteration.
+        """
+        path = self.path_for(key)
+        os.utime(path)
+        pa = _arrow()
+        if pa is None:
+            df = self.load(key, columns)
+            if df is None:
+                raise FileNotFoundError(path)
+            yield df
+            return
+        with pa.memory_map(path, "r") as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                if columns:
+                    batch = batch.select([c for c in columns if c in batch.schema.names])
+                yield batch.to_pandas()
+
+    def open_frames(self, key, columns=None):
+        """iter_frames() with the entry opened right away: None on a miss"""
+        if not key:
+            return None
+        frames = self.iter_frames(key, columns)
+        try:
+            first = next(frames)
+        except FileNotFoundError:  # Never cached, or evicted by another worker
+            return None
+        except StopIteration:
+            return iter(())
+        return itertools.chain([first], frames)
+
+    def discard(self, key):
+        self._remove(self.path_for(key))
+
+    def store(self, key, df):
+        """Cache a whole frame under key"""
+        with self.writer(key) as write:
+            write(df)
+
+    @contextmanager
+    def writer(self, key):
+        """Context manager yielding write(chunk) for building an entry chunk by chunk
+
+        The entry only becomes visible when the block exits without an error.
+        """
+        path = self.path_for(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        chunks = []
+        state = {"writer": None, "schema": None}
+        pa = _arrow()
+
+        def write(chunk):
+            chunk = chunk.reset_index(drop=True)
+            if "description" in chunk.columns:
+                chunk["description"] = chunk["description"].astype("string")
+            if pa is None:
+                chunks.append(chunk)
+                return
+            if state["writer"] is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                state["schema"] = table.schema
+                state["writer"] = pa.ipc.new_file(tmp_path, table.schema)
+            else:
+                table = pa.Table.from_pandas(chunk, schema=state["schema"], preserve_index=False)
+            state["writer"].write_table(table)
+
+        try:
+            yield write
+            if pa is None:
+                import pandas as pd
+
+                frame = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+                frame.to_pickle(tmp_path)
+            elif state["writer"] is not None:
+                state["writer"].close()
+                state["writer"] = None
+            if os.path.exists(tmp_path):
+                os.replace(tmp_path, path)
+        finally:
+            if state["writer"] is not None:
+                state["writer"].close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+
+    def evict(self):
+        """Drop entries older than max_age, then least recently used ones above max_bytes"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith((".arrow", ".pkl")):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                self._remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:  # Already evicted by another worker
+            pass